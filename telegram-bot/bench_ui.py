@@ -0,0 +1,108 @@
+"""
+Микробенчмарк каталога ui: python bench_ui.py
+
+Сравнивает прежнюю сборку клавиатур и валидацию внутри main() (копия
+ниже) с готовыми объектами из ui.py на типичной смеси апдейтов
+регистрации и печатает время CPU на апдейт.
+"""
+import re
+import timeit
+from datetime import datetime
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+import ui
+
+
+# ===== КАК БЫЛО: сборка на каждый вызов =====
+def legacy_work_type_keyboard(selected_works=None):
+    if selected_works is None:
+        selected_works = []
+    keyboard = []
+    for work in ["Хелпер", "Грузчик", "Монтажник"]:
+        status = "✅" if work in selected_works else "❌"
+        keyboard.append([InlineKeyboardButton(text=f"{status} {work}", callback_data=f"toggle_{work}")])
+    keyboard.append([InlineKeyboardButton(text="Подтвердить выбор", callback_data="confirm_works")])
+    keyboard.append([InlineKeyboardButton(text="Назад", callback_data="back"),
+                     InlineKeyboardButton(text="Отмена", callback_data="cancel")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def legacy_main_menu_keyboard():
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="Мой профиль", callback_data="profile")],
+            [InlineKeyboardButton(text="Завершить регистрацию", callback_data="complete_reg")],
+            [InlineKeyboardButton(text="Активные заявки", callback_data="active_orders")]
+        ]
+    )
+
+
+def legacy_navigation_keyboard(show_back=True, show_cancel=True):
+    buttons = []
+    if show_back:
+        buttons.append(InlineKeyboardButton(text="Назад", callback_data="back"))
+    if show_cancel:
+        buttons.append(InlineKeyboardButton(text="Отмена", callback_data="cancel"))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+
+def legacy_validate_phone(phone):
+    phone_clean = re.sub(r'[^\d+]', '', phone.strip())
+    if phone_clean.startswith('8'):
+        phone_clean = '+7' + phone_clean[1:]
+    return bool(re.match(r'^\+7\d{10}$', phone_clean))
+
+
+def legacy_format_phone(phone):
+    phone_clean = re.sub(r'[^\d+]', '', phone.strip())
+    if phone_clean.startswith('8'):
+        phone_clean = '+7' + phone_clean[1:]
+    return phone_clean
+
+
+def legacy_validate_date(date_str):
+    try:
+        datetime.strptime(date_str.strip(), '%d.%m.%Y')
+        return True
+    except ValueError:
+        return False
+
+
+# ===== СМЕСЬ АПДЕЙТОВ =====
+SELECTIONS = [[], ["Хелпер"], ["Хелпер", "Грузчик"], ["Грузчик"], ["Грузчик", "Монтажник"]]
+
+
+def legacy_updates():
+    legacy_navigation_keyboard(show_back=True, show_cancel=True)
+    if legacy_validate_phone("8 (999) 123-45-67"):
+        legacy_format_phone("8 (999) 123-45-67")
+    for selected in SELECTIONS:
+        legacy_work_type_keyboard(selected)
+    legacy_validate_date("01.02.1990")
+    legacy_main_menu_keyboard()
+
+
+def catalog_updates():
+    ui.get_navigation_keyboard(show_back=True, show_cancel=True)
+    ui.normalize_phone("8 (999) 123-45-67")
+    for selected in SELECTIONS:
+        ui.get_work_type_keyboard(selected)
+    ui.validate_date("01.02.1990")
+    ui.MAIN_MENU_KEYBOARD
+
+
+UPDATES_PER_ROUND = 3 + len(SELECTIONS) + 1
+
+
+def bench(func, number=2000):
+    best = min(timeit.repeat(func, number=number, repeat=5))
+    return best / number / UPDATES_PER_ROUND * 1e6
+
+
+if __name__ == "__main__":
+    legacy = bench(legacy_updates)
+    catalog = bench(catalog_updates)
+    print(f"Было:   {legacy:8.2f} мкс/апдейт")
+    print(f"Стало:  {catalog:8.2f} мкс/апдейт")
+    print(f"Экономия: {legacy - catalog:.2f} мкс/апдейт (x{legacy / catalog:.1f})")
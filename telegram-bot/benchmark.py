@@ -0,0 +1,468 @@
+"""
+Нагрузочный тест бота без Telegram: python benchmark.py --dsn postgresql://...
+
+Собирает настоящий диспетчер из bot.py (create_dispatcher) поверх
+локального Postgres и подставной сессии Bot API, которая только
+записывает вызовы. Виртуальные пользователи проходят основную и полную
+регистрацию, открывают профиль и ленту заявок, откликаются; админы
+создают заявки, смотрят /stats и выгружают /users. Апдейты одного
+пользователя идут по порядку, разные - параллельно (как в UpdateProcessor).
+
+Печатает апдейты в секунду и p50/p95/p99 по обработчикам. --save
+записывает результат как базовый, --compare сравнивает с ним и
+завершается с кодом 1 при деградации больше --tolerance.
+
+--contention N: N исполнителей одновременно откликаются на заявку с
+--capacity местами (--rounds раз). Проверяет, что мест занято ровно
+capacity, и завершается с кодом 1 при перебронировании.
+
+База должна быть отдельной: миграции применяются, записи теста
+(telegram_id от BENCH_USER_BASE) удаляются до и после прогона.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+# До импорта config: свои админы и без антиспама, иначе замеряем отбрасывание апдейтов
+BENCH_BOT_ID = 123456
+BENCH_USER_BASE = 7_000_000_000
+BENCH_ADMIN_IDS = [BENCH_USER_BASE - 1000 + i for i in range(10)]
+os.environ['BOT_TOKEN'] = f'{BENCH_BOT_ID}:BENCHMARK'
+os.environ['ADMIN_IDS'] = ','.join(map(str, BENCH_ADMIN_IDS))
+os.environ.setdefault('THROTTLE_RATE', '1000000')
+os.environ.setdefault('THROTTLE_BURST', '1000000')
+# Номера апдейтов в каждом прогоне начинаются с 1: отметки в базе от прошлого прогона отсекли бы их
+os.environ['UPDATE_DEDUP_DB'] = '0'
+# Выборочные трассы забивают вывод отчета; медленные апдейты пишутся все равно
+os.environ.setdefault('TRACE_SAMPLE_RATE', '0')
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import AnswerCallbackQuery, SendDocument, SendMessage
+from aiogram.types import Message, Update
+
+from bot import create_dispatcher
+from config import UPDATE_WORKERS
+from database import Database
+from migrate import migrate
+from sender import OutboundDispatcher
+
+# Строка лога на каждый апдейт забивает вывод отчета
+logging.getLogger('aiogram.event').setLevel(logging.WARNING)
+
+
+# ===== ПОДСТАВНОЙ BOT API =====
+class FakeSession(BaseSession):
+    """Сессия без сети: считает вызовы и отвечает правдоподобными объектами"""
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = Counter()
+        self.answers = Counter()
+        self._message_ids = itertools.count(1_000_000)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        if isinstance(method, AnswerCallbackQuery):
+            self.answers[method.text] += 1
+        if isinstance(method, SendDocument):
+            # Файл вычитывается так же, как его отдавала бы настоящая сессия
+            async for _ in method.document.read(bot):
+                pass
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, (SendMessage, SendDocument)):
+            return Message.model_validate({
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': method.chat_id, 'type': 'private'},
+                'text': getattr(method, 'text', None),
+            }, context={'bot': bot})
+        # answerCallbackQuery, editMessageText, editMessageReplyMarkup
+        return True
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+
+# ===== ЗАМЕРЫ =====
+class HandlerTimer(BaseMiddleware):
+    """Внутренний middleware: время каждого вызова обработчика по имени"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    async def __call__(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.samples[name].append(time.perf_counter() - start)
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(samples) -> dict:
+    result = {}
+    for name, values in sorted(samples.items()):
+        values = sorted(values)
+        result[name] = {
+            'count': len(values),
+            'p50': percentile(values, 0.50) * 1000,
+            'p95': percentile(values, 0.95) * 1000,
+            'p99': percentile(values, 0.99) * 1000,
+        }
+    return result
+
+
+# ===== ВИРТУАЛЬНЫЕ ПОЛЬЗОВАТЕЛИ =====
+_update_ids = itertools.count(1)
+
+
+class VirtualUser:
+    def __init__(self, bot: Bot, user_id: int):
+        self.bot = bot
+        self.user = {'id': user_id, 'is_bot': False, 'first_name': 'Bench', 'username': f'bench{user_id}'}
+        self.chat = {'id': user_id, 'type': 'private'}
+        self.message_id = 0
+
+    def message(self, text: str) -> Update:
+        self.message_id += 1
+        return Update.model_validate({
+            'update_id': next(_update_ids),
+            'message': {
+                'message_id': self.message_id, 'date': int(time.time()),
+                'chat': self.chat, 'from': self.user, 'text': text,
+            },
+        }, context={'bot': self.bot})
+
+    def callback(self, data: str) -> Update:
+        # Кнопка под последним сообщением бота в чате
+        return Update.model_validate({
+            'update_id': next(_update_ids),
+            'callback_query': {
+                'id': str(next(_update_ids)), 'from': self.user, 'chat_instance': str(self.user['id']),
+                'data': data,
+                'message': {
+                    'message_id': self.message_id, 'date': int(time.time()), 'chat': self.chat, 'text': '...',
+                },
+            },
+        }, context={'bot': self.bot})
+
+
+def worker_script(user: VirtualUser, index: int, order_ids: list):
+    """Основная и полная регистрация, профиль, лента и отклик"""
+    yield user.message('/start')
+    yield user.message('Иванов Иван Иванович')
+    yield user.message(f'8999{index:07d}')
+    yield user.callback('agree')
+    yield user.callback('agree')
+    yield user.callback('toggle_Грузчик')
+    yield user.callback('toggle_Хелпер')
+    yield user.callback('confirm_works')
+    yield user.callback('complete_reg')
+    yield user.callback('set_birth_date')
+    yield user.message('01.02.1990')
+    yield user.callback('set_inn')
+    yield user.message(f'{index:012d}')
+    yield user.callback('set_account')
+    yield user.message(f'{index:020d}')
+    yield user.callback('set_passport')
+    yield user.message(f'{index:010d}')
+    yield user.callback('profile')
+    yield user.callback('active_orders')
+    if order_ids:
+        yield user.callback(f'respond:{random.choice(order_ids)}')
+
+
+def order_script(user: VirtualUser, index: int):
+    yield user.message('/admin')
+    yield user.message('/add_order')
+    yield user.message(f'Тестовая заявка {index}: разгрузка фуры, 4 часа')
+    # Половина заявок с ограничением мест: отклики идут и через буфер, и через order_slots
+    yield user.message('0' if index % 2 else '50')
+    yield user.callback('order_toggle_Грузчик')
+    yield user.callback('order_confirm')
+
+
+def report_script(user: VirtualUser, index: int):
+    yield user.message('/stats')
+    if index % 5 == 0:
+        yield user.message('/users stage=9')
+
+
+# ===== ПРОГОН =====
+class Runner:
+    def __init__(self, dp, bot: Bot, concurrency: int):
+        self.dp = dp
+        self.bot = bot
+        self.slots = asyncio.Semaphore(concurrency)
+        self.latencies = []
+        self.errors = Counter()
+
+    async def play(self, updates):
+        async with self.slots:
+            for update in updates:
+                start = time.perf_counter()
+                try:
+                    await self.dp.feed_update(self.bot, update)
+                except Exception as e:
+                    self.errors[type(e).__name__] += 1
+                    if sum(self.errors.values()) <= 3:
+                        print(f"❌ Апдейт {update.update_id}: {e!r}")
+                self.latencies.append(time.perf_counter() - start)
+
+    async def run(self, scripts):
+        await asyncio.gather(*(self.play(script) for script in scripts))
+
+
+async def cleanup(db: Database):
+    admins = BENCH_ADMIN_IDS
+    await db.execute(
+        "DELETE FROM order_slots WHERE user_id >= %s "
+        "OR order_id IN (SELECT id FROM orders WHERE admin_id = ANY(%s))",
+        (BENCH_USER_BASE, admins)
+    )
+    await db.execute(
+        "DELETE FROM order_responses WHERE user_id >= %s "
+        "OR order_id IN (SELECT id FROM orders WHERE admin_id = ANY(%s))",
+        (BENCH_USER_BASE, admins)
+    )
+    await db.execute(
+        "DELETE FROM broadcast_queue WHERE order_id IN (SELECT id FROM orders WHERE admin_id = ANY(%s))", (admins,)
+    )
+    await db.execute("DELETE FROM order_digests WHERE admin_id = ANY(%s)", (admins,))
+    await db.execute("DELETE FROM orders WHERE admin_id = ANY(%s)", (admins,))
+    await db.execute("DELETE FROM users WHERE telegram_id >= %s", (BENCH_USER_BASE,))
+    await db.execute("DELETE FROM fsm_states WHERE key LIKE %s", (f'fsm:{BENCH_BOT_ID}:%',))
+
+
+async def setup(args):
+    await migrate(args.dsn)
+    db = Database(dsn=args.dsn)
+    await db.connect()
+    await cleanup(db)
+
+    session = FakeSession(latency=args.api_latency)
+    bot = Bot(token=os.environ['BOT_TOKEN'], session=session)
+    # Лимиты Telegram сняты: меряем сам бот, а не ожидание в очереди отправки
+    outbound = OutboundDispatcher(rate=1e9, chat_rate=1e9, chat_burst=1e9)
+    bot.session.middleware(outbound)
+    dp = create_dispatcher(bot, db, outbound)
+    timer = HandlerTimer()
+    dp.message.middleware(timer)
+    dp.callback_query.middleware(timer)
+    return db, session, bot, outbound, dp, timer
+
+
+async def benchmark(args) -> dict:
+    db, session, bot, outbound, dp, timer = await setup(args)
+    responses, digest = dp['responses'], dp['digest']
+    responses.start()
+    digest.start()
+
+    runner = Runner(dp, bot, args.concurrency)
+    admins = [VirtualUser(bot, admin_id) for admin_id in BENCH_ADMIN_IDS[:args.admins]]
+    workers = [VirtualUser(bot, BENCH_USER_BASE + i) for i in range(args.users)]
+    started = time.perf_counter()
+    try:
+        # Заявки одного админа создаются по очереди: у него одно состояние FSM
+        await runner.run(
+            itertools.chain.from_iterable(order_script(admin, i) for i in range(j, args.orders, len(admins)))
+            for j, admin in enumerate(admins)
+        )
+        rows = await db.fetchall(
+            "SELECT id FROM orders WHERE admin_id = ANY(%s) AND status = 'active'", (BENCH_ADMIN_IDS,)
+        )
+        order_ids = [row['id'] for row in rows]
+
+        scripts = [worker_script(user, i, order_ids) for i, user in enumerate(workers)]
+        reports = [report_script(admins[i % len(admins)], i) for i in range(args.reports)]
+        # Отчеты админов равномерно вперемешку с пользователями
+        step = max(1, len(scripts) // max(1, len(reports)))
+        for i, script in enumerate(reports):
+            scripts.insert(min(len(scripts), (i + 1) * step + i), script)
+        await runner.run(scripts)
+        elapsed = time.perf_counter() - started
+    finally:
+        await responses.stop()
+        # Сводки админам по откликам прогона уходят одной пачкой при остановке
+        await digest.stop()
+        await dp.storage.close()
+        await outbound.close()
+        if not args.keep:
+            await cleanup(db)
+        await db.close()
+
+    return {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'users': args.users, 'admins': args.admins, 'orders': args.orders, 'reports': args.reports,
+            'concurrency': args.concurrency, 'api_latency': args.api_latency,
+        },
+        'updates': len(runner.latencies),
+        'updates_per_sec': len(runner.latencies) / elapsed,
+        'errors': dict(runner.errors),
+        'api_calls': dict(session.calls),
+        'handlers': summarize({**timer.samples, '* feed_update': runner.latencies}),
+    }
+
+
+async def contention(args) -> dict:
+    db, session, bot, outbound, dp, timer = await setup(args)
+    users = [VirtualUser(bot, BENCH_USER_BASE + i) for i in range(args.contention)]
+    await db.executemany(
+        "INSERT INTO users (telegram_id, full_name, registration_stage, is_active) VALUES (%s, %s, 9, TRUE)",
+        [(user.user['id'], 'Иванов Иван Иванович') for user in users]
+    )
+    # Все пользователи нажимают одновременно: ограничение параллельности снято
+    runner = Runner(dp, bot, len(users))
+    overbooked = []
+    started = time.perf_counter()
+    try:
+        for _ in range(args.rounds):
+            order_id = await db.create_order('Конкурентный тест', BENCH_ADMIN_IDS[0], ['Грузчик'], args.capacity)
+            await runner.run([user.callback(f'respond:{order_id}')] for user in users)
+            # Мимо шлюза процесса: все отклики сразу в базу, как из многих процессов
+            raw_order_id = await db.create_order('Конкурентный тест', BENCH_ADMIN_IDS[0], ['Грузчик'], args.capacity)
+            await asyncio.gather(*(db._claim_order_slot(raw_order_id, user.user['id']) for user in users))
+
+            for checked_id in (order_id, raw_order_id):
+                row = await db.fetchone(
+                    '''SELECT
+                        (SELECT COUNT(*) FROM order_slots WHERE order_id = %s AND user_id IS NOT NULL) AS slots,
+                        (SELECT COUNT(*) FROM order_responses WHERE order_id = %s) AS responses''',
+                    (checked_id, checked_id)
+                )
+                if row['slots'] != min(args.capacity, len(users)) or row['responses'] != row['slots']:
+                    overbooked.append((checked_id, row['slots'], row['responses']))
+        elapsed = time.perf_counter() - started
+    finally:
+        await dp.storage.close()
+        await outbound.close()
+        if not args.keep:
+            await cleanup(db)
+        await db.close()
+
+    return {
+        'updates': len(runner.latencies),
+        'updates_per_sec': len(runner.latencies) / elapsed,
+        'errors': dict(runner.errors),
+        'answers': dict(session.answers),
+        'overbooked': overbooked,
+        'handlers': summarize({**timer.samples, '* feed_update': runner.latencies}),
+    }
+
+
+# ===== ОТЧЕТ =====
+def print_report(result: dict, baseline: dict = None):
+    def delta(current, previous):
+        return f"{(current - previous) / previous * 100:+6.1f}%" if previous else ''
+
+    base_handlers = (baseline or {}).get('handlers', {})
+    print(f"\n📈 {result['updates']} апдейтов, {result['updates_per_sec']:.0f} апд/с", end='')
+    if baseline:
+        print(f" ({delta(result['updates_per_sec'], baseline['updates_per_sec'])} к базовому)", end='')
+    print()
+    print(f"\n{'обработчик':<28}{'вызовов':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for name, row in result['handlers'].items():
+        line = f"{name:<28}{row['count']:>8}{row['p50']:>10.2f}{row['p95']:>10.2f}{row['p99']:>10.2f}"
+        if name in base_handlers:
+            line += f"   p95 {delta(row['p95'], base_handlers[name]['p95'])}"
+        print(line)
+    print("\nВызовы Bot API: " + ', '.join(f"{name} {count}" for name, count in sorted(result['api_calls'].items())))
+    if result['errors']:
+        print("❌ Ошибки: " + ', '.join(f"{name} {count}" for name, count in result['errors'].items()))
+
+
+def find_regressions(result: dict, baseline: dict, tolerance: float, min_delta: float) -> list:
+    problems = []
+    if result['updates_per_sec'] < baseline['updates_per_sec'] * (1 - tolerance):
+        problems.append(f"пропускная способность {result['updates_per_sec']:.0f} < {baseline['updates_per_sec']:.0f} апд/с")
+    for name, row in result['handlers'].items():
+        previous = baseline['handlers'].get(name)
+        # Доли миллисекунды на быстрых обработчиках - шум, а не деградация
+        if previous and row['p95'] > max(previous['p95'] * (1 + tolerance), previous['p95'] + min_delta):
+            problems.append(f"{name}: p95 {row['p95']:.2f} > {previous['p95']:.2f} мс")
+    return problems
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dsn', default=os.getenv('BENCH_DATABASE_URL'),
+                        help='отдельная база для теста (или BENCH_DATABASE_URL)')
+    parser.add_argument('--users', type=int, default=1000, help='виртуальных исполнителей')
+    parser.add_argument('--admins', type=int, default=3, choices=range(1, len(BENCH_ADMIN_IDS) + 1))
+    parser.add_argument('--orders', type=int, default=20, help='заявок, создаваемых до прогона')
+    parser.add_argument('--reports', type=int, default=20, help='запросов /stats (каждый пятый с /users)')
+    parser.add_argument('--concurrency', type=int, default=UPDATE_WORKERS, help='параллельных пользователей')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='задержка ответа Bot API, секунд')
+    parser.add_argument('--save', metavar='FILE', help='сохранить результат как базовый')
+    parser.add_argument('--compare', metavar='FILE', help='сравнить с базовым результатом')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимая деградация (0.2 = 20%%)')
+    parser.add_argument('--min-delta', type=float, default=1.0, help='игнорировать рост p95 меньше N мс')
+    parser.add_argument('--contention', type=int, metavar='N', help='N одновременных откликов на одну заявку')
+    parser.add_argument('--capacity', type=int, default=3, help='мест в заявке для --contention')
+    parser.add_argument('--rounds', type=int, default=5, help='заявок для --contention')
+    parser.add_argument('--keep', action='store_true', help='не удалять записи теста после прогона')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.dsn:
+        sys.exit("Укажите отдельную базу: --dsn или BENCH_DATABASE_URL (тест пишет и удаляет данные)")
+
+    if args.contention:
+        result = asyncio.run(contention(args))
+        print_report({**result, 'api_calls': {}}, None)
+        # Номера заявок и мест в ответах не важны: считаем ответы по виду
+        answers = Counter()
+        for text, count in result['answers'].items():
+            answers[re.sub(r'\d+', 'N', text)] += count
+        print("\nОтветы: " + ', '.join(f"{text!r} {count}" for text, count in answers.items()))
+        if result['overbooked']:
+            print("\n❌ Перебронирование (заявка, мест занято, откликов): " + str(result['overbooked']))
+            sys.exit(1)
+        print(f"\n✅ Перебронирования нет: на каждую заявку занято ровно {min(args.capacity, args.contention)} мест")
+        return
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    result = asyncio.run(benchmark(args))
+    print_report(result, baseline)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ Базовый результат сохранен в {args.save}")
+
+    if baseline:
+        problems = find_regressions(result, baseline, args.tolerance, args.min_delta)
+        if problems:
+            print("\n❌ Деградация:\n  " + "\n  ".join(problems))
+            sys.exit(1)
+        print("\n✅ Деградации нет")
+
+
+if __name__ == "__main__":
+    main()
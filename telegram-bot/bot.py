@@ -1,86 +1,47 @@
 import asyncio
 import logging
-import re
-import os
+import signal
+import sys
+import tempfile
+import time
 from datetime import datetime
 from aiogram import Bot, Dispatcher, F
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.filters import Command
-import psycopg2
-from config import BOT_TOKEN, DATABASE_URL, ADMIN_IDS
-
-logging.basicConfig(level=logging.INFO)
-
-# ===== БАЗА ДАННЫХ =====
-class Database:
-    def __init__(self):
-        self.conn = None
-    
-    def connect(self):
-        try:
-            self.conn = psycopg2.connect(DATABASE_URL)
-            self.create_tables()
-            print("✅ База данных подключена и таблицы созданы!")
-        except Exception as e:
-            print(f"❌ Ошибка подключения к базе: {e}")
-    
-    def create_tables(self):
-        with self.conn.cursor() as cur:
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id SERIAL PRIMARY KEY,
-                    telegram_id BIGINT UNIQUE,
-                    username TEXT,
-                    full_name TEXT,
-                    phone TEXT,
-                    birth_date TEXT,
-                    inn TEXT,
-                    account_number TEXT,
-                    passport TEXT,
-                    work_type TEXT[],
-                    agreed_to_terms BOOLEAN DEFAULT FALSE,
-                    agreed_to_rules BOOLEAN DEFAULT FALSE,
-                    registration_stage INTEGER DEFAULT 1,
-                    is_active BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT NOW()
-                )
-            ''')
-            
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS orders (
-                    id SERIAL PRIMARY KEY,
-                    description TEXT NOT NULL,
-                    admin_id BIGINT,
-                    status TEXT DEFAULT 'active',
-                    created_at TIMESTAMP DEFAULT NOW()
-                )
-            ''')
-            
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS order_responses (
-                    id SERIAL PRIMARY KEY,
-                    order_id INTEGER REFERENCES orders(id),
-                    user_id BIGINT REFERENCES users(telegram_id),
-                    status TEXT DEFAULT 'responded',
-                    created_at TIMESTAMP DEFAULT NOW()
-                )
-            ''')
-            
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS admins (
-                    id SERIAL PRIMARY KEY,
-                    telegram_id BIGINT UNIQUE,
-                    username TEXT,
-                    full_name TEXT,
-                    role TEXT DEFAULT 'admin',
-                    created_at TIMESTAMP DEFAULT NOW()
-                )
-            ''')
-            
-            self.conn.commit()
+from aiogram.types import Message, CallbackQuery, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+from aiogram.filters import Command, CommandObject
+from aiohttp import web
+from config import (
+    BOT_TOKEN, ADMIN_IDS, BOT_MODE, ORDERS_PAGE_SIZE, METRICS_ENABLED, OUTBOUND_RATE, WORKER_PROCESSES,
+    SEARCH_INLINE_RESULTS, SEARCH_CACHE_TTL,
+    EXPORT_SPOOL_SIZE, IMPORT_MAX_SIZE, HEALTH_ENABLED, SHUTDOWN_TIMEOUT, UPDATE_DEDUP_DB, TRACE_ENABLED,
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+)
+from database import Database, normalize_search_query
+from storage import PostgresStorage
+from webhook import UpdateProcessor, poll_updates, setup_webhook_routes, start_http_server
+from cluster import run_cluster, serve_worker
+from health import Deadline, Health, install_signal_handlers, setup_health_routes, wait_for_stop
+from broadcast import Broadcaster, format_order_message
+from lifecycle import OrderLifecycle
+from sender import OutboundDispatcher
+import metrics
+from metrics import ApiMetricsMiddleware, HandlerMetricsMiddleware, setup_metrics_routes
+from responses import ResponseBuffer
+from digest import AdminDigest
+from tracing import ApiTracingMiddleware, HandlerSpanMiddleware, TracingMiddleware, setup_logging
+from middlewares import ThrottlingMiddleware, ToggleDebouncer, UpdateDeduplicator
+from export import SpooledInputFile, export_users_csv, parse_export_filters
+from importer import IMPORT_COLUMNS, format_import_report, parse_orders_csv
+from ui import (
+    MAIN_MENU_KEYBOARD, COMPLETE_REGISTRATION_KEYBOARD, TERMS_TEXT, TERMS_REQUIRED_TEXT, RULES_TEXT,
+    RULES_REQUIRED_TEXT, get_agreement_keyboard, get_navigation_keyboard, get_work_type_keyboard,
+    get_order_work_type_keyboard, get_orders_page_keyboard, get_respond_keyboard, validate_fio, normalize_phone, validate_date,
+    validate_inn, validate_account, validate_passport, parse_capacity, ORDER_CAPACITY_MAX, IMPORT_NOTIFY_KEYBOARD,
+)
+
+log_handler = setup_logging()
+logger = logging.getLogger(__name__)
 
 # ===== СОСТОЯНИЯ =====
 class Registration(StatesGroup):
@@ -96,113 +57,65 @@ class Registration(StatesGroup):
 
 class OrderStates(StatesGroup):
     waiting_for_description = State()
-
-# ===== ОСНОВНОЙ КОД =====
-async def main():
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
-    db = Database()
+    capacity = State()
+    work_types = State()
+
+class ImportStates(StatesGroup):
+    waiting_for_file = State()
+    confirm_notify = State()
+
+# ===== ДИСПЕТЧЕР =====
+def create_dispatcher(bot: Bot, db: Database, outbound: OutboundDispatcher) -> Dispatcher:
+    """
+    Диспетчер со всеми обработчиками. Фоновые службы лежат в dp['broadcaster'],
+    dp['responses'] и dp['digest'], запускает их вызывающий (main или benchmark.py).
+    """
+    dp = Dispatcher(storage=PostgresStorage(db))
+    broadcaster = Broadcaster(bot, db)
+    digest = AdminDigest(bot, db)
+    responses = ResponseBuffer(db, digest=digest)
+    toggles = ToggleDebouncer()
     
-    db.connect()
-
-    # ===== КЛАВИАТУРЫ =====
-    def get_agreement_keyboard(show_back=True):
-        buttons = []
-        if show_back:
-            buttons.append(InlineKeyboardButton(text="Назад", callback_data="back"))
-        buttons.extend([
-            InlineKeyboardButton(text="Согласен", callback_data="agree"),
-            InlineKeyboardButton(text="Не согласен", callback_data="disagree")
-        ])
-        return InlineKeyboardMarkup(inline_keyboard=[buttons])
-
-    def get_work_type_keyboard(selected_works=None):
-        if selected_works is None:
-            selected_works = []
-        
-        works = ["Хелпер", "Грузчик", "Монтажник"]
-        keyboard = []
-        
-        for work in works:
-            status = "✅" if work in selected_works else "❌"
-            keyboard.append([InlineKeyboardButton(
-                text=f"{status} {work}", 
-                callback_data=f"toggle_{work}"
-            )])
-        
-        keyboard.append([InlineKeyboardButton(text="Подтвердить выбор", callback_data="confirm_works")])
-        keyboard.append([InlineKeyboardButton(text="Назад", callback_data="back"), 
-                        InlineKeyboardButton(text="Отмена", callback_data="cancel")])
-        
-        return InlineKeyboardMarkup(inline_keyboard=keyboard)
-
-    def get_navigation_keyboard(show_back=True, show_cancel=True):
-        buttons = []
-        if show_back:
-            buttons.append(InlineKeyboardButton(text="Назад", callback_data="back"))
-        if show_cancel:
-            buttons.append(InlineKeyboardButton(text="Отмена", callback_data="cancel"))
-        return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
-
-    def get_main_menu_keyboard():
-        return InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="Мой профиль", callback_data="profile")],
-                [InlineKeyboardButton(text="Завершить регистрацию", callback_data="complete_reg")],
-                [InlineKeyboardButton(text="Активные заявки", callback_data="active_orders")]
-            ]
-        )
-
-    def get_complete_registration_keyboard():
-        return InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="Дата рождения", callback_data="set_birth_date")],
-                [InlineKeyboardButton(text="ИНН", callback_data="set_inn")],
-                [InlineKeyboardButton(text="Расчетный счет", callback_data="set_account")],
-                [InlineKeyboardButton(text="Паспорт", callback_data="set_passport")],
-                [InlineKeyboardButton(text="Главное меню", callback_data="main_menu")]
-            ]
-        )
-
-    # ===== ВАЛИДАТОРЫ =====
-    def validate_fio(fio):
-        fio_clean = fio.strip()
-        parts = fio_clean.split()
-        if len(parts) != 3:
-            return False
-        return all(len(part) >= 2 and part.isalpha() for part in parts)
-
-    def validate_phone(phone):
-        phone_clean = re.sub(r'[^\d+]', '', phone.strip())
-        if phone_clean.startswith('8'):
-            phone_clean = '+7' + phone_clean[1:]
-        return bool(re.match(r'^\+7\d{10}$', phone_clean))
-
-    def format_phone(phone):
-        phone_clean = re.sub(r'[^\d+]', '', phone.strip())
-        if phone_clean.startswith('8'):
-            phone_clean = '+7' + phone_clean[1:]
-        return phone_clean
-
-    def validate_date(date_str):
-        try:
-            date_clean = date_str.strip()
-            datetime.strptime(date_clean, '%d.%m.%Y')
-            return True
-        except ValueError:
-            return False
-
-    def validate_inn(inn):
-        inn_clean = inn.strip()
-        return inn_clean.isdigit() and len(inn_clean) == 12
-
-    def validate_account(account):
-        account_clean = account.strip()
-        return account_clean.isdigit() and len(account_clean) == 20
-
-    def validate_passport(passport):
-        passport_clean = passport.strip()
-        return passport_clean.isdigit() and len(passport_clean) == 10
+    # Трасса открывается первой и охватывает все остальные middleware
+    if TRACE_ENABLED:
+        tracer = TracingMiddleware()
+        dp.update.outer_middleware(tracer)
+        dp.message.middleware(HandlerSpanMiddleware())
+        dp.callback_query.middleware(HandlerSpanMiddleware())
+        dp.inline_query.middleware(HandlerSpanMiddleware())
+        metrics.register_gauge('bot_slow_updates', 'Апдейты дольше TRACE_SLOW_THRESHOLD', lambda: tracer.slow)
+    # Повторы отсекаются раньше всего остального, в том числе антиспама
+    dedup = UpdateDeduplicator(db if UPDATE_DEDUP_DB else None)
+    dp.update.outer_middleware(dedup)
+    throttling = ThrottlingMiddleware()
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
+    # Инлайн-запросы не режем: клиент шлет запрос на каждую букву, и отброшенным мог оказаться последний.
+    # Их частоту и так ограничивают Telegram и cache_time, а одинаковые запросы отвечаются из кэша поиска
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    dp.inline_query.middleware(HandlerMetricsMiddleware())
+    
+    metrics.register_gauge(
+        'bot_outbound_queue_depth', 'Запросы к Bot API в очереди',
+        lambda: dict(zip([('interactive',), ('bulk',)], outbound.depth)), labels=('lane',)
+    )
+    metrics.register_gauge('bot_throttled_updates', 'Апдейты, отброшенные ограничителем частоты', lambda: throttling.dropped)
+    metrics.register_gauge('bot_duplicate_updates', 'Повторно доставленные апдейты, пропущенные без обработки', lambda: dedup.skipped)
+    metrics.register_gauge(
+        'bot_db_replica_up', 'Реплика принимает чтения',
+        lambda: {(replica.index,): int(replica.down_until <= time.monotonic()) for replica in db.replicas},
+        labels=('replica',)
+    )
+    metrics.register_gauge('bot_user_cache_size', 'Записей в кэше пользователей', lambda: len(db.users))
+    metrics.register_gauge(
+        'bot_user_cache_requests', 'Обращения к кэшу пользователей',
+        lambda: {('hit',): db.users.hits, ('miss',): db.users.misses}, labels=('result',)
+    )
+    metrics.register_gauge(
+        'bot_search_cache_requests', 'Обращения к кэшу поиска заявок',
+        lambda: {('hit',): db.search_results.hits, ('miss',): db.search_results.misses}, labels=('result',)
+    )
 
     # ===== ПРОВЕРКА АДМИНА =====
     def is_admin(user_id):
@@ -212,7 +125,6 @@ async def main():
     @dp.callback_query(F.data == "back")
     async def back_handler(callback: CallbackQuery, state: FSMContext):
         current_state = await state.get_state()
-        user_data = await state.get_data()
         
         if current_state == Registration.phone.state:
             await callback.message.edit_text("Введите ваше ФИО (3 слова через пробел):")
@@ -223,13 +135,11 @@ async def main():
             await state.set_state(Registration.phone)
             
         elif current_state == Registration.rules.state:
-            terms_text = 'Я согласен с <a href="https://example.com/terms">условиями обработки данных</a>'
-            await callback.message.edit_text(terms_text, parse_mode='HTML', reply_markup=get_agreement_keyboard())
+            await callback.message.edit_text(TERMS_TEXT, parse_mode='HTML', reply_markup=get_agreement_keyboard())
             await state.set_state(Registration.terms)
             
         elif current_state == Registration.work_type.state:
-            rules_text = 'Я согласен с <a href="https://example.com/rules">правилами использования сервиса</a>'
-            await callback.message.edit_text(rules_text, parse_mode='HTML', reply_markup=get_agreement_keyboard(show_back=True))
+            await callback.message.edit_text(RULES_TEXT, parse_mode='HTML', reply_markup=get_agreement_keyboard(show_back=True))
             await state.set_state(Registration.rules)
             
         elif current_state == Registration.birth_date.state:
@@ -259,18 +169,16 @@ async def main():
     @dp.callback_query(F.data == "main_menu")
     async def main_menu_handler(callback: CallbackQuery, state: FSMContext):
         await state.clear()
-        await callback.message.edit_text("Главное меню:", reply_markup=get_main_menu_keyboard())
+        await callback.message.edit_text("Главное меню:", reply_markup=MAIN_MENU_KEYBOARD)
         await callback.answer()
 
     # ===== ОСНОВНАЯ РЕГИСТРАЦИЯ =====
     @dp.message(Command("start"))
     async def start_handler(message: Message, state: FSMContext):
-        with db.conn.cursor() as cur:
-            cur.execute("SELECT * FROM users WHERE telegram_id = %s", (message.from_user.id,))
-            user = cur.fetchone()
+        user = await db.get_user(message.from_user.id)
         
         if user:
-            await message.answer("Вы уже зарегистрированы!", reply_markup=get_main_menu_keyboard())
+            await message.answer("Вы уже зарегистрированы!", reply_markup=MAIN_MENU_KEYBOARD)
             return
         
         await message.answer(
@@ -296,13 +204,12 @@ async def main():
 
     @dp.message(Registration.phone)
     async def process_phone(message: Message, state: FSMContext):
-        if validate_phone(message.text):
-            formatted_phone = format_phone(message.text)
+        formatted_phone = normalize_phone(message.text)
+        if formatted_phone:
             await state.update_data(phone=formatted_phone)
             
-            terms_text = 'Я согласен с <a href="https://example.com/terms">условиями обработки данных</a>'
             await message.answer(
-                terms_text, 
+                TERMS_TEXT, 
                 parse_mode='HTML', 
                 reply_markup=get_agreement_keyboard(show_back=True)
             )
@@ -318,17 +225,15 @@ async def main():
         if callback.data == "agree":
             await callback.message.edit_text("Вы согласились на обработку данных")
             
-            rules_text = 'Я согласен с <a href="https://example.com/rules">правилами использования сервиса</a>'
             await callback.message.answer(
-                rules_text, 
+                RULES_TEXT, 
                 parse_mode='HTML', 
                 reply_markup=get_agreement_keyboard(show_back=True)
             )
             await state.set_state(Registration.rules)
         else:
-            terms_text = 'Для продолжения необходимо согласие. Я согласен с <a href="https://example.com/terms">условиями обработки данных</a>'
             await callback.message.edit_text(
-                terms_text, 
+                TERMS_REQUIRED_TEXT, 
                 parse_mode='HTML', 
                 reply_markup=get_agreement_keyboard(show_back=True)
             )
@@ -347,9 +252,8 @@ async def main():
             )
             await state.set_state(Registration.work_type)
         else:
-            rules_text = 'Для продолжения необходимо принять правила. Я согласен с <a href="https://example.com/rules">правилами использования сервиса</a>'
             await callback.message.edit_text(
-                rules_text, 
+                RULES_REQUIRED_TEXT, 
                 parse_mode='HTML', 
                 reply_markup=get_agreement_keyboard(show_back=True)
             )
@@ -358,20 +262,13 @@ async def main():
     @dp.callback_query(Registration.work_type, F.data.startswith("toggle_"))
     async def toggle_work_type(callback: CallbackQuery, state: FSMContext):
         work_type = callback.data.replace("toggle_", "")
-        user_data = await state.get_data()
-        selected_works = user_data.get('selected_works', [])
-        
-        if work_type in selected_works:
-            selected_works.remove(work_type)
-        else:
-            selected_works.append(work_type)
-        
-        await state.update_data(selected_works=selected_works)
-        await callback.message.edit_reply_markup(reply_markup=get_work_type_keyboard(selected_works))
+        # Серия быстрых нажатий превращается в одну запись FSM и одно редактирование
+        await toggles.toggle(callback, state, 'selected_works', work_type, get_work_type_keyboard)
         await callback.answer()
 
     @dp.callback_query(Registration.work_type, F.data == "confirm_works")
     async def confirm_works(callback: CallbackQuery, state: FSMContext):
+        await toggles.flush_message(callback.message, callback.from_user.id)
         user_data = await state.get_data()
         selected_works = user_data.get('selected_works', [])
         
@@ -379,19 +276,15 @@ async def main():
             await callback.answer("Выберите хотя бы один вид работ")
             return
         
-        with db.conn.cursor() as cur:
-            cur.execute(
-                '''INSERT INTO users (telegram_id, username, full_name, phone, work_type, agreed_to_terms, agreed_to_rules, registration_stage) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)''',
-                (callback.from_user.id, callback.from_user.username, user_data['fio'], user_data['phone'], selected_works, True, True, 5)
-            )
-            db.conn.commit()
+        await db.insert_user(
+            callback.from_user.id, callback.from_user.username, user_data['fio'], user_data['phone'], selected_works
+        )
         
         work_types_text = ", ".join(selected_works)
         await callback.message.edit_text(f"Вы выбрали: {work_types_text}")
         await callback.message.answer(
             "Основная регистрация завершена!", 
-            reply_markup=get_main_menu_keyboard()
+            reply_markup=MAIN_MENU_KEYBOARD
         )
         await state.clear()
         await callback.answer()
@@ -399,17 +292,15 @@ async def main():
     # ===== ПОЛНАЯ РЕГИСТРАЦИЯ =====
     @dp.callback_query(F.data == "complete_reg")
     async def complete_reg_handler(callback: CallbackQuery):
-        with db.conn.cursor() as cur:
-            cur.execute("SELECT registration_stage FROM users WHERE telegram_id = %s", (callback.from_user.id,))
-            result = cur.fetchone()
+        stage = await db.get_registration_stage(callback.from_user.id)
             
-        if not result or result[0] < 5:
+        if not stage or stage < 5:
             await callback.message.answer("Сначала завершите основную регистрацию")
             return
             
         await callback.message.edit_text(
             "Завершение регистрации. Выберите данные для заполнения:",
-            reply_markup=get_complete_registration_keyboard()
+            reply_markup=COMPLETE_REGISTRATION_KEYBOARD
         )
         await callback.answer()
 
@@ -425,16 +316,11 @@ async def main():
     @dp.message(Registration.birth_date)
     async def process_birth_date(message: Message, state: FSMContext):
         if validate_date(message.text):
-            with db.conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE users SET birth_date = %s, registration_stage = GREATEST(registration_stage, 6) WHERE telegram_id = %s",
-                    (message.text.strip(), message.from_user.id)
-                )
-                db.conn.commit()
+            await db.update_field(message.from_user.id, 'birth_date', message.text.strip(), stage=6)
             
             await message.answer(
                 "✅ Дата рождения сохранена!",
-                reply_markup=get_complete_registration_keyboard()
+                reply_markup=COMPLETE_REGISTRATION_KEYBOARD
             )
             await state.clear()
         else:
@@ -455,16 +341,11 @@ async def main():
     @dp.message(Registration.inn)
     async def process_inn(message: Message, state: FSMContext):
         if validate_inn(message.text):
-            with db.conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE users SET inn = %s, registration_stage = GREATEST(registration_stage, 7) WHERE telegram_id = %s",
-                    (message.text.strip(), message.from_user.id)
-                )
-                db.conn.commit()
+            await db.update_field(message.from_user.id, 'inn', message.text.strip(), stage=7)
             
             await message.answer(
                 "✅ ИНН сохранен!",
-                reply_markup=get_complete_registration_keyboard()
+                reply_markup=COMPLETE_REGISTRATION_KEYBOARD
             )
             await state.clear()
         else:
@@ -485,16 +366,11 @@ async def main():
     @dp.message(Registration.account_number)
     async def process_account(message: Message, state: FSMContext):
         if validate_account(message.text):
-            with db.conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE users SET account_number = %s, registration_stage = GREATEST(registration_stage, 8) WHERE telegram_id = %s",
-                    (message.text.strip(), message.from_user.id)
-                )
-                db.conn.commit()
+            await db.update_field(message.from_user.id, 'account_number', message.text.strip(), stage=8)
             
             await message.answer(
                 "✅ Расчетный счет сохранен!",
-                reply_markup=get_complete_registration_keyboard()
+                reply_markup=COMPLETE_REGISTRATION_KEYBOARD
             )
             await state.clear()
         else:
@@ -517,16 +393,11 @@ async def main():
         passport = message.text.strip()
         
         if validate_passport(passport):
-            with db.conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE users SET passport = %s, registration_stage = 9, is_active = TRUE WHERE telegram_id = %s",
-                    (passport, message.from_user.id)
-                )
-                db.conn.commit()
+            await db.update_field(message.from_user.id, 'passport', passport, stage=9, activate=True)
             
             await message.answer(
                 "🎉 Полная регистрация завершена! Ваш аккаунт активирован.",
-                reply_markup=get_main_menu_keyboard()
+                reply_markup=MAIN_MENU_KEYBOARD
             )
             await state.clear()
         else:
@@ -538,48 +409,144 @@ async def main():
     # ===== ЛИЧНЫЙ КАБИНЕТ =====
     @dp.callback_query(F.data == "profile")
     async def profile_handler(callback: CallbackQuery):
-        with db.conn.cursor() as cur:
-            cur.execute("SELECT * FROM users WHERE telegram_id = %s", (callback.from_user.id,))
-            user = cur.fetchone()
+        user = await db.get_user(callback.from_user.id)
         
         if not user:
             await callback.message.answer("Вы не зарегистрированы. Используйте /start")
             return
         
         profile_text = "👤 Ваш профиль:\n\n"
-        profile_text += f"• ФИО: {user[3] or 'Не указано'}\n"
-        profile_text += f"• Телефон: {user[4] or 'Не указан'}\n"
-        profile_text += f"• Вид работы: {', '.join(user[9]) if user[9] else 'Не указан'}\n"
+        profile_text += f"• ФИО: {user.full_name or 'Не указано'}\n"
+        profile_text += f"• Телефон: {user.phone or 'Не указан'}\n"
+        profile_text += f"• Вид работы: {', '.join(user.work_type) if user.work_type else 'Не указан'}\n"
         
-        if user[5]: profile_text += f"• Дата рождения: {user[5]}\n"
-        if user[6]: profile_text += f"• ИНН: {user[6]}\n"
-        if user[7]: profile_text += f"• Расчетный счет: {user[7]}\n"
-        if user[8]: profile_text += f"• Паспорт: {user[8]}\n"
+        if user.birth_date: profile_text += f"• Дата рождения: {user.birth_date}\n"
+        if user.inn: profile_text += f"• ИНН: {user.inn}\n"
+        if user.account_number: profile_text += f"• Расчетный счет: {user.account_number}\n"
+        if user.passport: profile_text += f"• Паспорт: {user.passport}\n"
         
-        profile_text += f"• Статус: {'✅ Активен' if user[13] else '⏳ В процессе'}"
-        profile_text += f"\n• Этап регистрации: {user[12]}/9"
+        profile_text += f"• Статус: {'✅ Активен' if user.is_active else '⏳ В процессе'}"
+        profile_text += f"\n• Этап регистрации: {user.registration_stage}/9"
         
-        await callback.message.answer(profile_text, reply_markup=get_main_menu_keyboard())
+        await callback.message.answer(profile_text, reply_markup=MAIN_MENU_KEYBOARD)
         await callback.answer()
 
+    def format_orders_page(orders, title="📋 Активные заявки:"):
+        orders_text = f"{title}\n\n"
+        for order in orders:
+            orders_text += f"🔹 {order['description']}\n"
+            orders_text += f"   ID: {order['id']} | 📅 {order['created_at'].strftime('%d.%m.%Y')}\n\n"
+        return orders_text
+
     @dp.callback_query(F.data == "active_orders")
     async def active_orders_handler(callback: CallbackQuery):
-        with db.conn.cursor() as cur:
-            cur.execute("SELECT * FROM orders WHERE status = 'active' ORDER BY created_at DESC LIMIT 5")
-            orders = cur.fetchall()
+        orders, has_prev, has_next = await db.get_active_orders_page(limit=ORDERS_PAGE_SIZE)
         
         if not orders:
-            await callback.message.answer("📭 Активных заявок пока нет", reply_markup=get_main_menu_keyboard())
+            await callback.message.answer("📭 Активных заявок пока нет", reply_markup=MAIN_MENU_KEYBOARD)
+            await callback.answer()
             return
         
-        orders_text = "📋 Активные заявки:\n\n"
-        for order in orders:
-            orders_text += f"🔹 {order[1]}\n"
-            orders_text += f"   ID: {order[0]} | 📅 {order[4].strftime('%d.%m.%Y')}\n\n"
+        await callback.message.answer(
+            format_orders_page(orders),
+            reply_markup=get_orders_page_keyboard(orders, has_prev, has_next)
+        )
+        await callback.answer()
+
+    @dp.callback_query(F.data.startswith("orders:"))
+    async def orders_page_handler(callback: CallbackQuery):
+        _, direction, key = callback.data.split(":", 2)
+        created_at, order_id = key.rsplit(":", 1)
+        cursor = (datetime.fromisoformat(created_at), int(order_id))
+        orders, has_prev, has_next = await db.get_active_orders_page(
+            cursor, 'next' if direction == 'n' else 'prev', limit=ORDERS_PAGE_SIZE
+        )
         
-        await callback.message.answer(orders_text, reply_markup=get_main_menu_keyboard())
+        if not orders:
+            await callback.answer("Больше заявок нет")
+            return
+        
+        await callback.message.edit_text(
+            format_orders_page(orders),
+            reply_markup=get_orders_page_keyboard(orders, has_prev, has_next)
+        )
         await callback.answer()
 
+    # ===== ПОИСК ЗАЯВОК =====
+    @dp.message(Command("search"))
+    async def search_handler(message: Message, command: CommandObject):
+        if not command.args:
+            me = await message.bot.me()
+            await message.answer(
+                "🔎 Поиск по активным заявкам: /search <слова>\n"
+                "Например: /search грузчик склад\n\n"
+                f"Искать можно и в любом чате: наберите @{me.username} и слова"
+            )
+            return
+
+        orders, has_more = await db.search_orders(command.args, limit=ORDERS_PAGE_SIZE)
+        if not orders:
+            await message.answer("📭 По запросу ничего не найдено", reply_markup=MAIN_MENU_KEYBOARD)
+            return
+
+        text = format_orders_page(orders, f"🔎 Заявки по запросу «{normalize_search_query(command.args)}»:")
+        if has_more:
+            text += "Показаны самые новые, уточните запрос, чтобы увидеть остальные"
+        await message.answer(text, reply_markup=get_orders_page_keyboard(orders, False, False))
+
+    # Инлайн-режим включается в @BotFather (/setinline)
+    @dp.inline_query()
+    async def inline_search_handler(inline_query: InlineQuery):
+        offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+        orders, has_more = await db.search_orders(inline_query.query, limit=SEARCH_INLINE_RESULTS, offset=offset)
+        results = [
+            InlineQueryResultArticle(
+                id=str(order['id']),
+                title=f"Заявка #{order['id']} от {order['created_at'].strftime('%d.%m.%Y')}",
+                description=order['description'][:200],
+                input_message_content=InputTextMessageContent(
+                    message_text=format_order_message({**order, 'order_id': order['id']})
+                ),
+                reply_markup=get_respond_keyboard(order['id']),
+            )
+            for order in orders
+        ]
+        # Выдача одинакова для всех, Telegram может кэшировать ее у себя
+        await inline_query.answer(
+            results, cache_time=int(SEARCH_CACHE_TTL), is_personal=False,
+            next_offset=str(offset + len(orders)) if has_more else '',
+        )
+
+    @dp.callback_query(F.data.startswith("respond:"))
+    async def respond_handler(callback: CallbackQuery):
+        user = await db.get_user(callback.from_user.id)
+        if not user or not user.is_active:
+            await callback.answer("Откликаться могут только активированные исполнители", show_alert=True)
+            return
+        
+        order_id = int(callback.data.split(":", 1)[1])
+        capacity = await db.get_order_capacity(order_id)
+        if capacity is None:
+            # Заявка без ограничения мест: запись в базу уйдет пачкой, пользователю отвечаем сразу.
+            # Пачка молча пропустит закрытую заявку, поэтому ее отсекаем здесь
+            if not await db.is_order_active(order_id):
+                await callback.answer("Заявка закрыта")
+                return
+            responses.add(order_id, callback.from_user.id)
+            await callback.answer("✅ Отклик принят")
+            return
+        
+        result, slot = await db.claim_order_slot(order_id, callback.from_user.id, capacity)
+        if result == 'taken':
+            digest.add(order_id)
+            await callback.answer(f"✅ Вы записаны на заявку #{order_id}: место {slot} из {capacity}", show_alert=True)
+        elif result == 'already':
+            await callback.answer("Вы уже записаны на эту заявку")
+        elif result == 'closed':
+            await callback.answer("Заявка закрыта")
+        else:
+            await callback.answer("😔 Все места на эту заявку уже заняты")
+
     # ===== АДМИН-ПАНЕЛЬ (упрощенная) =====
     @dp.message(Command("admin"))
     async def admin_panel(message: Message):
@@ -590,15 +557,347 @@ async def main():
         admin_text = (
             "👨‍💼 Панель администратора:\n\n"
             "/add_order - Добавить заявку\n"
+            "/import_orders - Импорт заявок из CSV\n"
             "/stats - Статистика\n"
             "/users - Список пользователей"
         )
         await message.answer(admin_text)
 
+    @dp.message(Command("add_order"))
+    async def add_order_handler(message: Message, state: FSMContext):
+        if not is_admin(message.from_user.id):
+            await message.answer("❌ Доступ запрещен")
+            return
+        
+        await message.answer("Введите описание заявки:")
+        await state.set_state(OrderStates.waiting_for_description)
+
+    @dp.message(OrderStates.waiting_for_description)
+    async def process_order_description(message: Message, state: FSMContext):
+        description = (message.text or '').strip()
+        if not description:
+            await message.answer("Ошибка: описание не может быть пустым")
+            return
+        
+        await state.update_data(order_description=description, order_works=[])
+        await message.answer("Сколько исполнителей нужно? Введите число (0 - без ограничения):")
+        await state.set_state(OrderStates.capacity)
+
+    @dp.message(OrderStates.capacity)
+    async def process_order_capacity(message: Message, state: FSMContext):
+        capacity = parse_capacity(message.text or '')
+        if capacity is None:
+            await message.answer(f"Ошибка: введите число от 0 до {ORDER_CAPACITY_MAX}")
+            return
+        
+        await state.update_data(order_capacity=capacity or None)
+        await message.answer("Выберите виды работ для заявки:", reply_markup=get_order_work_type_keyboard())
+        await state.set_state(OrderStates.work_types)
+
+    @dp.callback_query(OrderStates.work_types, F.data.startswith("order_toggle_"))
+    async def toggle_order_work_type(callback: CallbackQuery, state: FSMContext):
+        work_type = callback.data.replace("order_toggle_", "")
+        await toggles.toggle(callback, state, 'order_works', work_type, get_order_work_type_keyboard)
+        await callback.answer()
+
+    @dp.callback_query(OrderStates.work_types, F.data == "order_confirm")
+    async def confirm_order(callback: CallbackQuery, state: FSMContext):
+        await toggles.flush_message(callback.message, callback.from_user.id)
+        user_data = await state.get_data()
+        selected_works = user_data.get('order_works', [])
+        
+        if not selected_works:
+            await callback.answer("Выберите хотя бы один вид работ")
+            return
+        
+        capacity = user_data.get('order_capacity')
+        order_id = await db.create_order(
+            user_data['order_description'], callback.from_user.id, selected_works, capacity
+        )
+        recipients = await db.enqueue_broadcast(order_id, selected_works)
+        broadcaster.notify()
+        
+        await callback.message.edit_text(
+            f"✅ Заявка #{order_id} создана\n"
+            f"Виды работ: {', '.join(selected_works)}\n"
+            f"Мест: {capacity or 'без ограничения'}\n"
+            f"Рассылка: {recipients} исполнителям"
+        )
+        await state.clear()
+        await callback.answer()
+
+    @dp.callback_query(OrderStates.work_types, F.data == "order_cancel")
+    async def cancel_order(callback: CallbackQuery, state: FSMContext):
+        await state.clear()
+        await callback.message.edit_text("Создание заявки отменено")
+        await callback.answer()
+
+    # ===== ИМПОРТ ЗАЯВОК =====
+    IMPORT_ERRORS_SHOWN = 20
+
+    @dp.message(Command("import_orders"))
+    async def import_orders_handler(message: Message, state: FSMContext):
+        if not is_admin(message.from_user.id):
+            await message.answer("❌ Доступ запрещен")
+            return
+        
+        await message.answer(
+            "Отправьте CSV-файл с заявками (UTF-8, разделитель , или ;).\n"
+            f"Колонки: {', '.join(IMPORT_COLUMNS)}\n"
+            "Обязательны description и work_types (через | если их несколько), "
+            "пустой capacity - без ограничения мест, пустой ttl_hours - срок по умолчанию.\n\n"
+            "Отмена: /cancel"
+        )
+        await state.set_state(ImportStates.waiting_for_file)
+
+    @dp.message(ImportStates.waiting_for_file, Command("cancel"))
+    async def import_cancel(message: Message, state: FSMContext):
+        await state.clear()
+        await message.answer("Импорт отменен")
+
+    @dp.message(ImportStates.waiting_for_file, F.document)
+    async def import_file_handler(message: Message, state: FSMContext):
+        document = message.document
+        if not (document.file_name or '').lower().endswith('.csv'):
+            await message.answer("❌ Нужен файл .csv")
+            return
+        if document.file_size and document.file_size > IMPORT_MAX_SIZE:
+            await message.answer(f"❌ Файл больше {IMPORT_MAX_SIZE // (1024 * 1024)} МБ")
+            return
+        
+        # Файл скачивается кусками во временный файл: до EXPORT_SPOOL_SIZE в памяти, дальше на диске
+        file = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE, mode='w+b')
+        try:
+            await bot.download(document, destination=file)
+            file.seek(0)
+            # Разбор десятков тысяч строк не должен держать event loop
+            rows, errors = await asyncio.to_thread(parse_orders_csv, file)
+        except ValueError as e:
+            await message.answer(f"❌ Не удалось прочитать файл: {e}")
+            return
+        finally:
+            file.close()
+        
+        order_ids = await db.import_orders(message.from_user.id, rows) if rows else []
+        
+        text = format_import_report(len(order_ids), errors, IMPORT_ERRORS_SHOWN)
+        if not order_ids:
+            await state.clear()
+            await message.answer(text)
+            return
+        
+        await state.set_state(ImportStates.confirm_notify)
+        await state.update_data(import_order_ids=order_ids)
+        await message.answer(text + "\n\nРазослать новые заявки исполнителям?", reply_markup=IMPORT_NOTIFY_KEYBOARD)
+
+    @dp.message(ImportStates.waiting_for_file)
+    async def import_wrong_input(message: Message):
+        await message.answer("Отправьте CSV-файл документом или /cancel")
+
+    @dp.callback_query(ImportStates.confirm_notify, F.data == "import_notify")
+    async def import_notify_handler(callback: CallbackQuery, state: FSMContext):
+        order_ids = (await state.get_data()).get('import_order_ids', [])
+        await state.clear()
+        recipients = await db.enqueue_broadcasts(order_ids)
+        broadcaster.notify()
+        await callback.message.edit_text(
+            f"{callback.message.text}\n\n📢 Рассылка: {recipients} сообщений по {len(order_ids)} заявкам"
+        )
+        await callback.answer()
+
+    @dp.callback_query(ImportStates.confirm_notify, F.data == "import_skip")
+    async def import_skip_handler(callback: CallbackQuery, state: FSMContext):
+        await state.clear()
+        await callback.message.edit_text(f"{callback.message.text}\n\nЗаявки созданы без рассылки")
+        await callback.answer()
+
+    STAGE_NAMES = {
+        5: "основная регистрация",
+        6: "дата рождения",
+        7: "ИНН",
+        8: "расчетный счет",
+        9: "полная регистрация",
+    }
+
+    @dp.message(Command("stats"))
+    async def stats_handler(message: Message):
+        if not is_admin(message.from_user.id):
+            await message.answer("❌ Доступ запрещен")
+            return
+        
+        totals, daily = await db.get_stats(days=7)
+        total = totals.get('users:total', 0)
+        active = totals.get('users:active', 0)
+        
+        stats_text = "📊 Статистика\n\n"
+        stats_text += f"👥 Пользователей: {total}\n"
+        stats_text += f"   ✅ Активных: {active}\n"
+        stats_text += f"   ⏳ В процессе: {total - active}\n\n"
+        
+        stats_text += "🪜 Воронка регистрации:\n"
+        stages = sorted(
+            (int(name.split(":")[1]), value) for name, value in totals.items() if name.startswith("stage:")
+        )
+        for stage, value in stages:
+            if value:
+                stats_text += f"   {stage}/9 {STAGE_NAMES.get(stage, '')}: {value}\n"
+        
+        stats_text += "\n📅 За 7 дней (заявки / отклики):\n"
+        by_day = {}
+        for row in daily:
+            by_day.setdefault(row['day'], {})[row['name']] = row['value']
+        for day, values in by_day.items():
+            stats_text += f"   {day.strftime('%d.%m')}: {values.get('orders', 0)} / {values.get('responses', 0)}\n"
+        if not by_day:
+            stats_text += "   нет данных\n"
+        
+        interactive, bulk = outbound.depth
+        stats_text += f"\n📤 Очередь отправки: {interactive} ответов, {bulk} рассылки"
+        
+        await message.answer(stats_text)
+
+    @dp.message(Command("users"))
+    async def users_export_handler(message: Message, command: CommandObject):
+        if not is_admin(message.from_user.id):
+            await message.answer("❌ Доступ запрещен")
+            return
+        
+        try:
+            filters = parse_export_filters(command.args)
+        except ValueError as e:
+            await message.answer(
+                f"❌ Неизвестный фильтр: {e}\n\n"
+                "Формат: /users [stage=9] [work=Грузчик] [active=1]"
+            )
+            return
+        
+        await message.answer("⏳ Готовлю выгрузку...")
+        file, count = await export_users_csv(db, **filters)
+        try:
+            await message.answer_document(
+                SpooledInputFile(file, filename=f"users_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"),
+                caption=f"👥 Пользователей: {count}"
+            )
+        finally:
+            file.close()
+
     # ... остальные админ-команды без изменений
 
-    print("✅ Бот запущен со ВСЕМИ этапами регистрации!")
-    await dp.start_polling(bot)
+    dp['broadcaster'] = broadcaster
+    dp['responses'] = responses
+    dp['digest'] = digest
+    return dp
+
+# ===== ОСНОВНОЙ КОД =====
+async def main(worker_fd=None):
+    # Процесс-обработчик останавливает приемник, закрывая сокет, поэтому Ctrl+C в терминале
+    # (SIGINT приходит всей группе процессов) он пропускает и слушает только SIGTERM
+    if worker_fd is not None:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        stopping = install_signal_handlers((signal.SIGTERM,))
+    else:
+        stopping = install_signal_handlers()
+
+    bot = Bot(token=BOT_TOKEN)
+    # Спан вызова Bot API снаружи очереди: в трассе видно и ожидание лимита, и сам запрос
+    if TRACE_ENABLED:
+        bot.session.middleware(ApiTracingMiddleware())
+    # Все исходящие вызовы Bot API проходят через одну очередь с лимитами;
+    # в многопроцессном режиме общий лимит Telegram делится между процессами
+    outbound = OutboundDispatcher(rate=OUTBOUND_RATE / WORKER_PROCESSES if worker_fd is not None else OUTBOUND_RATE)
+    bot.session.middleware(outbound)
+    # Регистрируется после outbound, значит внутри него: меряет сам HTTP-вызов без ожидания в очереди
+    bot.session.middleware(ApiMetricsMiddleware())
+    db = Database()
+    dp = create_dispatcher(bot, db, outbound)
+    broadcaster, responses, digest = dp['broadcaster'], dp['responses'], dp['digest']
+    lifecycle = OrderLifecycle(bot, db)
+    processor = UpdateProcessor(dp, bot)
+    metrics.register_gauge('bot_update_queue_depth', 'Апдейты в очередях воркеров', lambda: processor.depth)
+    metrics.register_gauge('bot_log_dropped_records', 'Записи лога, пропущенные из-за полной очереди', lambda: log_handler.dropped)
+    health = Health(db)
+
+    # HTTP-сервер поднимается до прогрева: /health/live отвечает сразу, /health/ready - когда бот готов.
+    # Процессу-обработчику свой сервер не нужен: вебхук, метрики и проверки у приемника
+    app = web.Application()
+    if METRICS_ENABLED:
+        setup_metrics_routes(app)
+    if HEALTH_ENABLED:
+        setup_health_routes(app, health)
+    http_runner = None
+    if worker_fd is None:
+        if BOT_MODE == 'webhook':
+            setup_webhook_routes(app, bot, processor)
+        if BOT_MODE == 'webhook' or METRICS_ENABLED or HEALTH_ENABLED:
+            http_runner = await start_http_server(app)
+    lag_monitor = asyncio.create_task(metrics.monitor_loop_lag())
+
+    started = False
+    intake = None
+    try:
+        # Прогрев: соединения пула, кэш мест по активным заявкам, профиль бота
+        await db.connect()
+        try:
+            await db.warm_up()
+        except Exception:
+            logger.exception("Не удалось прогреть кэши")
+        await bot.me()
+        broadcaster.start()
+        responses.start()
+        digest.start()
+        lifecycle.start()
+        await dp.emit_startup(bot=bot)
+        started = True
+        processor.start()
+
+        allowed_updates = dp.resolve_used_update_types()
+        if worker_fd is not None:
+            intake = asyncio.create_task(serve_worker(bot, processor, worker_fd))
+        elif BOT_MODE == 'webhook':
+            await bot.set_webhook(
+                WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=allowed_updates,
+            )
+            logger.info("✅ Вебхук слушает %s:%s%s", WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_PATH)
+        else:
+            intake = asyncio.create_task(poll_updates(bot, processor, allowed_updates))
+        health.ready = True
+        logger.info("✅ Бот запущен со ВСЕМИ этапами регистрации!")
+        await wait_for_stop(stopping, intake)
+    finally:
+        # Порядок остановки: прием, принятые апдейты с их ответами, фоновые службы, соединения.
+        # Все шаги делят общий срок SHUTDOWN_TIMEOUT
+        health.ready = False
+        deadline = Deadline(SHUTDOWN_TIMEOUT)
+        if intake is not None:
+            intake.cancel()
+            await asyncio.wait([intake], timeout=deadline.remaining())
+        await processor.stop(timeout=deadline.remaining())
+        if started:
+            # Сбрасывает в базу отложенные состояния FSM
+            await dp.emit_shutdown(bot=bot)
+        await asyncio.gather(
+            broadcaster.stop(deadline.remaining()),
+            responses.stop(deadline.remaining()),
+            lifecycle.stop(deadline.remaining()),
+            return_exceptions=True,
+        )
+        # Отклики из последнего сброса буфера еще попадают в сводку админам
+        await asyncio.gather(digest.stop(deadline.remaining()), return_exceptions=True)
+        lag_monitor.cancel()
+        if http_runner is not None:
+            await http_runner.cleanup()
+        await outbound.close()
+        await bot.session.close()
+        await db.close(timeout=deadline.remaining())
+        logger.info("✅ Бот остановлен")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if sys.argv[1:2] == ['--worker']:
+        # python bot.py --worker FD N: процесс-обработчик, запускается приемником
+        asyncio.run(main(worker_fd=int(sys.argv[2])))
+    elif WORKER_PROCESSES > 1:
+        asyncio.run(run_cluster())
+    else:
+        asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
+
+from config import BROADCAST_BATCH
+from sender import bulk_lane
+from ui import get_respond_keyboard
+
+logger = logging.getLogger(__name__)
+
+
+def format_order_message(order) -> str:
+    text = f"📢 Новая заявка!\n\n🔹 {order['description']}\n"
+    if order['work_types']:
+        text += f"   Виды работ: {', '.join(order['work_types'])}\n"
+    if order['capacity']:
+        text += f"   Нужно исполнителей: {order['capacity']}\n"
+    text += f"   ID: {order['order_id']}"
+    return text
+
+
+class Broadcaster:
+    """
+    Фоновая рассылка заявок из таблицы broadcast_queue.
+
+    Строки забираются пачками (FOR UPDATE SKIP LOCKED, так что несколько
+    экземпляров бота не пересекаются) и отправляются параллельно в
+    массовой полосе sender.OutboundDispatcher: общий и початовый лимиты,
+    повтор после 429 и приоритет ответов пользователям обеспечивает он.
+    Результат пачки записывается одним запросом.
+    """
+
+    def __init__(self, bot: Bot, db, batch_size=BROADCAST_BATCH):
+        self.bot = bot
+        self.db = db
+        self.batch_size = batch_size
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5):
+        """Дослать текущую пачку (иначе ее строки останутся в 'sending') и остановиться"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        done, _ = await asyncio.wait([self._task], timeout=timeout)
+        if not done:
+            self._task.cancel()
+            # Отмену, пришедшую в момент получения соединения из пула, задача может не заметить
+            await asyncio.wait([self._task], timeout=1)
+
+    def notify(self):
+        """Разбудить рассылку сразу после постановки новой заявки в очередь"""
+        self._wakeup.set()
+
+    async def _run(self):
+        recovered = await self.db.recover_broadcast()
+        if recovered:
+            logger.warning("Рассылка: %s сообщений с неизвестным статусом после рестарта", recovered)
+
+        while not self._stopping:
+            try:
+                batch = await self.db.claim_broadcast_batch(self.batch_size)
+            except Exception as e:
+                logger.error("Рассылка: не удалось получить пачку: %s", e)
+                batch = []
+
+            if not batch:
+                self._wakeup.clear()
+                if self._stopping:
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            results = await asyncio.gather(*(self._send(row) for row in batch))
+            try:
+                await self.db.finish_broadcast_batch(results)
+            except Exception as e:
+                # Строки останутся в 'sending' и после рестарта не уйдут повторно
+                logger.error("Рассылка: не удалось сохранить результат пачки: %s", e)
+
+    async def _send(self, row):
+        # gather запускает каждую отправку отдельной задачей, полоса ставится только ей
+        with bulk_lane():
+            try:
+                message = await self.bot.send_message(
+                    row['chat_id'], format_order_message(row), reply_markup=get_respond_keyboard(row['order_id'])
+                )
+                return 'sent', message.message_id, None, row['id']
+            except TelegramForbiddenError as e:
+                return 'blocked', None, str(e), row['id']
+            except TelegramAPIError as e:
+                return 'failed', None, str(e), row['id']
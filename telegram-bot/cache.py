@@ -0,0 +1,58 @@
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU-кэш с ограничением размера и временем жизни записи.
+
+    Хранит и None (например, "пользователь не найден"), поэтому get()
+    возвращает default только если ключа нет или он устарел. Считает
+    попадания и промахи.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: 'OrderedDict[object, tuple]' = OrderedDict()
+
+    def get(self, key, default=MISSING):
+        item = self._data.get(key)
+        if item is not None and item[1] > time.monotonic():
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+        if item is not None:
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def add(self, key, value):
+        # Как put, но не затирает запись, появившуюся пока шел запрос в базу
+        item = self._data.get(key)
+        if item is None or item[1] <= time.monotonic():
+            self.put(key, value)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,295 @@
+"""
+Многопроцессный режим (WORKER_PROCESSES > 1).
+
+Процесс-приемник получает апдейты (polling или вебхук) и передает их
+процессам-обработчикам, по одному сокету на процесс. Обработчик
+выбирается консистентным хэшем id чата/пользователя, поэтому апдейты
+одного пользователя всегда попадают в один процесс и обрабатываются по
+порядку, а его состояние FSM, кэш профиля и антиспам остаются локальными.
+
+Каждый обработчик - это обычный bot.py (python bot.py --worker FD N)
+со своим пулом соединений. Он шлет приемнику пульс; если пульса нет
+дольше WORKER_HEALTH_TIMEOUT или процесс упал, приемник его убивает и
+перезапускает с нарастающей паузой. Пока процесс поднимается, апдейты его
+пользователей ждут в его очереди у приемника, а не уходят другому;
+остальные процессы получают свои апдейты без задержки. С пульсом приходит
+снимок метрик обработчика: /metrics приемника показывает их с меткой worker.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from bisect import bisect
+from typing import List, Optional
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.types import Update
+
+import metrics
+from config import (
+    BOT_TOKEN, BOT_MODE, METRICS_ENABLED, HEALTH_ENABLED, SHUTDOWN_TIMEOUT,
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+    WORKER_PROCESSES, WORKER_HEARTBEAT_INTERVAL, WORKER_HEALTH_TIMEOUT, WORKER_START_TIMEOUT, WORKER_RESTART_DELAY,
+    WORKER_QUEUE_SIZE,
+)
+from health import Health, install_signal_handlers, setup_health_routes, wait_for_stop
+from webhook import UpdateProcessor, get_routing_id, poll_updates, setup_webhook_routes, start_http_server
+
+logger = logging.getLogger(__name__)
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')
+# Процесс, проживший дольше, считается стабильным: пауза перед перезапуском сбрасывается
+STABLE_UPTIME = 60
+MAX_RESTART_DELAY = 30
+# Предел строки пульса: в нем снимок метрик процесса
+HEARTBEAT_LIMIT = 16 * 1024 * 1024
+
+
+class HashRing:
+    """Консистентный хэш: при смене числа процессов переезжает ~1/N пользователей, а не все"""
+
+    def __init__(self, nodes: int, replicas: int = 100):
+        points = sorted(
+            (self._hash(f"{node}:{replica}"), node) for node in range(nodes) for replica in range(replicas)
+        )
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+    def get(self, key: int) -> int:
+        return self._nodes[bisect(self._keys, self._hash(str(key))) % len(self._keys)]
+
+
+# ===== ПРИЕМНИК =====
+class WorkerProcess:
+    def __init__(self, index: int, queue_size: int = WORKER_QUEUE_SIZE):
+        self.index = index
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.ready = asyncio.Event()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.depth = 0
+        self.restarts = 0
+        # Последний снимок метрик процесса из пульса
+        self.metrics: list = []
+
+    async def put(self, update: Update):
+        # Только постановка в очередь: ждет, лишь когда очередь этого процесса заполнена
+        await self.queue.put(update)
+
+    async def pump(self):
+        """Передача апдейтов из очереди в процесс по порядку; пока процесс (пере)запускается, очередь ждет"""
+        update = None
+        while True:
+            if update is None:
+                update = await self.queue.get()
+            await self.ready.wait()
+            try:
+                if self.writer.is_closing():
+                    raise ConnectionResetError('сокет закрыт')
+                self.writer.write(update.model_dump_json(exclude_unset=True).encode() + b'\n')
+                await self.writer.drain()
+            except (ConnectionError, RuntimeError) as e:
+                # Процесс упал между проверкой и записью: повторим этот апдейт после перезапуска
+                logger.warning("Процесс-обработчик %s не принял апдейт: %s", self.index, e)
+                await asyncio.sleep(0.1)
+                continue
+            self.queue.task_done()
+            update = None
+
+
+class Cluster:
+    """Запуск, проверка живости и перезапуск процессов-обработчиков"""
+
+    def __init__(self, size=WORKER_PROCESSES, health_timeout=WORKER_HEALTH_TIMEOUT,
+                 start_timeout=WORKER_START_TIMEOUT, restart_delay=WORKER_RESTART_DELAY):
+        self.health_timeout = health_timeout
+        self.start_timeout = start_timeout
+        self.restart_delay = restart_delay
+        self.ring = HashRing(size)
+        self.workers: List[WorkerProcess] = [WorkerProcess(index) for index in range(size)]
+        self._tasks: List[asyncio.Task] = []
+        self._pumps: List[asyncio.Task] = []
+        self.accepting = False
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._supervise(worker)) for worker in self.workers]
+        self._pumps = [asyncio.create_task(worker.pump()) for worker in self.workers]
+        self.accepting = True
+
+    async def put(self, update: Update):
+        await self.workers[self.ring.get(get_routing_id(update))].put(update)
+
+    async def _supervise(self, worker: WorkerProcess):
+        delay = self.restart_delay
+        while True:
+            started = time.monotonic()
+            try:
+                await self._run_once(worker)
+            except Exception as e:
+                logger.exception("Сбой процесса-обработчика %s: %s", worker.index, e)
+            worker.ready.clear()
+            worker.metrics = []
+            if worker.process is not None and worker.process.returncode is None:
+                worker.process.kill()
+                await worker.process.wait()
+
+            code = worker.process.returncode if worker.process else None
+            delay = self.restart_delay if time.monotonic() - started > STABLE_UPTIME else min(delay * 2, MAX_RESTART_DELAY)
+            worker.restarts += 1
+            logger.error("Процесс-обработчик %s остановился (код %s), перезапуск через %s с", worker.index, code, delay)
+            await asyncio.sleep(delay)
+
+    async def _run_once(self, worker: WorkerProcess):
+        parent_sock, child_sock = socket.socketpair()
+        try:
+            worker.process = await asyncio.create_subprocess_exec(
+                sys.executable, BOT_SCRIPT, '--worker', str(child_sock.fileno()), str(worker.index),
+                pass_fds=(child_sock.fileno(),),
+            )
+        finally:
+            child_sock.close()
+        reader, worker.writer = await asyncio.open_connection(sock=parent_sock, limit=HEARTBEAT_LIMIT)
+        try:
+            timeout = self.start_timeout
+            while True:
+                # Пульс приходит раз в WORKER_HEARTBEAT_INTERVAL; тишина - процесс завис или умер
+                line = await asyncio.wait_for(reader.readline(), timeout)
+                if not line:
+                    return
+                heartbeat = json.loads(line)
+                worker.depth = heartbeat['depth']
+                worker.metrics = heartbeat.get('metrics', [])
+                if not worker.ready.is_set():
+                    logger.info("✅ Процесс-обработчик %s запущен (pid %s)", worker.index, worker.process.pid)
+                    worker.ready.set()
+                timeout = self.health_timeout
+        except asyncio.TimeoutError:
+            logger.error("Процесс-обработчик %s не отвечает, перезапускаю", worker.index)
+        finally:
+            worker.ready.clear()
+            worker.writer.close()
+
+    async def stop(self, timeout: float = 10):
+        self.accepting = False
+        # Сначала дослать уже принятое живым процессам, на это - половина срока
+        started = time.monotonic()
+        draining = [asyncio.ensure_future(worker.queue.join()) for worker in self.workers if worker.ready.is_set()]
+        if draining:
+            await asyncio.wait(draining, timeout=timeout / 2)
+            for future in draining:
+                future.cancel()
+        lost = sum(worker.queue.qsize() for worker in self.workers)
+        if lost:
+            logger.error("Не доставлено процессам-обработчикам апдейтов: %s", lost)
+        timeout = max(0.1, timeout - (time.monotonic() - started))
+        for task in self._pumps + self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._pumps, *self._tasks, return_exceptions=True)
+        # Дочерним процессам уже закрыли сокет: дорабатывают принятое и выходят сами
+        processes = [worker.process for worker in self.workers if worker.process and worker.process.returncode is None]
+        try:
+            await asyncio.wait_for(asyncio.gather(*(process.wait() for process in processes)), timeout)
+        except asyncio.TimeoutError:
+            for process in processes:
+                if process.returncode is None:
+                    process.kill()
+
+
+async def run_cluster():
+    bot = Bot(token=BOT_TOKEN)
+    cluster = Cluster()
+    metrics.register_gauge(
+        'bot_worker_up', 'Процесс-обработчик отвечает на проверку',
+        lambda: {(worker.index,): int(worker.ready.is_set()) for worker in cluster.workers}, labels=('worker',)
+    )
+    metrics.register_gauge(
+        'bot_worker_restarts', 'Перезапуски процесса-обработчика',
+        lambda: {(worker.index,): worker.restarts for worker in cluster.workers}, labels=('worker',)
+    )
+    metrics.register_gauge(
+        'bot_worker_queue_depth', 'Апдейты в очереди процесса-обработчика',
+        lambda: {(worker.index,): worker.depth for worker in cluster.workers}, labels=('worker',)
+    )
+    metrics.register_gauge(
+        'bot_worker_pending_updates', 'Апдейты у приемника, еще не переданные процессу-обработчику',
+        lambda: {(worker.index,): worker.queue.qsize() for worker in cluster.workers}, labels=('worker',)
+    )
+    metrics.register_source('worker', lambda: {worker.index: worker.metrics for worker in cluster.workers})
+
+    stopping = install_signal_handlers()
+    health = Health()
+    app = web.Application()
+    if METRICS_ENABLED:
+        metrics.setup_metrics_routes(app)
+    if HEALTH_ENABLED:
+        setup_health_routes(app, health)
+    if BOT_MODE == 'webhook':
+        setup_webhook_routes(app, bot, cluster)
+    runner = None
+    if BOT_MODE == 'webhook' or METRICS_ENABLED or HEALTH_ENABLED:
+        runner = await start_http_server(app)
+    cluster.start()
+
+    intake = None
+    try:
+        # Готовы, когда поднялись все процессы; не дождались - работаем с теми, что есть
+        starting = asyncio.ensure_future(asyncio.gather(*(worker.ready.wait() for worker in cluster.workers)))
+        try:
+            await asyncio.wait_for(wait_for_stop(stopping, starting), WORKER_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error("Не все процессы-обработчики запустились за %s с", WORKER_START_TIMEOUT)
+        starting.cancel()
+        await asyncio.gather(starting, return_exceptions=True)
+        if stopping.is_set():
+            return
+        if BOT_MODE == 'webhook':
+            await bot.set_webhook(WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None)
+            logger.info("✅ Вебхук слушает %s:%s%s", WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_PATH)
+        else:
+            intake = asyncio.create_task(poll_updates(bot, cluster))
+        health.ready = True
+        logger.info("✅ Приемник запущен, процессов-обработчиков: %s", len(cluster.workers))
+        await wait_for_stop(stopping, intake)
+    finally:
+        health.ready = False
+        if intake is not None:
+            intake.cancel()
+            await asyncio.gather(intake, return_exceptions=True)
+        # Процессы дорабатывают принятое сами, пока не выйдет общий срок
+        await cluster.stop(timeout=SHUTDOWN_TIMEOUT)
+        if runner is not None:
+            await runner.cleanup()
+        await bot.session.close()
+
+
+# ===== ОБРАБОТЧИК =====
+async def serve_worker(bot: Bot, processor: UpdateProcessor, fd: int):
+    """Прием процесса-обработчика: апдейты из сокета приемника в processor, пульс обратно"""
+    reader, writer = await asyncio.open_connection(sock=socket.socket(fileno=fd))
+
+    async def heartbeat():
+        while True:
+            pulse = {'depth': processor.depth}
+            if METRICS_ENABLED:
+                pulse['metrics'] = metrics.snapshot()
+            writer.write(json.dumps(pulse, ensure_ascii=False).encode() + b'\n')
+            await writer.drain()
+            await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+
+    pulse = asyncio.create_task(heartbeat())
+    try:
+        # Пустая строка - приемник закрыл сокет: прием закончен, очередь дорабатывает main()
+        while line := await reader.readline():
+            await processor.put(Update.model_validate_json(line, context={'bot': bot}))
+    finally:
+        pulse.cancel()
+        writer.close()
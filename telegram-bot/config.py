@@ -8,4 +8,122 @@ DATABASE_URL = os.getenv('DATABASE_URL')
 
 # Без ошибок если ADMIN_IDS пустой
 admin_ids = os.getenv('ADMIN_IDS', '')
-ADMIN_IDS = [int(x.strip()) for x in admin_ids.split(',') if x.strip()] if admin_ids else []
\ No newline at end of file
+ADMIN_IDS = [int(x.strip()) for x in admin_ids.split(',') if x.strip()] if admin_ids else []
+
+# Пул соединений с базой
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+# Таймауты в секундах: на один запрос и на ожидание свободного соединения
+DB_QUERY_TIMEOUT = float(os.getenv('DB_QUERY_TIMEOUT', '5'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+# Реплики для чтения через запятую (пусто - все запросы на DATABASE_URL); сколько секунд после
+# записи читать пользователя с основной базы и через сколько снова пробовать упавшую реплику
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+DB_REPLICA_STICKY = float(os.getenv('DB_REPLICA_STICKY', '10'))
+DB_REPLICA_RETRY = float(os.getenv('DB_REPLICA_RETRY', '30'))
+
+# FSM-хранилище: размер кэша, сколько секунд запись кэша не перечитывается, время жизни состояния и параметры отложенной записи
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', '10000'))
+FSM_CACHE_TTL = float(os.getenv('FSM_CACHE_TTL', '30'))
+FSM_STATE_TTL = int(os.getenv('FSM_STATE_TTL', str(7 * 24 * 3600)))
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', '1'))
+FSM_FLUSH_BATCH = int(os.getenv('FSM_FLUSH_BATCH', '500'))
+
+# Режим получения обновлений: polling (локально) или webhook (прод)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('PORT', '8080'))
+# Пул обработчиков обновлений: число воркеров и длина очереди каждого
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '16'))
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '100'))
+
+# Многопроцессный режим: число процессов-обработчиков (0 - один процесс), проверка живости и перезапуск, секунд
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '0'))
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv('WORKER_HEARTBEAT_INTERVAL', '2'))
+WORKER_HEALTH_TIMEOUT = float(os.getenv('WORKER_HEALTH_TIMEOUT', '15'))
+WORKER_START_TIMEOUT = float(os.getenv('WORKER_START_TIMEOUT', '60'))
+WORKER_RESTART_DELAY = float(os.getenv('WORKER_RESTART_DELAY', '1'))
+# Апдейтов в очереди приемника на процесс: пока процесс перезапускается, копятся здесь, не задерживая остальных
+WORKER_QUEUE_SIZE = int(os.getenv('WORKER_QUEUE_SIZE', '10000'))
+
+# Рассылка заявок: сколько строк очереди забирать за раз
+BROADCAST_BATCH = int(os.getenv('BROADCAST_BATCH', '50'))
+
+# Жизненный цикл заявок: срок действия, период обслуживания (сек), размер пачки, через сколько дней в архив
+ORDER_TTL_HOURS = float(os.getenv('ORDER_TTL_HOURS', '72'))
+LIFECYCLE_INTERVAL = float(os.getenv('LIFECYCLE_INTERVAL', '60'))
+LIFECYCLE_BATCH = int(os.getenv('LIFECYCLE_BATCH', '500'))
+ORDER_ARCHIVE_DAYS = int(os.getenv('ORDER_ARCHIVE_DAYS', '30'))
+
+# Сводки откликов для админов: раз во сколько секунд обновлять и сколько последних откликнувшихся показывать
+DIGEST_WINDOW = float(os.getenv('DIGEST_WINDOW', '60'))
+DIGEST_NAMES = int(os.getenv('DIGEST_NAMES', '10'))
+
+# Заявок на одной странице ленты
+ORDERS_PAGE_SIZE = int(os.getenv('ORDERS_PAGE_SIZE', '5'))
+# Поиск заявок: результатов в инлайн-режиме за раз, кэш одинаковых запросов (записей и секунд)
+SEARCH_INLINE_RESULTS = int(os.getenv('SEARCH_INLINE_RESULTS', '20'))
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '1000'))
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', '30'))
+
+# Кэш профилей пользователей: число записей и время жизни в секундах
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '50000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '300'))
+
+# Кэш заявок: число мест заявки (не меняется) и признак "мест нет", секунд
+ORDER_CACHE_SIZE = int(os.getenv('ORDER_CACHE_SIZE', '10000'))
+ORDER_FULL_TTL = float(os.getenv('ORDER_FULL_TTL', '60'))
+
+# Буфер откликов: период сброса в секундах и размер пачки
+RESPONSE_FLUSH_INTERVAL = float(os.getenv('RESPONSE_FLUSH_INTERVAL', '0.2'))
+RESPONSE_BATCH = int(os.getenv('RESPONSE_BATCH', '1000'))
+
+# Выгрузка /users: строк за одно чтение курсора и сколько байт держать в памяти
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+EXPORT_SPOOL_SIZE = int(os.getenv('EXPORT_SPOOL_SIZE', str(4 * 1024 * 1024)))
+
+# Импорт заявок /import_orders: максимальный размер файла (лимит Bot API на скачивание 20 МБ) и строк
+IMPORT_MAX_SIZE = int(os.getenv('IMPORT_MAX_SIZE', str(20 * 1024 * 1024)))
+IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', '50000'))
+
+# Отсечение повторно доставленных апдейтов: сколько update_id помнить и сколько секунд;
+# UPDATE_DEDUP_DB=1 - еще и через таблицу processed_updates (несколько процессов/экземпляров)
+UPDATE_DEDUP_SIZE = int(os.getenv('UPDATE_DEDUP_SIZE', '100000'))
+UPDATE_DEDUP_WINDOW = float(os.getenv('UPDATE_DEDUP_WINDOW', '3600'))
+UPDATE_DEDUP_DB = os.getenv('UPDATE_DEDUP_DB', '0') == '1'
+
+# Антиспам: апдейтов в секунду на пользователя, запас на всплеск, забывать молчащих через N секунд
+THROTTLE_RATE = float(os.getenv('THROTTLE_RATE', '2'))
+THROTTLE_BURST = float(os.getenv('THROTTLE_BURST', '5'))
+THROTTLE_IDLE_TTL = float(os.getenv('THROTTLE_IDLE_TTL', '600'))
+# Окно склейки нажатий на переключатели видов работ, секунд
+TOGGLE_DEBOUNCE = float(os.getenv('TOGGLE_DEBOUNCE', '0.4'))
+
+# Исходящие запросы к Bot API: общий лимит в секунду, лимит и запас на один чат, повторы после 429
+OUTBOUND_RATE = float(os.getenv('OUTBOUND_RATE', '30'))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = float(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+
+# Метрики Prometheus на /metrics; в режиме polling поднимается свой HTTP-сервер на PORT
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_LOOP_LAG_INTERVAL = float(os.getenv('METRICS_LOOP_LAG_INTERVAL', '0.5'))
+
+# Логи: уровень, формат (json - по строке JSON на запись, text - для локального запуска) и длина очереди
+# перед записью в stdout; при переполнении записи пропускаются, а не тормозят бота
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+# Трассировка апдейтов: апдейт дольше порога (секунд) пишется в лог целиком, из остальных - доля TRACE_SAMPLE_RATE
+TRACE_ENABLED = os.getenv('TRACE_ENABLED', '1') == '1'
+TRACE_SLOW_THRESHOLD = float(os.getenv('TRACE_SLOW_THRESHOLD', '1'))
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))
+TRACE_MAX_SPANS = int(os.getenv('TRACE_MAX_SPANS', '200'))
+
+# Проверки /health/live и /health/ready; сколько секунд после SIGTERM дорабатывать принятое
+HEALTH_ENABLED = os.getenv('HEALTH_ENABLED', '1') == '1'
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '25'))
@@ -1,73 +1,892 @@
-import psycopg2
-from config import DATABASE_URL
+import asyncio
+import logging
+import time
+from datetime import date
+from typing import Optional
+
+from psycopg import OperationalError, errors, sql
+from psycopg.rows import dict_row, tuple_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+import metrics
+import tracing
+from cache import MISSING, TTLCache
+from migrate import get_pending_migrations
+from config import (
+    DATABASE_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_QUERY_TIMEOUT, DB_POOL_TIMEOUT,
+    DATABASE_REPLICA_URLS, DB_REPLICA_STICKY, DB_REPLICA_RETRY,
+    USER_CACHE_SIZE, USER_CACHE_TTL, ORDER_CACHE_SIZE, ORDER_FULL_TTL, ORDER_TTL_HOURS,
+    SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Общий для всех экземпляров номер блокировки переноса в архив
+ARCHIVE_LOCK_ID = 727402
+
+# Сколько ждать соединения с реплики: дольше - быстрее прочитать с основной базы
+REPLICA_CONNECTION_TIMEOUT = 1
+
+# Длиннее поисковый запрос не бывает осмысленным, а разбор tsquery растет с длиной
+SEARCH_QUERY_MAX = 200
+
+# Колонки users, которые можно менять через update_field
+USER_FIELDS = ('birth_date', 'inn', 'account_number', 'passport')
+
+
+def add_month(day: date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def normalize_search_query(query: str) -> str:
+    """Запрос поиска в том виде, в каком он уходит в базу и в ключ кэша"""
+    return ' '.join(query.lower().split())[:SEARCH_QUERY_MAX]
+
+
+class User:
+    """Строка таблицы users"""
+
+    __slots__ = (
+        'id', 'telegram_id', 'username', 'full_name', 'phone', 'birth_date', 'inn',
+        'account_number', 'passport', 'work_type', 'agreed_to_terms', 'agreed_to_rules',
+        'registration_stage', 'is_active', 'created_at',
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_row(cls, row: Optional[dict]) -> Optional['User']:
+        return cls(**row) if row else None
+
+
+class _Replica:
+    __slots__ = ('index', 'pool', 'down_until')
+
+    def __init__(self, index, pool):
+        self.index = index
+        self.pool = pool
+        self.down_until = 0.0
+
 
 class Database:
-    def __init__(self):
-        self.conn = None
-    
-    def connect(self):
+    """
+    Доступ к базе. Записи и чтения, которым нужна свежая строка, идут в
+    основную базу (self.pool). Чтения с replica=True (лента заявок,
+    профиль, отчеты админа) по кругу распределяются по репликам из
+    replica_dsns; реплика, на которой оборвалось соединение, пропускается
+    replica_retry секунд, а запрос повторяется на основной базе.
+    """
+
+    def __init__(self, dsn=DATABASE_URL, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 query_timeout=DB_QUERY_TIMEOUT, pool_timeout=DB_POOL_TIMEOUT,
+                 replica_dsns=DATABASE_REPLICA_URLS, replica_sticky=DB_REPLICA_STICKY,
+                 replica_retry=DB_REPLICA_RETRY):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.query_timeout = query_timeout
+        self.pool_timeout = pool_timeout
+        self.pool = None
+        self.replica_dsns = list(replica_dsns)
+        self.replica_retry = replica_retry
+        self.replicas = []
+        self._next_replica = 0
+        # Пользователи, записанные недавно: их строку читаем с основной базы, реплика могла отстать
+        self.recent_writes = TTLCache(USER_CACHE_SIZE, replica_sticky)
+        # Кэш пользователей по telegram_id; None означает "не зарегистрирован"
+        self.users = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+        # Число мест заявки не меняется, а заполненные заявки отвечают "мест нет" без запроса в базу
+        self.capacities = TTLCache(ORDER_CACHE_SIZE, float('inf'))
+        self.full_orders = TTLCache(ORDER_CACHE_SIZE, ORDER_FULL_TTL)
+        self.slot_gates = TTLCache(ORDER_CACHE_SIZE, ORDER_FULL_TTL)
+        # Закрытая (или удаленная) заявка снова не открывается; открытую кэшировать нельзя - ее могут закрыть
+        self.closed_orders = TTLCache(ORDER_CACHE_SIZE, float('inf'))
+        # Результаты поиска заявок; сбрасываются, когда в этом процессе заявки создаются или закрываются
+        self.search_results = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+
+    def _create_pool(self, dsn) -> AsyncConnectionPool:
+        return AsyncConnectionPool(
+            dsn,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            timeout=self.pool_timeout,
+            # statement_timeout обрывает зависший запрос на стороне сервера
+            kwargs={
+                'row_factory': dict_row,
+                'options': f'-c statement_timeout={int(self.query_timeout * 1000)}',
+            },
+            # Перед выдачей соединение проверяется, мертвые пересоздаются
+            check=AsyncConnectionPool.check_connection,
+            open=False,
+        )
+
+    async def connect(self):
+        # Без основной базы бот бесполезен, а пул после таймаута open(wait=True) закрыт насовсем:
+        # ошибка завершает процесс, платформа (или приемник в многопроцессном режиме) его перезапустит
+        self.pool = self._create_pool(self.dsn)
         try:
-            self.conn = psycopg2.connect(DATABASE_URL)
-            self.create_tables()
-            print("✅ База данных подключена и таблицы созданы!")
+            await self.pool.open(wait=True, timeout=self.pool_timeout)
         except Exception as e:
-            print(f"❌ Ошибка подключения к базе: {e}")
-    
-    def create_tables(self):
-        with self.conn.cursor() as cur:
-            # Пользователи
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id SERIAL PRIMARY KEY,
-                    telegram_id BIGINT UNIQUE,
-                    username TEXT,
-                    full_name TEXT,
-                    phone TEXT,
-                    birth_date TEXT,
-                    inn TEXT,
-                    account_number TEXT,
-                    passport TEXT,
-                    work_type TEXT[],
-                    agreed_to_terms BOOLEAN DEFAULT FALSE,
-                    agreed_to_rules BOOLEAN DEFAULT FALSE,
-                    registration_stage INTEGER DEFAULT 1,
-                    is_active BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT NOW()
+            logger.error("❌ Ошибка подключения к базе: %s", e)
+            raise
+        logger.info("✅ База данных подключена!")
+        try:
+            await self.check_schema()
+        except Exception as e:
+            logger.warning("⚠️ Не удалось проверить миграции: %s", e)
+        await asyncio.gather(*(self._connect_replica(index, dsn) for index, dsn in enumerate(self.replica_dsns, 1)))
+
+    async def _connect_replica(self, index: int, dsn: str):
+        # Недоступная при старте реплика не мешает запуску: пул продолжит подключаться в фоне
+        # (open(wait=True) по таймауту закрыл бы пул насовсем, поэтому ждем первое соединение сами)
+        replica = _Replica(index, self._create_pool(dsn))
+        self.replicas.append(replica)
+        await replica.pool.open()
+        try:
+            async with replica.pool.connection(timeout=REPLICA_CONNECTION_TIMEOUT):
+                pass
+            logger.info("✅ Реплика %s подключена", index)
+        except Exception as e:
+            replica.down_until = time.monotonic() + self.replica_retry
+            logger.warning("⚠️ Реплика %s недоступна: %s", index, e)
+
+    async def check_schema(self):
+        # Схему меняет только python migrate.py, бот лишь предупреждает об отставании
+        async with self.pool.connection() as conn:
+            pending = await get_pending_migrations(conn)
+        if pending:
+            names = ", ".join(f"{m.version:03d}_{m.name}" for m in pending)
+            logger.warning("⚠️ Не применены миграции: %s. Запустите python migrate.py", names)
+
+    async def warm_up(self):
+        """
+        Прогрев перед приемом апдейтов: pool.open(wait=True) уже открыл
+        min_size соединений, здесь загружаются кэши, которые иначе
+        заполнялись бы первыми нажатиями пользователей.
+        """
+        rows = await self.fetchall(
+            "SELECT id, capacity FROM orders WHERE status = 'active' ORDER BY id DESC LIMIT %s",
+            (ORDER_CACHE_SIZE,), retry=True
+        )
+        for row in reversed(rows):
+            self.capacities.put(row['id'], row['capacity'])
+        return len(rows)
+
+    async def ping(self):
+        await self.fetchone("SELECT 1", retry=True)
+
+    async def close(self, timeout: float = 5):
+        pools = [replica.pool for replica in self.replicas]
+        if self.pool is not None:
+            pools.append(self.pool)
+        await asyncio.gather(*(pool.close(timeout=timeout) for pool in pools))
+
+    # ===== НИЗКОУРОВНЕВЫЕ ЗАПРОСЫ =====
+    def _pick_replica(self) -> Optional[_Replica]:
+        now = time.monotonic()
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next_replica % len(self.replicas)]
+            self._next_replica += 1
+            if replica.down_until <= now:
+                return replica
+        return None
+
+    def _replica_failed(self, replica: _Replica, error: Exception):
+        replica.down_until = time.monotonic() + self.replica_retry
+        logger.warning("Реплика %s недоступна (%s), чтение с основной базы %s с", replica.index, error, self.replica_retry)
+
+    async def _run(self, query, params, fetch, replica=False, retry=False):
+        label = metrics.query_label(query if isinstance(query, str) else query.as_string(None))
+        start = time.perf_counter()
+        with tracing.span('db', query=label) as span:
+            try:
+                target = self._pick_replica() if replica else None
+                if target is not None:
+                    if span is not None:
+                        span.attrs['replica'] = target.index
+                    try:
+                        return await self._run_with_retry(query, params, fetch, target.pool, True,
+                                                          REPLICA_CONNECTION_TIMEOUT)
+                    except errors.QueryCanceled:
+                        # Таймаут или конфликт с восстановлением на реплике: она жива, повторим на основной
+                        pass
+                    except (OperationalError, PoolTimeout) as e:
+                        self._replica_failed(target, e)
+                    if span is not None:
+                        span.attrs['fallback'] = True
+                # Чтение с реплики повторяется на основной базе, значит повторять его безопасно
+                return await self._run_with_retry(query, params, fetch, self.pool, retry or replica)
+            except Exception as e:
+                metrics.db_errors.inc(label, type(e).__name__)
+                raise
+            finally:
+                metrics.db_query_duration.observe(time.perf_counter() - start, label)
+
+    async def _run_with_retry(self, query, params, fetch, pool, retry=False, timeout=None):
+        # Одна повторная попытка, если соединение оборвалось (рестарт базы, сеть), - только для retry=True:
+        # запись могла примениться, а оборвался лишь ответ, и повтор неидемпотентной записи ее задвоит
+        for attempt in range(2):
+            try:
+                async with pool.connection(timeout=timeout) as conn:
+                    if fetch == 'many':
+                        async with conn.cursor() as cur:
+                            await cur.executemany(query, params)
+                            return cur.rowcount
+                    cur = await conn.execute(query, params)
+                    if fetch == 'one':
+                        return await cur.fetchone()
+                    if fetch == 'all':
+                        return await cur.fetchall()
+                    return cur.rowcount
+            except errors.QueryCanceled:
+                logger.error("Запрос превысил таймаут %s с: %s", self.query_timeout, query)
+                raise
+            except PoolTimeout:
+                raise
+            except OperationalError as e:
+                if attempt or not retry:
+                    raise
+                logger.warning("Соединение с базой потеряно (%s), повтор запроса", e)
+
+    # retry=True - запрос можно повторить после обрыва соединения: чтение или идемпотентная запись
+    async def fetchone(self, query, params=None, replica=False, retry=False):
+        return await self._run(query, params, 'one', replica, retry)
+
+    async def fetchall(self, query, params=None, replica=False, retry=False):
+        return await self._run(query, params, 'all', replica, retry)
+
+    async def execute(self, query, params=None, retry=False):
+        return await self._run(query, params, None, retry=retry)
+
+    async def executemany(self, query, params_seq, retry=False):
+        # Пачка строк одним запросом за одно соединение из пула
+        return await self._run(query, params_seq, 'many', retry=retry)
+
+    # ===== ПОЛЬЗОВАТЕЛИ =====
+    async def get_user(self, telegram_id: int) -> Optional[User]:
+        user = self.users.get(telegram_id, MISSING)
+        if user is MISSING:
+            user = User.from_row(await self.fetchone(
+                "SELECT * FROM users WHERE telegram_id = %s", (telegram_id,),
+                replica=self.recent_writes.get(telegram_id) is MISSING
+            ))
+            self.users.add(telegram_id, user)
+        return user
+
+    async def get_registration_stage(self, telegram_id: int) -> Optional[int]:
+        user = await self.get_user(telegram_id)
+        return user.registration_stage if user else None
+
+    async def insert_user(self, telegram_id: int, username: Optional[str], full_name: str,
+                          phone: str, work_type: list) -> User:
+        # Все записи в users возвращают строку целиком и сразу обновляют кэш.
+        # Повтор (двойное нажатие, повторная доставка) не падает на уникальности telegram_id:
+        # существующая строка обновляется, а если данные те же - не переписывается вовсе
+        row = await self.fetchone(
+            '''INSERT INTO users (telegram_id, username, full_name, phone, work_type, agreed_to_terms, agreed_to_rules, registration_stage)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (telegram_id) DO UPDATE SET
+                username = EXCLUDED.username, full_name = EXCLUDED.full_name, phone = EXCLUDED.phone,
+                work_type = EXCLUDED.work_type, agreed_to_terms = TRUE, agreed_to_rules = TRUE,
+                registration_stage = GREATEST(users.registration_stage, EXCLUDED.registration_stage)
+            WHERE (users.username, users.full_name, users.phone, users.work_type,
+                   users.agreed_to_terms, users.agreed_to_rules, users.registration_stage >= EXCLUDED.registration_stage)
+                IS DISTINCT FROM (EXCLUDED.username, EXCLUDED.full_name, EXCLUDED.phone, EXCLUDED.work_type,
+                                  TRUE, TRUE, TRUE)
+            RETURNING *''',
+            (telegram_id, username, full_name, phone, work_type, True, True, 5), retry=True
+        )
+        if row is None:
+            self.recent_writes.put(telegram_id, True)
+            return await self.get_user(telegram_id)
+        return self._cache_user(telegram_id, row)
+
+    async def update_field(self, telegram_id: int, field: str, value: str, stage: int,
+                           activate: bool = False) -> Optional[User]:
+        if field not in USER_FIELDS:
+            raise ValueError(f"Нельзя обновлять поле {field}")
+        query = sql.SQL(
+            "UPDATE users SET {field} = %s, registration_stage = GREATEST(registration_stage, %s)"
+            "{activate} WHERE telegram_id = %s RETURNING *"
+        ).format(
+            field=sql.Identifier(field),
+            activate=sql.SQL(", is_active = TRUE" if activate else ""),
+        )
+        row = await self.fetchone(query, (value, stage, telegram_id), retry=True)
+        return self._cache_user(telegram_id, row)
+
+    def _cache_user(self, telegram_id: int, row: Optional[dict]) -> Optional[User]:
+        self.recent_writes.put(telegram_id, True)
+        user = User.from_row(row)
+        if user is None:
+            self.users.invalidate(telegram_id)
+        else:
+            self.users.put(telegram_id, user)
+        return user
+
+    # ===== ЗАЯВКИ =====
+    async def get_active_orders_page(self, cursor: Optional[tuple] = None, direction: str = 'next',
+                                     limit: int = 5) -> tuple:
+        """
+        Страница активных заявок по ключу (created_at, id), без OFFSET.
+
+        cursor - (created_at, id) крайней заявки текущей страницы; direction
+        'next' листает к более старым, 'prev' - к более новым. Возвращает
+        (заявки от новых к старым, есть_новее, есть_старше).
+        """
+        if cursor is None:
+            rows = await self.fetchall(
+                '''SELECT id, description, created_at FROM orders WHERE status = 'active'
+                ORDER BY created_at DESC, id DESC LIMIT %s''',
+                (limit + 1,), replica=True
+            )
+            return rows[:limit], False, len(rows) > limit
+
+        if direction == 'next':
+            rows = await self.fetchall(
+                '''SELECT id, description, created_at FROM orders
+                WHERE status = 'active' AND (created_at, id) < (%s, %s)
+                ORDER BY created_at DESC, id DESC LIMIT %s''',
+                (*cursor, limit + 1), replica=True
+            )
+            return rows[:limit], True, len(rows) > limit
+
+        rows = await self.fetchall(
+            '''SELECT id, description, created_at FROM orders
+            WHERE status = 'active' AND (created_at, id) > (%s, %s)
+            ORDER BY created_at ASC, id ASC LIMIT %s''',
+            (*cursor, limit + 1), replica=True
+        )
+        return rows[:limit][::-1], len(rows) > limit, True
+
+    async def search_orders(self, query: str, limit: int = 5, offset: int = 0) -> tuple:
+        """
+        Активные заявки, в описании которых есть слова запроса (с учетом
+        словоформ, синтаксис websearch: "фраза", -исключить, or), от новых к
+        старым. Возвращает (заявки, есть_еще). Одинаковые запросы
+        SEARCH_CACHE_TTL секунд отвечаются из кэша.
+        """
+        words = normalize_search_query(query)
+        if not words:
+            return [], False
+        key = (words, limit, offset)
+        result = self.search_results.get(key)
+        if result is MISSING:
+            rows = await self.fetchall(
+                '''SELECT id, description, created_at, work_types, capacity FROM orders
+                WHERE status = 'active' AND search_vector @@ websearch_to_tsquery('russian', %s)
+                ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s''',
+                (words, limit + 1, offset), replica=True
+            )
+            result = rows[:limit], len(rows) > limit
+            self.search_results.put(key, result)
+        return result
+
+    async def create_order(self, description: str, admin_id: int, work_types: list,
+                           capacity: Optional[int] = None, ttl_hours: float = ORDER_TTL_HOURS) -> int:
+        # Места заявки создаются тем же запросом (generate_series(1, NULL) не дает строк)
+        row = await self.fetchone(
+            '''WITH o AS (
+                INSERT INTO orders (description, admin_id, work_types, capacity, expires_at)
+                VALUES (%s, %s, %s, %s, NOW() + %s * INTERVAL '1 hour')
+                RETURNING id, capacity
+            ), s AS (
+                INSERT INTO order_slots (order_id, slot) SELECT id, generate_series(1, capacity) FROM o
+            )
+            SELECT id FROM o''',
+            (description, admin_id, work_types, capacity, ttl_hours)
+        )
+        self.capacities.put(row['id'], capacity)
+        self.search_results.clear()
+        return row['id']
+
+    async def import_orders(self, admin_id: int, rows: list) -> list:
+        """
+        Массовое создание заявок: rows [(строка файла, описание, виды работ,
+        мест или None, срок в часах), ...]. Строки грузятся одним COPY во
+        временную таблицу, оттуда одним запросом создаются заявки и их места.
+        Возвращает id новых заявок в порядке строк файла.
+        """
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    '''CREATE TEMP TABLE order_import (
+                        line INTEGER, description TEXT, work_types TEXT[], capacity INTEGER, ttl_hours FLOAT8
+                    ) ON COMMIT DROP'''
                 )
-            ''')
-            
-            # Заявки
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS orders (
-                    id SERIAL PRIMARY KEY,
-                    description TEXT NOT NULL,
-                    admin_id BIGINT,
-                    status TEXT DEFAULT 'active',
-                    created_at TIMESTAMP DEFAULT NOW()
+                cur = conn.cursor()
+                async with cur.copy(
+                    "COPY order_import (line, description, work_types, capacity, ttl_hours) FROM STDIN"
+                ) as copy:
+                    for row in rows:
+                        await copy.write_row(row)
+                cur = await conn.execute(
+                    '''WITH o AS (
+                        INSERT INTO orders (description, admin_id, work_types, capacity, expires_at)
+                        SELECT description, %s, work_types, capacity, NOW() + ttl_hours * INTERVAL '1 hour'
+                        FROM order_import ORDER BY line
+                        RETURNING id, capacity
+                    ), s AS (
+                        INSERT INTO order_slots (order_id, slot) SELECT id, generate_series(1, capacity) FROM o
+                    )
+                    SELECT id, capacity FROM o ORDER BY id''',
+                    (admin_id,)
                 )
-            ''')
-            
-            # Отклики на заявки
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS order_responses (
-                    id SERIAL PRIMARY KEY,
-                    order_id INTEGER REFERENCES orders(id),
-                    user_id BIGINT REFERENCES users(telegram_id),
-                    status TEXT DEFAULT 'responded',
-                    created_at TIMESTAMP DEFAULT NOW()
+                created = await cur.fetchall()
+        for row in created:
+            self.capacities.put(row['id'], row['capacity'])
+        self.search_results.clear()
+        return [row['id'] for row in created]
+
+    async def get_order_capacity(self, order_id: int) -> Optional[int]:
+        capacity = self.capacities.get(order_id)
+        if capacity is MISSING:
+            row = await self.fetchone("SELECT capacity FROM orders WHERE id = %s", (order_id,), retry=True)
+            capacity = row['capacity'] if row else None
+            self.capacities.add(order_id, capacity)
+        return capacity
+
+    async def is_order_active(self, order_id: int) -> bool:
+        """Принимает ли заявка отклики; закрытые запоминаются, и нажатия по ним в базу не ходят"""
+        if self.closed_orders.get(order_id, None):
+            return False
+        row = await self.fetchone("SELECT status = 'active' AS active FROM orders WHERE id = %s", (order_id,), retry=True)
+        if not (row and row['active']):
+            self.closed_orders.put(order_id, True)
+            return False
+        return True
+
+    async def claim_order_slot(self, order_id: int, user_id: int, capacity: int) -> tuple:
+        """
+        Занять место в заявке с ограниченным числом исполнителей.
+
+        Свободное место берется FOR UPDATE SKIP LOCKED: параллельные отклики
+        не ждут друг друга, занятые другими транзакциями строки пропускаются.
+        Отклик пишется в order_responses тем же запросом. Возвращает
+        (результат, номер места): 'taken', 'already', 'full' или 'closed'.
+
+        В базу одновременно идут не больше capacity откликов процесса на
+        заявку: когда места разобраны, остальные ждавшие получают "мест нет"
+        из full_orders без запроса. Перебронирование исключает сама база.
+        """
+        gate = self.slot_gates.get(order_id, None)
+        if gate is None:
+            gate = asyncio.Semaphore(capacity)
+            self.slot_gates.put(order_id, gate)
+        async with gate:
+            if self.full_orders.get(order_id, None):
+                return 'full', None
+            return await self._claim_order_slot(order_id, user_id)
+
+    async def _claim_order_slot(self, order_id: int, user_id: int) -> tuple:
+        params = {'order_id': order_id, 'user_id': user_id}
+        try:
+            row = await self.fetchone(
+                '''WITH free AS (
+                    SELECT s.order_id, s.slot FROM order_slots s
+                    JOIN orders o ON o.id = s.order_id AND o.status = 'active'
+                    WHERE s.order_id = %(order_id)s AND s.user_id IS NULL
+                    AND NOT EXISTS (
+                        SELECT 1 FROM order_slots WHERE order_id = %(order_id)s AND user_id = %(user_id)s
+                    )
+                    ORDER BY s.slot LIMIT 1
+                    FOR UPDATE OF s SKIP LOCKED
+                ), taken AS (
+                    UPDATE order_slots s SET user_id = %(user_id)s, taken_at = NOW()
+                    FROM free WHERE s.order_id = free.order_id AND s.slot = free.slot
+                    RETURNING s.order_id, s.slot
+                ), response AS (
+                    INSERT INTO order_responses (order_id, user_id, status)
+                    SELECT order_id, %(user_id)s, 'confirmed' FROM taken
+                    ON CONFLICT (order_id, user_id) DO NOTHING
                 )
-            ''')
-            
-            # Администраторы
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS admins (
-                    id SERIAL PRIMARY KEY,
-                    telegram_id BIGINT UNIQUE,
-                    username TEXT,
-                    full_name TEXT,
-                    role TEXT DEFAULT 'admin',
-                    created_at TIMESTAMP DEFAULT NOW()
+                SELECT
+                    (SELECT slot FROM taken) AS slot,
+                    (SELECT status = 'active' FROM orders WHERE id = %(order_id)s) AS active,
+                    EXISTS (
+                        SELECT 1 FROM order_slots WHERE order_id = %(order_id)s AND user_id = %(user_id)s
+                    ) AS already,
+                    EXISTS (
+                        SELECT 1 FROM order_slots WHERE order_id = %(order_id)s AND user_id IS NULL
+                    ) AS has_free''',
+                params
+            )
+        except errors.UniqueViolation:
+            # Тот же пользователь параллельно занял другое место этой заявки
+            return 'already', None
+
+        if row['slot'] is not None:
+            return 'taken', row['slot']
+        if row['already']:
+            return 'already', None
+        if not row['active']:
+            self.closed_orders.put(order_id, True)
+            return 'closed', None
+        # Свободные строки, занятые еще не завершенными откликами, могут освободиться при откате
+        if not row['has_free']:
+            self.full_orders.put(order_id, True)
+        return 'full', None
+
+    # ===== ПОВТОРНЫЕ АПДЕЙТЫ =====
+    async def claim_update(self, update_id: int) -> bool:
+        """Отметить апдейт обработанным; False - его уже взял этот или другой процесс"""
+        return await self.execute(
+            "INSERT INTO processed_updates (update_id) VALUES (%s) ON CONFLICT DO NOTHING", (update_id,)
+        ) == 1
+
+    async def release_update(self, update_id: int) -> None:
+        await self.execute("DELETE FROM processed_updates WHERE update_id = %s", (update_id,), retry=True)
+
+    async def cleanup_processed_updates(self, window: float) -> int:
+        return await self.execute(
+            "DELETE FROM processed_updates WHERE processed_at < NOW() - make_interval(secs => %s)", (window,),
+            retry=True
+        )
+
+    # ===== ЖИЗНЕННЫЙ ЦИКЛ ЗАЯВОК =====
+    async def close_expired_orders(self, limit: int) -> list:
+        """
+        Закрыть пачку просроченных заявок. Разосланные по ним сообщения
+        уходят на редактирование ('closing'), неразосланные отменяются.
+        """
+        rows = await self.fetchall(
+            '''WITH closed AS (
+                UPDATE orders SET status = 'closed', closed_at = NOW()
+                WHERE id IN (
+                    SELECT id FROM orders WHERE status = 'active' AND expires_at <= NOW()
+                    ORDER BY expires_at LIMIT %s FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id
+            ), queue AS (
+                UPDATE broadcast_queue q
+                SET status = CASE q.status WHEN 'sent' THEN 'closing' ELSE 'cancelled' END
+                FROM closed WHERE q.order_id = closed.id AND q.status IN ('sent', 'pending')
+            )
+            SELECT id FROM closed''',
+            (limit,)
+        )
+        if rows:
+            self.search_results.clear()
+        for row in rows:
+            self.closed_orders.put(row['id'], True)
+        return [row['id'] for row in rows]
+
+    async def claim_closing_batch(self, limit: int) -> list:
+        return await self.fetchall(
+            '''UPDATE broadcast_queue q SET status = 'editing', claimed_at = NOW()
+            FROM orders o
+            WHERE q.id IN (
+                SELECT id FROM broadcast_queue WHERE status = 'closing'
+                ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+            ) AND o.id = q.order_id
+            RETURNING q.id, q.order_id, q.chat_id, q.message_id, o.description, o.work_types, o.capacity''',
+            (limit,)
+        )
+
+    async def finish_closing_batch(self, results: list) -> None:
+        # results: [(error, queue_id), ...]; ошибка (сообщение удалено и т.п.) не повторяется
+        await self.executemany(
+            "UPDATE broadcast_queue SET status = 'closed', error = %s WHERE id = %s", results, retry=True
+        )
+
+    async def recover_closing(self) -> int:
+        # Повторное редактирование безвредно, поэтому зависшие строки просто возвращаем в очередь
+        return await self.execute("UPDATE broadcast_queue SET status = 'closing' WHERE status = 'editing'", retry=True)
+
+    async def archive_orders(self, older_than_days: int, limit: int) -> int:
+        """
+        Перенести пачку давно закрытых заявок с откликами в orders_archive и
+        order_responses_archive (секции по месяцам создаются при первой
+        записи). Места, строки рассылки и сводки этих заявок удаляются. Возвращает
+        число перенесенных заявок.
+        """
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                # Секции создаются DDL: два процесса не должны делать это одновременно
+                await conn.execute("SELECT pg_advisory_xact_lock(%s)", (ARCHIVE_LOCK_ID,))
+                cur = await conn.execute(
+                    '''SELECT id FROM orders o
+                    WHERE status = 'closed' AND closed_at < NOW() - %s * INTERVAL '1 day'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM broadcast_queue WHERE order_id = o.id AND status IN ('closing', 'editing')
+                    )
+                    ORDER BY id LIMIT %s FOR UPDATE''',
+                    (older_than_days, limit)
                 )
-            ''')
-            
-            self.conn.commit()
\ No newline at end of file
+                ids = [row['id'] for row in await cur.fetchall()]
+                if not ids:
+                    return 0
+
+                cur = await conn.execute(
+                    '''SELECT date_trunc('month', COALESCE(created_at, NOW()))::date AS month FROM orders
+                    WHERE id = ANY(%(ids)s)
+                    UNION
+                    SELECT date_trunc('month', COALESCE(created_at, NOW()))::date FROM order_responses
+                    WHERE order_id = ANY(%(ids)s)''',
+                    {'ids': ids}
+                )
+                for row in await cur.fetchall():
+                    for table in ('orders_archive', 'order_responses_archive'):
+                        await conn.execute(sql.SQL(
+                            "CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} "
+                            "FOR VALUES FROM ({start}) TO ({end})"
+                        ).format(
+                            partition=sql.Identifier(f"{table}_{row['month']:%Y_%m}"),
+                            table=sql.Identifier(table),
+                            start=sql.Literal(row['month']),
+                            end=sql.Literal(add_month(row['month'])),
+                        ))
+
+                # Внешние ключи проверяются в конце выражения, поэтому дочерние строки и заявки удаляются вместе
+                await conn.execute(
+                    '''WITH responses AS (
+                        DELETE FROM order_responses WHERE order_id = ANY(%(ids)s)
+                        RETURNING id, order_id, user_id, status, created_at
+                    ), archived_responses AS (
+                        INSERT INTO order_responses_archive (id, order_id, user_id, status, created_at)
+                        SELECT id, order_id, user_id, status, COALESCE(created_at, NOW()) FROM responses
+                    ), slots AS (
+                        DELETE FROM order_slots WHERE order_id = ANY(%(ids)s)
+                    ), queue AS (
+                        DELETE FROM broadcast_queue WHERE order_id = ANY(%(ids)s)
+                    ), digests AS (
+                        DELETE FROM order_digests WHERE order_id = ANY(%(ids)s)
+                    ), moved AS (
+                        DELETE FROM orders WHERE id = ANY(%(ids)s)
+                        RETURNING id, description, admin_id, status, created_at, work_types, capacity,
+                                  expires_at, closed_at
+                    )
+                    INSERT INTO orders_archive (
+                        id, description, admin_id, status, created_at, work_types, capacity, expires_at, closed_at
+                    )
+                    SELECT id, description, admin_id, status, COALESCE(created_at, NOW()), work_types, capacity,
+                           expires_at, closed_at
+                    FROM moved''',
+                    {'ids': ids}
+                )
+                return len(ids)
+
+    # ===== ОТКЛИКИ =====
+    async def insert_responses(self, responses: list) -> list:
+        """Пачка откликов [(order_id, user_id), ...]; возвращает только новые"""
+        order_ids = [order_id for order_id, _ in responses]
+        user_ids = [user_id for _, user_id in responses]
+        return await self.fetchall(
+            '''INSERT INTO order_responses (order_id, user_id)
+            SELECT r.order_id, r.user_id
+            FROM unnest(%s::int[], %s::bigint[]) AS r(order_id, user_id)
+            JOIN orders o ON o.id = r.order_id AND o.status = 'active'
+            JOIN users u ON u.telegram_id = r.user_id
+            ON CONFLICT (order_id, user_id) DO NOTHING
+            RETURNING order_id, user_id''',
+            # Повтор после потерянного подтверждения ничего не задвоит, только не вернет уже записанные
+            (order_ids, user_ids), retry=True
+        )
+
+    # ===== СВОДКИ ОТКЛИКОВ =====
+    async def ensure_digests(self, order_ids: list) -> list:
+        """Завести строки сводок для заявок с админом; возвращает id заявок, у которых сводка есть"""
+        rows = await self.fetchall(
+            '''WITH wanted AS (
+                SELECT id, admin_id FROM orders WHERE id = ANY(%s) AND admin_id IS NOT NULL
+            ), created AS (
+                INSERT INTO order_digests (order_id, admin_id)
+                SELECT id, admin_id FROM wanted
+                ON CONFLICT (order_id) DO NOTHING
+            )
+            SELECT id FROM wanted''',
+            (order_ids,), retry=True
+        )
+        return [row['id'] for row in rows]
+
+    async def claim_digests(self, order_ids: list, lease: float, names: int) -> list:
+        """
+        Взять в работу сводки заявок (строки, арендованные другим процессом,
+        пропускаются) вместе с данными для текста: общее число откликов и
+        последние names откликнувшихся с видами работ.
+        """
+        return await self.fetchall(
+            '''WITH claimed AS (
+                UPDATE order_digests SET claimed_until = NOW() + %(lease)s * INTERVAL '1 second'
+                WHERE order_id IN (
+                    SELECT order_id FROM order_digests
+                    WHERE order_id = ANY(%(ids)s) AND (claimed_until IS NULL OR claimed_until < NOW())
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING order_id, admin_id, message_id, responses AS shown
+            )
+            SELECT c.*, o.description, o.capacity,
+                (SELECT count(*) FROM order_responses WHERE order_id = c.order_id) AS total,
+                (
+                    SELECT COALESCE(json_agg(json_build_object('name', u.full_name, 'work_types', u.work_type)
+                                             ORDER BY r.id DESC), '[]')
+                    FROM (
+                        SELECT id, user_id FROM order_responses WHERE order_id = c.order_id
+                        ORDER BY id DESC LIMIT %(names)s
+                    ) r
+                    JOIN users u ON u.telegram_id = r.user_id
+                ) AS latest
+            FROM claimed c
+            JOIN orders o ON o.id = c.order_id''',
+            {'ids': order_ids, 'lease': lease, 'names': names}
+        )
+
+    async def finish_digests(self, results: list) -> None:
+        # results: [(message_id, показано откликов, order_id), ...]
+        await self.executemany(
+            '''UPDATE order_digests SET message_id = %s, responses = %s, claimed_until = NULL, updated_at = NOW()
+            WHERE order_id = %s''',
+            results, retry=True
+        )
+
+    async def stream_users(self, columns, stage=None, work_type=None, active=None, chunk_size=1000):
+        """
+        Пользователи кусками по chunk_size строк (кортежи в порядке columns).
+
+        Читает через именованный (серверный) курсор: в памяти процесса
+        одновременно не больше одного куска, сколько бы строк ни было.
+        """
+        conditions = []
+        params = []
+        if stage is not None:
+            conditions.append(sql.SQL("registration_stage = %s"))
+            params.append(stage)
+        if work_type is not None:
+            conditions.append(sql.SQL("work_type @> ARRAY[%s]"))
+            params.append(work_type)
+        if active is not None:
+            conditions.append(sql.SQL("is_active = %s"))
+            params.append(active)
+
+        query = sql.SQL("SELECT {columns} FROM users {where} ORDER BY id").format(
+            columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+            where=sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL(""),
+        )
+        # Выгрузка целиком идет с реплики, если она есть. Реплика не ответила до первого куска -
+        # начинаем заново с основной базы; посреди потока на другую базу не переключаемся
+        replica = self._pick_replica()
+        if replica is not None:
+            started = False
+            try:
+                async for rows in self._stream_rows(replica.pool, query, params, chunk_size,
+                                                    REPLICA_CONNECTION_TIMEOUT):
+                    started = True
+                    yield rows
+                return
+            except errors.QueryCanceled:
+                # Таймаут или конфликт с восстановлением на реплике: она жива
+                if started:
+                    raise
+            except (OperationalError, PoolTimeout) as e:
+                self._replica_failed(replica, e)
+                if started:
+                    raise
+        async for rows in self._stream_rows(self.pool, query, params, chunk_size):
+            yield rows
+
+    @staticmethod
+    async def _stream_rows(pool, query, params, chunk_size, timeout=None):
+        async with pool.connection(timeout=timeout) as conn:
+            # Серверный курсор живет внутри транзакции этого соединения
+            async with conn.cursor(name='users_export', row_factory=tuple_row) as cur:
+                await cur.execute(query, params)
+                while rows := await cur.fetchmany(chunk_size):
+                    yield rows
+
+    # ===== СТАТИСТИКА =====
+    async def get_stats(self, days: int = 7) -> tuple:
+        """Счетчики из stats_counters и stats_daily вместе с еще не свернутыми приращениями (миграции 003, 009)"""
+        totals = await self.fetchall(
+            '''SELECT name, SUM(value)::bigint AS value FROM (
+                SELECT name, value FROM stats_counters
+                UNION ALL SELECT name, delta FROM stats_deltas WHERE day IS NULL
+            ) s GROUP BY name''',
+            replica=True
+        )
+        daily = await self.fetchall(
+            '''SELECT day, name, SUM(value)::bigint AS value FROM (
+                SELECT day, name, value FROM stats_daily WHERE day > CURRENT_DATE - %(days)s
+                UNION ALL SELECT day, name, delta FROM stats_deltas WHERE day > CURRENT_DATE - %(days)s
+            ) s GROUP BY day, name ORDER BY day DESC''',
+            {'days': days}, replica=True
+        )
+        return {row['name']: row['value'] for row in totals}, daily
+
+    async def fold_stats(self, limit: int) -> int:
+        """
+        Свернуть пачку приращений stats_deltas в stats_counters и stats_daily.
+
+        Общие строки счетчиков меняет только этот запрос, а не транзакции
+        записи. Приращения берутся через SKIP LOCKED, счетчики обновляются
+        в порядке ключа, так что параллельные свертки не попадают в
+        deadlock. Повтор после обрыва просто свернет следующую пачку.
+        """
+        row = await self.fetchone(
+            '''WITH moved AS (
+                DELETE FROM stats_deltas WHERE id IN (
+                    SELECT id FROM stats_deltas ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+                )
+                RETURNING day, name, delta
+            ), counters AS (
+                INSERT INTO stats_counters (name, value)
+                SELECT name, SUM(delta) FROM moved WHERE day IS NULL GROUP BY name ORDER BY name
+                ON CONFLICT (name) DO UPDATE SET value = stats_counters.value + EXCLUDED.value
+            ), daily AS (
+                INSERT INTO stats_daily (day, name, value)
+                SELECT day, name, SUM(delta) FROM moved WHERE day IS NOT NULL GROUP BY day, name ORDER BY day, name
+                ON CONFLICT (day, name) DO UPDATE SET value = stats_daily.value + EXCLUDED.value
+            )
+            SELECT COUNT(*) AS moved FROM moved''',
+            (limit,), retry=True
+        )
+        return row['moved']
+
+    # ===== РАССЫЛКА =====
+    async def enqueue_broadcast(self, order_id: int, work_types: list) -> int:
+        # Вся выборка получателей одним запросом; повторный вызов ничего не дублирует
+        return await self.execute(
+            '''INSERT INTO broadcast_queue (order_id, chat_id)
+            SELECT %s, telegram_id FROM users WHERE is_active AND work_type && %s
+            ON CONFLICT (order_id, chat_id) DO NOTHING''',
+            (order_id, work_types)
+        )
+
+    async def enqueue_broadcasts(self, order_ids: list) -> int:
+        """Рассылка сразу по многим заявкам (после импорта) одним запросом"""
+        return await self.execute(
+            '''INSERT INTO broadcast_queue (order_id, chat_id)
+            SELECT o.id, u.telegram_id FROM orders o
+            JOIN users u ON u.is_active AND u.work_type && o.work_types
+            WHERE o.id = ANY(%s) AND o.status = 'active'
+            ORDER BY o.id
+            ON CONFLICT (order_id, chat_id) DO NOTHING''',
+            (order_ids,)
+        )
+
+    async def claim_broadcast_batch(self, limit: int) -> list:
+        return await self.fetchall(
+            '''UPDATE broadcast_queue q SET status = 'sending', claimed_at = NOW()
+            FROM orders o
+            WHERE q.id IN (
+                SELECT id FROM broadcast_queue WHERE status = 'pending'
+                ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+            ) AND o.id = q.order_id
+            RETURNING q.id, q.order_id, q.chat_id, o.description, o.work_types, o.capacity''',
+            (limit,)
+        )
+
+    async def finish_broadcast_batch(self, results: list) -> None:
+        # results: [(status, message_id, error, queue_id), ...]
+        await self.executemany(
+            "UPDATE broadcast_queue SET status = %s, message_id = %s, error = %s, sent_at = NOW() WHERE id = %s",
+            results, retry=True
+        )
+
+    async def recover_broadcast(self) -> int:
+        # Строки, зависшие в 'sending' после падения, могли уже уйти получателю:
+        # повторно их не отправляем, чтобы не было дублей
+        return await self.execute(
+            "UPDATE broadcast_queue SET status = 'unknown' WHERE status = 'sending'", retry=True
+        )
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError
+
+from config import DIGEST_WINDOW, DIGEST_NAMES
+from sender import bulk_lane
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд сводка заявки закреплена за процессом, который ее отправляет
+CLAIM_LEASE = 120
+# Сколько из аренды повторять запись id отправленных сообщений, если база не ответила
+FINISH_RETRY_WINDOW = CLAIM_LEASE / 2
+DESCRIPTION_PREVIEW = 200
+
+
+def format_digest(row) -> str:
+    description = row['description']
+    if len(description) > DESCRIPTION_PREVIEW:
+        description = description[:DESCRIPTION_PREVIEW].rstrip() + '…'
+    total = f"{row['total']} из {row['capacity']}" if row['capacity'] else str(row['total'])
+    text = f"📬 Отклики на заявку #{row['order_id']}: {total}\n🔹 {description}\n\nПоследние:\n"
+    for number, user in enumerate(row['latest'], 1):
+        text += f"{number}. {user['name'] or 'без имени'}"
+        if user['work_types']:
+            text += f" — {', '.join(user['work_types'])}"
+        text += "\n"
+    rest = row['total'] - len(row['latest'])
+    if rest > 0:
+        text += f"...и еще {rest}\n"
+    return text
+
+
+class AdminDigest:
+    """
+    Сводки откликов для админов вместо сообщения на каждый отклик.
+
+    Новые отклики (из ResponseBuffer и занятые места) только отмечают
+    заявку. Раз в window секунд по каждой отмеченной заявке ее админу
+    уходит одно сообщение: число откликов, последние откликнувшиеся и их
+    виды работ. Следующие отклики редактируют это же сообщение, а не шлют
+    новое; если админ его удалил, придет новое. Данные для текста берутся
+    из базы, поэтому несколько процессов показывают одну и ту же сводку, а
+    аренда строки order_digests не дает им отправить ее одновременно.
+    """
+
+    def __init__(self, bot: Bot, db, window=DIGEST_WINDOW, names=DIGEST_NAMES):
+        self.bot = bot
+        self.db = db
+        self.window = window
+        self.names = names
+        self._pending = set()
+        # Итоги отправки, которые не удалось записать в базу: пишутся первыми в следующем окне
+        self._unfinished = []
+        self._task = None
+        self._stopping = asyncio.Event()
+
+    def start(self):
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5):
+        """Отправить накопленное за текущее окно и остановиться"""
+        if self._task is not None:
+            self._stopping.set()
+            done, _ = await asyncio.wait([self._task], timeout=timeout)
+            if not done:
+                self._task.cancel()
+
+    def add(self, order_id: int):
+        self._pending.add(order_id)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.window)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Сводки откликов: %s", e)
+            if self._stopping.is_set():
+                break
+
+    async def flush(self) -> int:
+        """Отправить сводки по отмеченным заявкам; возвращает число обработанных"""
+        if self._unfinished:
+            # Без записанного message_id следующая сводка ушла бы новым сообщением, а не правкой
+            results, self._unfinished = self._unfinished, []
+            await self._finish(results)
+        if not self._pending:
+            return 0
+        order_ids, self._pending = list(self._pending), set()
+        try:
+            with_digest = await self.db.ensure_digests(order_ids)
+            rows = await self.db.claim_digests(with_digest, CLAIM_LEASE, self.names)
+        except Exception:
+            self._pending.update(order_ids)
+            raise
+        # Сводку, занятую другим процессом, пересчитаем в следующем окне: он мог не увидеть наши отклики
+        self._pending.update(set(with_digest) - {row['order_id'] for row in rows})
+
+        results = await asyncio.gather(*(self._send(row) for row in rows))
+        await self._finish(results)
+        return len(rows)
+
+    async def _finish(self, results: list):
+        """Записать id сообщений и снять аренду; пока аренда держится, повторяем при сбое базы"""
+        deadline = time.monotonic() + FINISH_RETRY_WINDOW
+        delay = 1
+        try:
+            while True:
+                try:
+                    await self.db.finish_digests(results)
+                    return
+                except Exception as e:
+                    if time.monotonic() + delay > deadline:
+                        raise
+                    logger.warning("Не удалось сохранить сводки, повтор через %s с: %s", delay, e)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 10)
+        except BaseException:
+            self._unfinished.extend(results)
+            raise
+
+    async def _send(self, row):
+        unchanged = row['message_id'], row['shown'], row['order_id']
+        if row['message_id'] and row['total'] == row['shown']:
+            return unchanged
+        text = format_digest(row)
+        with bulk_lane():
+            try:
+                if row['message_id']:
+                    try:
+                        await self.bot.edit_message_text(text, chat_id=row['admin_id'], message_id=row['message_id'])
+                        return row['message_id'], row['total'], row['order_id']
+                    except TelegramBadRequest as e:
+                        if 'message is not modified' in str(e):
+                            return row['message_id'], row['total'], row['order_id']
+                        # Сообщение удалено: сводка придет новым
+                        logger.warning("Сводка по заявке %s не отредактирована: %s", row['order_id'], e)
+                message = await self.bot.send_message(row['admin_id'], text)
+                return message.message_id, row['total'], row['order_id']
+            except TelegramForbiddenError as e:
+                # Админ заблокировал бота: не повторяем до следующего отклика
+                logger.warning("Сводка по заявке %s не доставлена: %s", row['order_id'], e)
+                return unchanged
+            except TelegramAPIError as e:
+                logger.warning("Сводка по заявке %s не доставлена: %s", row['order_id'], e)
+                self._pending.add(row['order_id'])
+                return unchanged
@@ -0,0 +1,76 @@
+import csv
+import io
+import tempfile
+from typing import Optional
+
+from aiogram.types.input_file import InputFile, DEFAULT_CHUNK_SIZE
+
+from config import EXPORT_CHUNK_SIZE, EXPORT_SPOOL_SIZE
+
+EXPORT_COLUMNS = (
+    'telegram_id', 'username', 'full_name', 'phone', 'birth_date', 'inn', 'account_number',
+    'passport', 'work_type', 'registration_stage', 'is_active', 'created_at',
+)
+WORK_TYPE_COLUMN = EXPORT_COLUMNS.index('work_type')
+
+
+class SpooledInputFile(InputFile):
+    """Отдает в Telegram уже записанный временный файл кусками, не читая его целиком"""
+
+    def __init__(self, file, filename: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot):
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
+
+
+def parse_export_filters(args: Optional[str]) -> dict:
+    """Разбор аргументов /users: stage=9 work=Грузчик active=1"""
+    filters = {}
+    for part in (args or '').split():
+        name, _, value = part.partition('=')
+        if name == 'stage' and value.isdigit():
+            filters['stage'] = int(value)
+        elif name == 'work' and value:
+            filters['work_type'] = value
+        elif name == 'active' and value in ('0', '1'):
+            filters['active'] = value == '1'
+        else:
+            raise ValueError(part)
+    return filters
+
+
+async def export_users_csv(db, stage=None, work_type=None, active=None,
+                           chunk_size=EXPORT_CHUNK_SIZE, spool_size=EXPORT_SPOOL_SIZE):
+    """
+    Выгрузка users в CSV через серверный курсор.
+
+    Строки читаются кусками по chunk_size и сразу пишутся во временный
+    файл, который держится в памяти до spool_size байт и дальше уходит на
+    диск. Возвращает (файл, число строк); файл закрывает вызывающий.
+    """
+    file = tempfile.SpooledTemporaryFile(max_size=spool_size, mode='w+b')
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_COLUMNS)
+
+    count = 0
+    try:
+        async for rows in db.stream_users(EXPORT_COLUMNS, stage, work_type, active, chunk_size):
+            for row in rows:
+                row = list(row)
+                row[WORK_TYPE_COLUMN] = ', '.join(row[WORK_TYPE_COLUMN] or [])
+                writer.writerow(row)
+            count += len(rows)
+    except BaseException:
+        # Вызывающий файл не получит: закрываем здесь, иначе останется на диске до сборки мусора
+        text.close()
+        raise
+
+    text.flush()
+    # Файл дальше нужен в бинарном виде, обертку отвязываем, чтобы она его не закрыла
+    text.detach()
+    return file, count
@@ -0,0 +1,82 @@
+"""
+Проверки живости и готовности, остановка по сигналу.
+
+GET /health/live отвечает 200, пока процесс жив и event loop не завис.
+GET /health/ready отвечает 200 только после прогрева (база, кэши,
+фоновые службы) и пока бот не начал останавливаться; по нему Railway
+решает, можно ли переключать трафик на новый экземпляр.
+"""
+import asyncio
+import logging
+import signal
+import time
+from typing import Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+class Health:
+    def __init__(self, db=None, ping_timeout: float = 1):
+        self.db = db
+        self.ping_timeout = ping_timeout
+        self.ready = False
+        self.started_at = time.monotonic()
+
+    async def check_ready(self) -> bool:
+        if not self.ready:
+            return False
+        if self.db is None:
+            return True
+        try:
+            await asyncio.wait_for(self.db.ping(), self.ping_timeout)
+            return True
+        except Exception as e:
+            logger.warning("Проверка готовности: база недоступна: %s", e)
+            return False
+
+
+def setup_health_routes(app: web.Application, health: Health):
+    async def live(request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok', 'uptime': round(time.monotonic() - health.started_at)})
+
+    async def ready(request: web.Request) -> web.Response:
+        if await health.check_ready():
+            return web.json_response({'status': 'ready'})
+        return web.json_response({'status': 'not ready'}, status=503)
+
+    app.router.add_get('/health/live', live)
+    app.router.add_get('/health/ready', ready)
+
+
+def install_signal_handlers(signals=(signal.SIGTERM, signal.SIGINT)) -> asyncio.Event:
+    """Событие, которое выставят SIGTERM (остановка контейнера) и SIGINT (Ctrl+C)"""
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in signals:
+        loop.add_signal_handler(sig, _on_signal, sig, stopping)
+    return stopping
+
+
+async def wait_for_stop(stopping: asyncio.Event, intake: Optional[asyncio.Task] = None):
+    """Ждать сигнала остановки или завершения приема апдейтов (приемник закрыл сокет, ошибка)"""
+    waiter = asyncio.create_task(stopping.wait())
+    await asyncio.wait([waiter] + ([intake] if intake is not None else []), return_when=asyncio.FIRST_COMPLETED)
+    waiter.cancel()
+
+
+def _on_signal(sig: signal.Signals, stopping: asyncio.Event):
+    if not stopping.is_set():
+        logger.info("⏹ Получен %s, останавливаюсь", sig.name)
+    stopping.set()
+
+
+class Deadline:
+    """Общий срок на все шаги остановки: каждому шагу достается остаток"""
+
+    def __init__(self, timeout: float):
+        self.at = time.monotonic() + timeout
+
+    def remaining(self, minimum: float = 0.1) -> float:
+        return max(minimum, self.at - time.monotonic())
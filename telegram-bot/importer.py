@@ -0,0 +1,116 @@
+import csv
+import io
+import re
+
+from config import IMPORT_MAX_ROWS, ORDER_TTL_HOURS
+from ui import WORK_TYPES, ORDER_CAPACITY_MAX, parse_capacity
+
+IMPORT_COLUMNS = ('description', 'work_types', 'capacity', 'ttl_hours')
+REQUIRED_COLUMNS = ('description', 'work_types')
+# Описание уходит в рассылку целиком, а сообщение Telegram не длиннее 4096 символов
+DESCRIPTION_MAX = 3500
+# Отчет об импорте - одно сообщение: запас под вопрос о рассылке; значения из файла в ошибках обрезаются
+REPORT_MAX = 4000
+ERROR_VALUE_MAX = 50
+_WORK_SPLIT_RE = re.compile(r'\s*[,;|]\s*')
+_WORK_TYPES_LOWER = {work.lower(): work for work in WORK_TYPES}
+
+
+def parse_orders_csv(file, max_rows=IMPORT_MAX_ROWS, default_ttl=ORDER_TTL_HOURS):
+    """
+    Разбор CSV с заявками: description, work_types, capacity, ttl_hours.
+
+    Обязательны колонки description и work_types; разделитель ',' или ';'
+    определяется по заголовку. Виды работ в ячейке перечисляются через
+    ',', ';' или '|', пустые capacity и ttl_hours - без ограничения мест и
+    срок по умолчанию. Возвращает (строки для Database.import_orders,
+    ошибки [(номер строки, текст)]). Ошибка формата всего файла - ValueError.
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        header_line = text.readline()
+        delimiter = ';' if header_line.count(';') > header_line.count(',') else ','
+        header = [name.strip().lower() for name in next(csv.reader([header_line], delimiter=delimiter), [])]
+        missing = [name for name in REQUIRED_COLUMNS if name not in header]
+        if missing:
+            raise ValueError(f"в первой строке нет колонок: {', '.join(missing)}")
+        unknown = [name for name in header if name not in IMPORT_COLUMNS]
+        if unknown:
+            raise ValueError(f"неизвестные колонки: {_preview(', '.join(unknown))}")
+
+        rows, errors = [], []
+        for line, values in enumerate(csv.reader(text, delimiter=delimiter), start=2):
+            if not any(value.strip() for value in values):
+                continue
+            if len(rows) + len(errors) >= max_rows:
+                errors.append((line, f"больше {max_rows} строк, остаток файла пропущен"))
+                break
+            try:
+                rows.append((line, *_parse_row(dict(zip(header, values)), default_ttl)))
+            except ValueError as e:
+                errors.append((line, str(e)))
+        return rows, errors
+    except UnicodeDecodeError:
+        raise ValueError("файл не в кодировке UTF-8")
+    except csv.Error as e:
+        raise ValueError(f"файл не разбирается как CSV ({e})")
+    finally:
+        # Файл закрывает вызывающий, обертку отвязываем
+        text.detach()
+
+
+def _parse_row(row: dict, default_ttl: float) -> tuple:
+    description = (row.get('description') or '').strip()
+    if not description:
+        raise ValueError("пустое описание")
+    if len(description) > DESCRIPTION_MAX:
+        raise ValueError(f"описание длиннее {DESCRIPTION_MAX} символов")
+
+    work_types = []
+    for name in _WORK_SPLIT_RE.split((row.get('work_types') or '').strip()):
+        if not name:
+            continue
+        work = _WORK_TYPES_LOWER.get(name.lower())
+        if work is None:
+            raise ValueError(f"неизвестный вид работ: {_preview(name)}")
+        if work not in work_types:
+            work_types.append(work)
+    if not work_types:
+        raise ValueError("не указаны виды работ")
+
+    capacity = parse_capacity(row.get('capacity') or '0')
+    if capacity is None:
+        raise ValueError(f"мест: нужно число от 0 до {ORDER_CAPACITY_MAX}")
+
+    ttl = (row.get('ttl_hours') or '').strip().replace(',', '.')
+    try:
+        ttl_hours = float(ttl) if ttl else default_ttl
+    except ValueError:
+        ttl_hours = 0
+    if not 0 < ttl_hours <= 24 * 365:
+        raise ValueError("ttl_hours: нужно число часов больше 0")
+
+    return description, work_types, capacity or None, ttl_hours
+
+
+def _preview(value: str) -> str:
+    return value if len(value) <= ERROR_VALUE_MAX else value[:ERROR_VALUE_MAX].rstrip() + '…'
+
+
+def format_import_report(imported: int, errors: list, shown: int, limit: int = REPORT_MAX) -> str:
+    """Итог импорта для админа: не больше shown ошибок и limit символов"""
+    text = f"✅ Импортировано заявок: {imported}"
+    if not errors:
+        return text
+    text += f"\n❌ Строк с ошибками: {len(errors)}\n"
+    listed = 0
+    for line, error in errors[:shown]:
+        item = f"\nСтрока {line}: {error}"
+        # Запас под строку "... и еще N"
+        if len(text) + len(item) > limit - 30:
+            break
+        text += item
+        listed += 1
+    if len(errors) > listed:
+        text += f"\n... и еще {len(errors) - listed}"
+    return text
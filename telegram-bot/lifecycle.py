@@ -0,0 +1,100 @@
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+
+from broadcast import format_order_message
+from config import LIFECYCLE_INTERVAL, LIFECYCLE_BATCH, ORDER_ARCHIVE_DAYS
+from sender import bulk_lane
+
+logger = logging.getLogger(__name__)
+
+CLOSED_SUFFIX = "\n\n⛔ Заявка закрыта"
+
+
+class OrderLifecycle:
+    """
+    Фоновое обслуживание заявок.
+
+    Раз в interval секунд закрывает просроченные заявки (expires_at)
+    пачками по batch_size, снимает кнопку "Откликнуться" с уже разосланных
+    по ним сообщений, переносит заявки, закрытые больше archive_days
+    назад, в архивные таблицы и сворачивает приращения статистики /stats
+    в счетчики. Все шаги берут строки через SKIP LOCKED или
+    advisory-блокировку, так что могут работать в нескольких процессах.
+    """
+
+    def __init__(self, bot: Bot, db, interval=LIFECYCLE_INTERVAL, batch_size=LIFECYCLE_BATCH,
+                 archive_days=ORDER_ARCHIVE_DAYS):
+        self.bot = bot
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self.archive_days = archive_days
+        self._stopping = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5):
+        # Прерванный проход безопасен: перенос в архив откатится, 'editing' вернется в очередь при старте.
+        # Флаг нужен, если отмену проглотит ожидание соединения из пула (wait_for в Python 3.11)
+        if self._task is not None:
+            self._stopping.set()
+            self._task.cancel()
+            await asyncio.wait([self._task], timeout=timeout)
+
+    async def _run(self):
+        await self.db.recover_closing()
+        while not self._stopping.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error("Обслуживание заявок: %s", e)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self) -> tuple:
+        """Один проход: (закрыто заявок, отредактировано сообщений, перенесено в архив)"""
+        closed = 0
+        while True:
+            ids = await self.db.close_expired_orders(self.batch_size)
+            closed += len(ids)
+            if len(ids) < self.batch_size:
+                break
+
+        edited = 0
+        while batch := await self.db.claim_closing_batch(self.batch_size):
+            results = await asyncio.gather(*(self._edit(row) for row in batch))
+            await self.db.finish_closing_batch(results)
+            edited += len(batch)
+
+        archived = 0
+        while True:
+            moved = await self.db.archive_orders(self.archive_days, self.batch_size)
+            archived += moved
+            if moved < self.batch_size:
+                break
+
+        while await self.db.fold_stats(self.batch_size) == self.batch_size:
+            pass
+
+        if closed or edited or archived:
+            logger.info("Заявки: закрыто %s, сообщений обновлено %s, в архив %s", closed, edited, archived)
+        return closed, edited, archived
+
+    async def _edit(self, row):
+        # Без reply_markup Telegram убирает клавиатуру; ошибку (сообщение удалено) не повторяем
+        with bulk_lane():
+            try:
+                await self.bot.edit_message_text(
+                    format_order_message(row) + CLOSED_SUFFIX, chat_id=row['chat_id'], message_id=row['message_id']
+                )
+                return None, row['id']
+            except TelegramAPIError as e:
+                return str(e), row['id']
@@ -0,0 +1,259 @@
+"""
+Метрики в формате Prometheus: GET /metrics
+
+Небольшая собственная реализация счетчиков и гистограмм (без
+prometheus_client): обработчики апдейтов, запросы к базе, вызовы Bot API
+и задержка event loop. Текущие значения очередей и кэшей снимаются
+функциями-датчиками в момент запроса /metrics.
+
+В режиме нескольких процессов обработчики присылают снимок своих метрик
+с пульсом, а приемник отдает их в своем /metrics с меткой worker.
+"""
+import asyncio
+import re
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+
+from config import METRICS_LOOP_LAG_INTERVAL
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _render_samples(family: dict, extra_names=(), extra_values=()):
+    """Строки значений семейства из снимка; extra - метки процесса, которые ставятся первыми"""
+    name = family['name']
+    names = tuple(extra_names) + tuple(family['labels'])
+    if family['type'] == 'histogram':
+        bounds = tuple(family['buckets']) + ('+Inf',)
+        for labels, series in family['values']:
+            labels = tuple(extra_values) + tuple(labels)
+            total = 0
+            for bound, count in zip(bounds, series):
+                total += count
+                yield f"{name}_bucket{_format_labels(names + ('le',), labels + (bound,))} {total}"
+            yield f"{name}_sum{_format_labels(names, labels)} {series[-1]}"
+            yield f"{name}_count{_format_labels(names, labels)} {total}"
+    else:
+        for labels, value in family['values']:
+            yield f"{name}{_format_labels(names, tuple(extra_values) + tuple(labels))} {value}"
+
+
+def _render_family(family: dict):
+    yield f"# HELP {family['name']} {family['help']}"
+    yield f"# TYPE {family['name']} {family['type']}"
+    yield from _render_samples(family)
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> dict:
+        return {
+            'name': self.name, 'type': 'counter', 'help': self.documentation, 'labels': self.labels,
+            'values': list(self._values.items()),
+        }
+
+    def render(self):
+        yield from _render_family(self.snapshot())
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [счетчики по бакетам..., +Inf, сумма]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value, *labels):
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def snapshot(self) -> dict:
+        return {
+            'name': self.name, 'type': 'histogram', 'help': self.documentation, 'labels': self.labels,
+            'buckets': self.buckets, 'values': [(labels, list(series)) for labels, series in self._values.items()],
+        }
+
+    def render(self):
+        yield from _render_family(self.snapshot())
+
+
+class Gauge:
+    """Значение снимается функцией при каждом запросе: число или {кортеж меток: число}"""
+
+    def __init__(self, name, documentation, labels=(), collect=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def snapshot(self) -> Optional[dict]:
+        if self.collect is None:
+            return None
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return {
+            'name': self.name, 'type': 'gauge', 'help': self.documentation, 'labels': self.labels,
+            'values': list(values.items()),
+        }
+
+    def render(self):
+        family = self.snapshot()
+        if family is not None:
+            yield from _render_family(family)
+
+
+# ===== РЕЕСТР =====
+handler_duration = Histogram('bot_handler_duration_seconds', 'Время работы обработчика', ('handler', 'state'))
+handler_errors = Counter('bot_handler_errors_total', 'Исключения в обработчиках', ('handler',))
+db_query_duration = Histogram('bot_db_query_duration_seconds', 'Время запроса к базе', ('query',))
+db_errors = Counter('bot_db_errors_total', 'Ошибки запросов к базе', ('query', 'error'))
+api_duration = Histogram('bot_api_request_duration_seconds', 'Время вызова Bot API', ('method',))
+api_errors = Counter('bot_api_errors_total', 'Ошибки вызовов Bot API', ('method', 'error'))
+loop_lag = Histogram(
+    'bot_event_loop_lag_seconds', 'Опоздание event loop относительно таймера',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+REGISTRY = [handler_duration, handler_errors, db_query_duration, db_errors, api_duration, api_errors, loop_lag]
+
+
+def register_gauge(name, documentation, collect, labels=()):
+    # Повторная регистрация (перезапуск main в тестах) заменяет датчик
+    REGISTRY[:] = [metric for metric in REGISTRY if metric.name != name]
+    REGISTRY.append(Gauge(name, documentation, labels, collect))
+
+
+# Метрики других процессов: метка -> функция, возвращающая {значение метки: снимок}
+SOURCES: Dict[str, Callable[[], Dict[Any, List[dict]]]] = {}
+
+
+def register_source(label: str, collect: Callable[[], Dict[Any, List[dict]]]):
+    SOURCES[label] = collect
+
+
+def snapshot() -> List[dict]:
+    """Текущие значения всех метрик процесса; сериализуется в JSON для передачи приемнику"""
+    return [family for family in (metric.snapshot() for metric in REGISTRY) if family is not None]
+
+
+def render() -> str:
+    # Одно имя из разных процессов выводится одним семейством: повторный TYPE Prometheus не примет
+    groups: Dict[str, list] = {}
+    for family in snapshot():
+        groups.setdefault(family['name'], []).append(((), (), family))
+    for label, collect in SOURCES.items():
+        for value, families in collect().items():
+            for family in families:
+                groups.setdefault(family['name'], []).append(((label,), (value,), family))
+    lines = []
+    for parts in groups.values():
+        first = parts[0][2]
+        lines.append(f"# HELP {first['name']} {first['help']}")
+        lines.append(f"# TYPE {first['name']} {first['type']}")
+        for names, values, family in parts:
+            lines.extend(_render_samples(family, names, values))
+    return '\n'.join(lines) + '\n'
+
+
+_QUERY_OPERATION_RE = re.compile(r'\b(SELECT|INSERT|UPDATE|DELETE)\b', re.I)
+# Таблица ищется от ключевого слова самой операции: у UPDATE ... FROM и SELECT ... FOR UPDATE другие таблицы не в счет
+_QUERY_TABLE_RES = {
+    'SELECT': re.compile(r'SELECT\b.*?\bFROM\s+"?(\w+)', re.S | re.I),
+    'INSERT': re.compile(r'INSERT\s+INTO\s+"?(\w+)', re.I),
+    'UPDATE': re.compile(r'UPDATE\s+"?(\w+)', re.I),
+    'DELETE': re.compile(r'DELETE\s+FROM\s+"?(\w+)', re.I),
+}
+
+
+@lru_cache(maxsize=512)
+def query_label(query: str) -> str:
+    """Короткая метка запроса: первая операция и ее таблица ('SELECT users', 'UPDATE broadcast_queue')"""
+    operation = _QUERY_OPERATION_RE.search(query)
+    if operation is None:
+        return query.split(None, 1)[0].upper() if query.strip() else 'EMPTY'
+    name = operation.group(1).upper()
+    table = _QUERY_TABLE_RES[name].match(query, operation.start())
+    return f"{name} {table.group(1)}" if table else name
+
+
+# ===== MIDDLEWARE =====
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: меряет выбранный обработчик с меткой состояния FSM"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = handler_object.callback.__name__ if handler_object else 'unknown'
+        state = data.get('raw_state') or ''
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_duration.observe(time.perf_counter() - start, name, state)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время и ошибки самих HTTP-вызовов Bot API"""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            api_duration.observe(time.perf_counter() - start, name)
+
+
+# ===== EVENT LOOP =====
+async def monitor_loop_lag(interval=METRICS_LOOP_LAG_INTERVAL):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(0.0, time.perf_counter() - start - interval))
+
+
+# ===== HTTP =====
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+
+def setup_metrics_routes(app: web.Application):
+    app.router.add_get('/metrics', metrics_handler)
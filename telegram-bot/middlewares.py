@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+
+from cache import MISSING, TTLCache
+from config import (
+    THROTTLE_RATE, THROTTLE_BURST, THROTTLE_IDLE_TTL, TOGGLE_DEBOUNCE,
+    UPDATE_DEDUP_SIZE, UPDATE_DEDUP_WINDOW,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator(BaseMiddleware):
+    """
+    Пропуск повторно доставленных апдейтов (внешний middleware на dp.update).
+
+    update_id запоминается до запуска обработчиков в LRU-кэше на size
+    записей и window секунд. С db (UPDATE_DEDUP_DB) он еще вставляется в
+    processed_updates, так что повтор отсекается и в другом процессе, и
+    после рестарта. Если обработка упала, id забывается: повтор
+    обработается заново. Недоступная база проверку не блокирует.
+    """
+
+    def __init__(self, db=None, size=UPDATE_DEDUP_SIZE, window=UPDATE_DEDUP_WINDOW):
+        self.db = db
+        self.window = window
+        self._seen = TTLCache(size, window)
+        self._next_cleanup = time.monotonic() + window
+        self._cleanup_task = None
+        self.skipped = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_id = event.update_id
+        if self._seen.get(update_id) is not MISSING:
+            self.skipped += 1
+            return None
+        self._seen.put(update_id, True)
+
+        if self.db is not None:
+            try:
+                claimed = await self.db.claim_update(update_id)
+            except Exception as e:
+                logger.warning("Не удалось отметить апдейт %s в базе: %s", update_id, e)
+                claimed = True
+            if not claimed:
+                self.skipped += 1
+                return None
+            self._maybe_cleanup()
+
+        try:
+            return await handler(event, data)
+        except Exception:
+            self._seen.invalidate(update_id)
+            if self.db is not None:
+                try:
+                    await self.db.release_update(update_id)
+                except Exception as e:
+                    logger.warning("Не удалось снять отметку апдейта %s: %s", update_id, e)
+            raise
+
+    def _maybe_cleanup(self):
+        # Старые отметки удаляются в фоне раз в window, не задерживая апдейт
+        now = time.monotonic()
+        if now < self._next_cleanup or (self._cleanup_task is not None and not self._cleanup_task.done()):
+            return
+        self._next_cleanup = now + self.window
+        self._cleanup_task = asyncio.create_task(self._cleanup())
+
+    async def _cleanup(self):
+        try:
+            await self.db.cleanup_processed_updates(self.window)
+        except Exception as e:
+            logger.warning("Не удалось очистить processed_updates: %s", e)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничение частоты апдейтов от одного пользователя (token bucket).
+
+    На пользователя хранится только пара (токены, время последнего
+    пересчета). Лишние сообщения молча отбрасываются, лишним нажатиям
+    кнопок отвечаем пустым answer(), чтобы у пользователя не висели
+    часики. Колбэки с префиксами из merge_prefixes не режутся: их
+    склеивает ToggleDebouncer. Бакеты пользователей, молчащих дольше
+    idle_ttl, периодически удаляются.
+    """
+
+    def __init__(self, rate=THROTTLE_RATE, burst=THROTTLE_BURST, idle_ttl=THROTTLE_IDLE_TTL,
+                 merge_prefixes=("toggle_", "order_toggle_")):
+        self.rate = rate
+        self.burst = burst
+        self.idle_ttl = idle_ttl
+        self.merge_prefixes = tuple(merge_prefixes)
+        self._buckets: Dict[int, tuple] = {}
+        self._next_sweep = time.monotonic() + idle_ttl
+        self.dropped = 0
+
+    def allow(self, user_id: int) -> bool:
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        tokens, last = self._buckets.get(user_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens < 1:
+            self._buckets[user_id] = (tokens, now)
+            return False
+        self._buckets[user_id] = (tokens - 1, now)
+        return True
+
+    def _sweep(self, now: float):
+        border = now - self.idle_ttl
+        self._buckets = {user_id: bucket for user_id, bucket in self._buckets.items() if bucket[1] > border}
+        self._next_sweep = now + self.idle_ttl
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        if isinstance(event, CallbackQuery) and event.data and event.data.startswith(self.merge_prefixes):
+            return await handler(event, data)
+
+        if not self.allow(user.id):
+            self.dropped += 1
+            if isinstance(event, CallbackQuery):
+                await event.answer()
+            return None
+        return await handler(event, data)
+
+
+class _PendingToggle:
+    __slots__ = ('selected', 'shown', 'state', 'raw_state', 'field', 'message', 'keyboard', 'task')
+
+    def __init__(self, selected, state, raw_state, field, message, keyboard):
+        self.selected = selected
+        self.shown = frozenset(selected)
+        self.state = state
+        self.raw_state = raw_state
+        self.field = field
+        self.message = message
+        self.keyboard = keyboard
+        self.task = None
+
+
+class ToggleDebouncer:
+    """
+    Склейка быстрых нажатий на переключатели (виды работ).
+
+    Первое нажатие читает выбор из FSM, следующие в течение window секунд
+    меняют его только в памяти. По истечении окна итог пишется в FSM одним
+    update_data и показывается одним edit_reply_markup - и только если
+    клавиатура действительно изменилась. Обработчик, которому нужен
+    актуальный выбор (подтверждение), сначала вызывает flush().
+    """
+
+    def __init__(self, window=TOGGLE_DEBOUNCE):
+        self.window = window
+        self._pending: Dict[tuple, _PendingToggle] = {}
+
+    async def toggle(self, callback: CallbackQuery, state: FSMContext, field: str, item: str,
+                     keyboard: Callable[[list], Any]):
+        key = (callback.from_user.id, callback.message.message_id)
+        pending = self._pending.get(key)
+        if pending is None:
+            data = await state.get_data()
+            loaded = _PendingToggle(
+                list(data.get(field, [])), state, await state.get_state(), field, callback.message, keyboard
+            )
+            # Параллельное нажатие могло завести запись, пока мы читали FSM
+            pending = self._pending.setdefault(key, loaded)
+            if pending is loaded:
+                pending.task = asyncio.create_task(self._flush_later(key))
+
+        if item in pending.selected:
+            pending.selected.remove(item)
+        else:
+            pending.selected.append(item)
+
+    async def _flush_later(self, key: tuple):
+        await asyncio.sleep(self.window)
+        try:
+            await self.flush(key, from_timer=True)
+        except TelegramAPIError as e:
+            logger.warning("Не удалось обновить клавиатуру выбора: %s", e)
+
+    async def flush(self, key: tuple, from_timer: bool = False):
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        if not from_timer:
+            pending.task.cancel()
+
+        # Пока шло окно, пользователь мог уйти с шага (Назад/Отмена)
+        if await pending.state.get_state() != pending.raw_state:
+            return
+        await pending.state.update_data({pending.field: pending.selected})
+        if frozenset(pending.selected) != pending.shown:
+            await pending.message.edit_reply_markup(reply_markup=pending.keyboard(pending.selected))
+
+    async def flush_message(self, message: Message, user_id: int):
+        await self.flush((user_id, message.message_id))
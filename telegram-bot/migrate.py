@@ -0,0 +1,128 @@
+"""
+Миграции схемы: python migrate.py
+
+Файлы migrations/NNN_название.sql применяются по возрастанию номера,
+примененные версии записываются в schema_version. Миграция с первой
+строкой "-- no-transaction" выполняется по одному выражению вне
+транзакции (нужно для CREATE INDEX CONCURRENTLY; выражения разделяются
+';' в конце строки), остальные - целиком в одной транзакции.
+
+Упавшую миграцию можно просто запустить снова. Прерванный CREATE INDEX
+CONCURRENTLY оставляет индекс в состоянии INVALID, и IF NOT EXISTS его бы
+пропустил: такой индекс удаляется перед повторным созданием.
+"""
+import asyncio
+import os
+import re
+
+import psycopg
+from psycopg.rows import tuple_row
+
+from config import DATABASE_URL
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+NO_TRANSACTION = '-- no-transaction'
+_CONCURRENT_INDEX_RE = re.compile(
+    r'^CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)', re.I
+)
+# Любое число, общее для всех экземпляров: два migrate.py не пойдут параллельно
+LOCK_ID = 727401
+
+
+class Migration:
+    __slots__ = ('version', 'name', 'sql')
+
+    def __init__(self, version, name, sql):
+        self.version = version
+        self.name = name
+        self.sql = sql
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.lstrip().startswith(NO_TRANSACTION)
+
+    def statements(self) -> list:
+        body = "\n".join(line for line in self.sql.splitlines() if not line.strip().startswith('--'))
+        return [stmt.strip() for stmt in re.split(r';\s*$', body, flags=re.MULTILINE) if stmt.strip()]
+
+
+def load_migrations(directory=MIGRATIONS_DIR) -> list:
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = re.match(r'^(\d+)_(\w+)\.sql$', filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), encoding='utf-8') as f:
+            migrations.append(Migration(int(match.group(1)), match.group(2), f.read()))
+    return migrations
+
+
+async def get_applied_versions(conn) -> set:
+    # Курсор с кортежами: соединение может прийти из пула бота с dict_row
+    cur = conn.cursor(row_factory=tuple_row)
+    await cur.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if not (await cur.fetchone())[0]:
+        return set()
+    await cur.execute("SELECT version FROM schema_version")
+    return {row[0] for row in await cur.fetchall()}
+
+
+async def drop_invalid_index(conn, statement: str):
+    """Перед CREATE INDEX CONCURRENTLY IF NOT EXISTS удалить оставшийся от сбоя INVALID-индекс с тем же именем"""
+    match = _CONCURRENT_INDEX_RE.match(statement)
+    if not match:
+        return
+    cur = conn.cursor(row_factory=tuple_row)
+    await cur.execute(
+        "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (match.group(1),)
+    )
+    row = await cur.fetchone()
+    if row and row[0]:
+        print(f"⚠️ Индекс {match.group(1)} остался недостроенным после сбоя, пересоздаю")
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+
+
+async def get_pending_migrations(conn) -> list:
+    applied = await get_applied_versions(conn)
+    return [m for m in load_migrations() if m.version not in applied]
+
+
+async def migrate(dsn=DATABASE_URL):
+    async with await psycopg.AsyncConnection.connect(dsn, autocommit=True) as conn:
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT NOW()
+            )
+        ''')
+        await conn.execute("SELECT pg_advisory_lock(%s)", (LOCK_ID,))
+        try:
+            pending = await get_pending_migrations(conn)
+            if not pending:
+                print("✅ Схема актуальна")
+                return
+
+            for migration in pending:
+                print(f"⏳ Миграция {migration.version:03d}_{migration.name}")
+                record = ("INSERT INTO schema_version (version, name) VALUES (%s, %s)",
+                          (migration.version, migration.name))
+                if migration.transactional:
+                    # Файл целиком одним запросом: в телах функций тоже есть ';'
+                    async with conn.transaction():
+                        await conn.execute(migration.sql)
+                        await conn.execute(*record)
+                else:
+                    # Выражения должны быть идемпотентны (IF NOT EXISTS):
+                    # при сбое миграция перезапускается с начала
+                    for statement in migration.statements():
+                        await drop_invalid_index(conn, statement)
+                        await conn.execute(statement)
+                    await conn.execute(*record)
+            print(f"✅ Применено миграций: {len(pending)}")
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(%s)", (LOCK_ID,))
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,72 @@
+-- Исходная схема. IF NOT EXISTS: на старых базах таблицы уже созданы ботом
+
+-- Пользователи
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    telegram_id BIGINT UNIQUE,
+    username TEXT,
+    full_name TEXT,
+    phone TEXT,
+    birth_date TEXT,
+    inn TEXT,
+    account_number TEXT,
+    passport TEXT,
+    work_type TEXT[],
+    agreed_to_terms BOOLEAN DEFAULT FALSE,
+    agreed_to_rules BOOLEAN DEFAULT FALSE,
+    registration_stage INTEGER DEFAULT 1,
+    is_active BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Заявки
+CREATE TABLE IF NOT EXISTS orders (
+    id SERIAL PRIMARY KEY,
+    description TEXT NOT NULL,
+    admin_id BIGINT,
+    status TEXT DEFAULT 'active',
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS work_types TEXT[];
+
+-- Очередь рассылки заявок
+CREATE TABLE IF NOT EXISTS broadcast_queue (
+    id BIGSERIAL PRIMARY KEY,
+    order_id INTEGER REFERENCES orders(id),
+    chat_id BIGINT NOT NULL,
+    status TEXT DEFAULT 'pending',
+    message_id BIGINT,
+    error TEXT,
+    claimed_at TIMESTAMP,
+    sent_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT NOW(),
+    UNIQUE (order_id, chat_id)
+);
+
+-- Отклики на заявки
+CREATE TABLE IF NOT EXISTS order_responses (
+    id SERIAL PRIMARY KEY,
+    order_id INTEGER REFERENCES orders(id),
+    user_id BIGINT REFERENCES users(telegram_id),
+    status TEXT DEFAULT 'responded',
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Состояния FSM (см. storage.PostgresStorage)
+CREATE TABLE IF NOT EXISTS fsm_states (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data JSONB NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Администраторы
+CREATE TABLE IF NOT EXISTS admins (
+    id SERIAL PRIMARY KEY,
+    telegram_id BIGINT UNIQUE,
+    username TEXT,
+    full_name TEXT,
+    role TEXT DEFAULT 'admin',
+    created_at TIMESTAMP DEFAULT NOW()
+);
@@ -0,0 +1,28 @@
+-- no-transaction
+-- Индексы под горячие запросы. CONCURRENTLY не блокирует запись в таблицы,
+-- но не работает внутри транзакции, поэтому выражения выполняются по одному
+
+-- Дубли откликов мешают уникальному индексу: оставляем самый ранний
+DELETE FROM order_responses a USING order_responses b
+WHERE a.order_id = b.order_id AND a.user_id = b.user_id AND a.id > b.id;
+
+-- Один отклик исполнителя на заявку, основа для ON CONFLICT DO NOTHING
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS order_responses_order_user_key
+ON order_responses (order_id, user_id);
+
+-- Выборки заявок по статусу (закрытие, архивирование)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_status_created_idx
+ON orders (status, created_at);
+
+-- Лента активных заявок: index-only scan по ключу (created_at, id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_active_feed_idx
+ON orders (created_at DESC, id DESC) INCLUDE (description)
+WHERE status = 'active';
+
+-- Подбор исполнителей для рассылки: work_type && ARRAY[...]
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_active_work_type_idx
+ON users USING GIN (work_type) WHERE is_active;
+
+-- Очередь рассылки: только неотправленные строки
+CREATE INDEX CONCURRENTLY IF NOT EXISTS broadcast_queue_pending_idx
+ON broadcast_queue (id) WHERE status = 'pending';
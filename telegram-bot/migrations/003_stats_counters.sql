@@ -0,0 +1,90 @@
+-- Счетчики для /stats. Их ведут триггеры уровня выражения на users, orders
+-- и order_responses, так что любая запись (в том числе пачкой) обновляет
+-- счетчики в той же транзакции, а /stats читает пару маленьких таблиц
+
+CREATE TABLE stats_counters (
+    name TEXT PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE stats_daily (
+    day DATE NOT NULL,
+    name TEXT NOT NULL,
+    value BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, name)
+);
+
+-- ===== Пользователи: воронка по registration_stage, всего и активных =====
+CREATE FUNCTION stats_users_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO stats_counters (name, value)
+    SELECT name, SUM(delta) FROM (
+        SELECT 'stage:' || COALESCE(registration_stage, 0) AS name, 1 AS delta FROM new_rows
+        UNION ALL SELECT 'users:total', 1 FROM new_rows
+        UNION ALL SELECT 'users:active', 1 FROM new_rows WHERE is_active
+    ) d GROUP BY name
+    ON CONFLICT (name) DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE FUNCTION stats_users_update() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO stats_counters (name, value)
+    SELECT name, SUM(delta) FROM (
+        SELECT 'stage:' || COALESCE(registration_stage, 0) AS name, -1 AS delta FROM old_rows
+        UNION ALL SELECT 'stage:' || COALESCE(registration_stage, 0), 1 FROM new_rows
+        UNION ALL SELECT 'users:active', -1 FROM old_rows WHERE is_active
+        UNION ALL SELECT 'users:active', 1 FROM new_rows WHERE is_active
+    ) d GROUP BY name HAVING SUM(delta) <> 0
+    ON CONFLICT (name) DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE FUNCTION stats_users_delete() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO stats_counters (name, value)
+    SELECT name, SUM(delta) FROM (
+        SELECT 'stage:' || COALESCE(registration_stage, 0) AS name, -1 AS delta FROM old_rows
+        UNION ALL SELECT 'users:total', -1 FROM old_rows
+        UNION ALL SELECT 'users:active', -1 FROM old_rows WHERE is_active
+    ) d GROUP BY name
+    ON CONFLICT (name) DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE TRIGGER stats_users_insert AFTER INSERT ON users
+REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_users_insert();
+
+CREATE TRIGGER stats_users_update AFTER UPDATE ON users
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_users_update();
+
+CREATE TRIGGER stats_users_delete AFTER DELETE ON users
+REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_users_delete();
+
+-- ===== Заявки и отклики по дням =====
+CREATE FUNCTION stats_daily_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO stats_daily (day, name, value)
+    SELECT COALESCE(created_at, NOW())::date, TG_ARGV[0], COUNT(*) FROM new_rows GROUP BY 1
+    ON CONFLICT (day, name) DO UPDATE SET value = stats_daily.value + EXCLUDED.value;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE TRIGGER stats_orders_insert AFTER INSERT ON orders
+REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_daily_insert('orders');
+
+CREATE TRIGGER stats_responses_insert AFTER INSERT ON order_responses
+REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_daily_insert('responses');
+
+-- ===== Начальные значения из уже накопленных данных =====
+LOCK TABLE users, orders, order_responses IN SHARE ROW EXCLUSIVE MODE;
+
+INSERT INTO stats_counters (name, value)
+SELECT 'stage:' || COALESCE(registration_stage, 0), COUNT(*) FROM users GROUP BY 1
+UNION ALL SELECT 'users:total', COUNT(*) FROM users
+UNION ALL SELECT 'users:active', COUNT(*) FROM users WHERE is_active;
+
+INSERT INTO stats_daily (day, name, value)
+-- created_at в старых строках может быть NULL, а day - NOT NULL: как в триггерах, считаем их сегодняшними
+SELECT COALESCE(created_at, NOW())::date, 'orders', COUNT(*) FROM orders GROUP BY 1
+UNION ALL SELECT COALESCE(created_at, NOW())::date, 'responses', COUNT(*) FROM order_responses GROUP BY 1;
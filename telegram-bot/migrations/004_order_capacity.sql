@@ -0,0 +1,20 @@
+-- Сколько исполнителей нужно на заявку. capacity NULL - без ограничения
+-- (все старые заявки), отклики на такие заявки по-прежнему копит ResponseBuffer.
+--
+-- Места заявки - отдельные строки order_slots, создаются вместе с заявкой.
+-- Отклик занимает свободную строку через FOR UPDATE SKIP LOCKED: сотни
+-- одновременных нажатий не выстраиваются в очередь на одной строке orders,
+-- а больше capacity мест занять нельзя физически
+
+ALTER TABLE orders ADD COLUMN capacity INTEGER CHECK (capacity > 0);
+
+CREATE TABLE order_slots (
+    order_id INTEGER NOT NULL REFERENCES orders(id),
+    slot SMALLINT NOT NULL,
+    user_id BIGINT REFERENCES users(telegram_id),
+    taken_at TIMESTAMP,
+    PRIMARY KEY (order_id, slot)
+);
+
+-- Одному исполнителю не больше одного места в заявке (NULL - свободные места)
+CREATE UNIQUE INDEX order_slots_order_user_key ON order_slots (order_id, user_id);
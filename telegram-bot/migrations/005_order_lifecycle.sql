@@ -0,0 +1,39 @@
+-- Жизненный цикл заявок (см. lifecycle.py): срок действия, закрытие и архив.
+--
+-- Просроченные заявки закрываются пачками, разосланные по ним сообщения
+-- ставятся в broadcast_queue со статусом 'closing' и редактируются.
+-- Закрытые давно заявки вместе с откликами переезжают в архивные таблицы,
+-- секционированные по месяцам, поэтому orders и order_responses остаются
+-- маленькими
+
+ALTER TABLE orders ADD COLUMN expires_at TIMESTAMP;
+ALTER TABLE orders ADD COLUMN closed_at TIMESTAMP;
+
+-- Старым заявкам тот же срок, что у новых по умолчанию (ORDER_TTL_HOURS = 72)
+UPDATE orders SET expires_at = COALESCE(created_at, NOW()) + INTERVAL '72 hours' WHERE status = 'active';
+UPDATE orders SET closed_at = COALESCE(created_at, NOW()) WHERE status <> 'active';
+
+CREATE INDEX orders_active_expires_idx ON orders (expires_at) WHERE status = 'active';
+CREATE INDEX orders_closed_at_idx ON orders (closed_at) WHERE status = 'closed';
+CREATE INDEX broadcast_queue_closing_idx ON broadcast_queue (id) WHERE status = 'closing';
+
+-- Архив. Секции по месяцам создает lifecycle.py перед переносом
+CREATE TABLE orders_archive (
+    id INTEGER NOT NULL,
+    description TEXT NOT NULL,
+    admin_id BIGINT,
+    status TEXT,
+    created_at TIMESTAMP NOT NULL,
+    work_types TEXT[],
+    capacity INTEGER,
+    expires_at TIMESTAMP,
+    closed_at TIMESTAMP
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE order_responses_archive (
+    id INTEGER NOT NULL,
+    order_id INTEGER NOT NULL,
+    user_id BIGINT,
+    status TEXT,
+    created_at TIMESTAMP NOT NULL
+) PARTITION BY RANGE (created_at);
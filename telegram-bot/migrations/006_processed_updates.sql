@@ -0,0 +1,12 @@
+-- Обработанные апдейты: отсечение повторной доставки между процессами и
+-- после рестарта (UPDATE_DEDUP_DB=1). Таблица UNLOGGED: запись на каждый
+-- апдейт не идет в WAL, а потеря содержимого при сбое сервера безопасна -
+-- остается проверка в памяти процесса. Строки старше UPDATE_DEDUP_WINDOW
+-- удаляет бот
+
+CREATE UNLOGGED TABLE processed_updates (
+    update_id BIGINT PRIMARY KEY,
+    processed_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX processed_updates_processed_at_idx ON processed_updates (processed_at);
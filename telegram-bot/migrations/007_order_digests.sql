@@ -0,0 +1,13 @@
+-- Сводки откликов для админов (см. digest.py): одно сообщение на заявку,
+-- которое редактируется по мере новых откликов. Строка хранит id этого
+-- сообщения и сколько откликов в нем уже показано. claimed_until - аренда
+-- на время отправки, чтобы два процесса не прислали сводку дважды
+
+CREATE TABLE order_digests (
+    order_id INTEGER PRIMARY KEY REFERENCES orders(id),
+    admin_id BIGINT NOT NULL,
+    message_id BIGINT,
+    responses INTEGER NOT NULL DEFAULT 0,
+    claimed_until TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,20 @@
+-- no-transaction
+-- Полнотекстовый поиск по активным заявкам (/search и инлайн-режим).
+-- Вектор описания с русской морфологией хранится в generated-колонке,
+-- поэтому заявки из бота, импорта и старые строки индексируются одинаково.
+-- Добавление колонки переписывает orders под блокировкой, индекс строится
+-- без блокировки записи. IF NOT EXISTS - на случай повтора после сбоя
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS search_vector tsvector
+GENERATED ALWAYS AS (to_tsvector('russian', COALESCE(description, ''))) STORED;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_active_search_idx
+ON orders USING GIN (search_vector)
+WHERE status = 'active';
+
+-- Слово, которого нет в статистике, планировщик оценивает по самому редкому
+-- из собранных. С коротким списком эта оценка завышена, и редкий или
+-- несуществующий запрос идет перебором ленты по created_at вместо GIN
+ALTER TABLE orders ALTER COLUMN search_vector SET STATISTICS 1000;
+
+ANALYZE orders;
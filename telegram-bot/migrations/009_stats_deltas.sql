@@ -0,0 +1,57 @@
+-- Счетчики /stats без горячих строк. Триггеры из 003 обновляли одни и те
+-- же строки stats_counters/stats_daily (stage:N, отклики за сегодня) в
+-- транзакции каждой записи: регистрации и отклики ждали друг друга на
+-- блокировке этих строк, а выражения с пересекающимися наборами счетчиков
+-- могли взять их в разном порядке и упасть в deadlock. Теперь триггеры
+-- только дописывают приращения в stats_deltas, а сворачивает их в счетчики
+-- обслуживание заявок (Database.fold_stats); /stats складывает счетчики с
+-- еще не свернутыми приращениями
+
+CREATE TABLE stats_deltas (
+    id BIGSERIAL PRIMARY KEY,
+    -- NULL - приращение stats_counters, иначе stats_daily за этот день
+    day DATE,
+    name TEXT NOT NULL,
+    delta BIGINT NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION stats_users_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO stats_deltas (name, delta)
+    SELECT name, SUM(delta) FROM (
+        SELECT 'stage:' || COALESCE(registration_stage, 0) AS name, 1 AS delta FROM new_rows
+        UNION ALL SELECT 'users:total', 1 FROM new_rows
+        UNION ALL SELECT 'users:active', 1 FROM new_rows WHERE is_active
+    ) d GROUP BY name;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_users_update() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO stats_deltas (name, delta)
+    SELECT name, SUM(delta) FROM (
+        SELECT 'stage:' || COALESCE(registration_stage, 0) AS name, -1 AS delta FROM old_rows
+        UNION ALL SELECT 'stage:' || COALESCE(registration_stage, 0), 1 FROM new_rows
+        UNION ALL SELECT 'users:active', -1 FROM old_rows WHERE is_active
+        UNION ALL SELECT 'users:active', 1 FROM new_rows WHERE is_active
+    ) d GROUP BY name HAVING SUM(delta) <> 0;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_users_delete() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO stats_deltas (name, delta)
+    SELECT name, SUM(delta) FROM (
+        SELECT 'stage:' || COALESCE(registration_stage, 0) AS name, -1 AS delta FROM old_rows
+        UNION ALL SELECT 'users:total', -1 FROM old_rows
+        UNION ALL SELECT 'users:active', -1 FROM old_rows WHERE is_active
+    ) d GROUP BY name;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_daily_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO stats_deltas (day, name, delta)
+    SELECT COALESCE(created_at, NOW())::date, TG_ARGV[0], COUNT(*) FROM new_rows GROUP BY 1;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
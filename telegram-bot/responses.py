@@ -0,0 +1,82 @@
+import asyncio
+import logging
+
+from config import RESPONSE_FLUSH_INTERVAL, RESPONSE_BATCH
+from health import Deadline
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseBuffer:
+    """
+    Буфер откликов на заявки.
+
+    Обработчик кнопки только кладет пару (order_id, user_id) в множество и
+    сразу отвечает пользователю. Раз в flush_interval секунд (или при
+    batch_size накопленных откликов) все пары пишутся одним INSERT ...
+    SELECT FROM unnest ... ON CONFLICT DO NOTHING, так что повторные
+    нажатия ничего не стоят ни в памяти, ни в базе. Новые отклики
+    передаются в digest (сводки для админов).
+    """
+
+    def __init__(self, db, flush_interval=RESPONSE_FLUSH_INTERVAL, batch_size=RESPONSE_BATCH, digest=None):
+        self.db = db
+        self.digest = digest
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = set()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5):
+        """Дописать накопленное и остановиться за timeout секунд; текущий сброс не прерывается"""
+        deadline = Deadline(timeout)
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            done, _ = await asyncio.wait([self._task], timeout=deadline.remaining())
+            if not done:
+                self._task.cancel()
+                await asyncio.wait([self._task], timeout=deadline.remaining())
+        try:
+            await asyncio.wait_for(self.flush(), deadline.remaining())
+        except asyncio.TimeoutError:
+            logger.error("Не успели сохранить откликов: %s", len(self._pending))
+            raise
+
+    def add(self, order_id: int, user_id: int):
+        self._pending.add((order_id, user_id))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Не удалось сохранить отклики: %s", e)
+
+    async def flush(self) -> list:
+        if not self._pending:
+            return []
+        pending, self._pending = self._pending, set()
+        try:
+            inserted = await self.db.insert_responses(list(pending))
+        except BaseException:
+            # Вернем в буфер, запишем при следующем сбросе (и если сброс отменили)
+            self._pending |= pending
+            raise
+        if self.digest is not None:
+            for row in inserted:
+                self.digest.add(row['order_id'])
+        return inserted
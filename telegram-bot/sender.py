@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import OUTBOUND_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST, OUTBOUND_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+
+# Полоса текущей задачи: ответы пользователям по умолчанию, рассылки - через bulk_lane()
+current_lane: ContextVar[int] = ContextVar('current_lane', default=INTERACTIVE)
+
+
+@contextmanager
+def bulk_lane():
+    token = current_lane.set(BULK)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+class OutboundDispatcher(BaseRequestMiddleware):
+    """
+    Единая очередь исходящих запросов к Bot API (middleware сессии бота).
+
+    Через нее идут все методы с chat_id: message.answer, edit_text,
+    send_message рассылки и т.д. Каждый запрос сначала ждет свой чат
+    (token bucket chat_rate/chat_burst), затем слот общего лимита rate в
+    секунду. Слоты выдаются сначала интерактивной полосе, потом массовой,
+    так что рассылка не задерживает ответы пользователям. На 429 отправка
+    ставится на паузу для всех на retry_after, запрос повторяется.
+    """
+
+    def __init__(self, rate=OUTBOUND_RATE, chat_rate=OUTBOUND_CHAT_RATE, chat_burst=OUTBOUND_CHAT_BURST,
+                 max_retries=OUTBOUND_MAX_RETRIES):
+        self.interval = 1 / rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._lanes = (deque(), deque())
+        self._chats = {}
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._pump_task = None
+        self.retries = 0
+
+    @property
+    def depth(self) -> tuple:
+        """Длина очереди: (интерактивная, массовая)"""
+        return len(self._lanes[INTERACTIVE]), len(self._lanes[BULK])
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        lane = current_lane.get()
+        attempt = 0
+        while True:
+            await self._wait_chat(chat_id)
+            await self._wait_slot(lane)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retries += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning("429 от Telegram, пауза %s с", e.retry_after)
+
+    # ===== ЛИМИТ НА ЧАТ =====
+    async def _wait_chat(self, chat_id):
+        while True:
+            now = time.monotonic()
+            tokens, last = self._chats.get(chat_id, (self.chat_burst, now))
+            tokens = min(self.chat_burst, tokens + (now - last) * self.chat_rate)
+            if tokens >= 1:
+                self._chats[chat_id] = (tokens - 1, now)
+                if len(self._chats) > 10000:
+                    self._sweep_chats(now)
+                return
+            self._chats[chat_id] = (tokens, now)
+            await asyncio.sleep((1 - tokens) / self.chat_rate)
+
+    def _sweep_chats(self, now):
+        # Чат с полным бакетом ничем не отличается от отсутствующего
+        full = self.chat_burst / self.chat_rate
+        self._chats = {chat: bucket for chat, bucket in self._chats.items() if now - bucket[1] < full}
+
+    # ===== ОБЩИЙ ЛИМИТ =====
+    async def _wait_slot(self, lane):
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[lane].append(future)
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        self._wakeup.set()
+        await future
+
+    async def _pump(self):
+        while True:
+            lane = self._lanes[INTERACTIVE] or self._lanes[BULK]
+            if not lane:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            start = max(self._next_slot, self._paused_until)
+            if start > now:
+                # После сна заново выбираем полосу: мог прийти интерактивный запрос
+                await asyncio.sleep(start - now)
+                continue
+
+            future = lane.popleft()
+            if future.done():
+                continue
+            future.set_result(None)
+            self._next_slot = now + self.interval
+
+    async def close(self):
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            await asyncio.gather(self._pump_task, return_exceptions=True)
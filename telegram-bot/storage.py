@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from psycopg.types.json import Jsonb
+
+from config import FSM_CACHE_SIZE, FSM_CACHE_TTL, FSM_STATE_TTL, FSM_FLUSH_INTERVAL, FSM_FLUSH_BATCH
+
+logger = logging.getLogger(__name__)
+
+
+class _Record:
+    __slots__ = ('state', 'data', 'expires_at')
+
+    def __init__(self, state, data, expires_at):
+        self.state = state
+        self.data = data
+        self.expires_at = expires_at
+
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM-хранилище в таблице fsm_states.
+
+    Горячие состояния живут в LRU-кэше процесса, изменения копятся в
+    _pending и пишутся в базу пачкой раз в flush_interval секунд (или
+    сразу, когда набралось flush_batch ключей). Запись старше ttl считается
+    пустой и периодически удаляется.
+
+    Отложенная запись рассчитана на одного писателя на ключ: апдейты
+    пользователя должны обрабатываться одним процессом (в многопроцессном
+    режиме это обеспечивает маршрутизация cluster.py по id пользователя),
+    иначе сброс одного процесса может затереть состояние, записанное
+    другим. Чистая запись кэша перечитывается из базы через cache_ttl
+    секунд, так что после перераспределения пользователей или переезда на
+    другой экземпляр устаревшее состояние живет не дольше этого срока.
+    """
+
+    def __init__(self, db, cache_size=FSM_CACHE_SIZE, ttl=FSM_STATE_TTL,
+                 flush_interval=FSM_FLUSH_INTERVAL, flush_batch=FSM_FLUSH_BATCH, cache_ttl=FSM_CACHE_TTL):
+        self.db = db
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.cache_ttl = min(cache_ttl, ttl)
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._cache: 'OrderedDict[str, _Record]' = OrderedDict()
+        self._pending: Dict[str, _Record] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._batch_flushes: Set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+        self._last_cleanup = 0.0
+
+    # ===== КЭШ =====
+    async def _get_record(self, key: StorageKey) -> _Record:
+        db_key = self.key_builder.build(key)
+        # Несброшенное изменение этого процесса новее базы; чистую запись кэша верим cache_ttl секунд
+        record = self._pending.get(db_key) or self._cache.get(db_key)
+        if record is not None and (db_key in self._pending or record.expires_at > time.monotonic()):
+            self._remember(db_key, record)
+            return record
+
+        row = await self.db.fetchone(
+            "SELECT state, data FROM fsm_states WHERE key = %s AND updated_at > NOW() - make_interval(secs => %s)",
+            (db_key, self.ttl), retry=True
+        )
+        # Пока шел запрос, ключ мог быть изменен: свежая запись в кэше важнее
+        record = self._pending.get(db_key) or self._cache.get(db_key)
+        if record is None or (db_key not in self._pending and record.expires_at <= time.monotonic()):
+            state, data = (row['state'], row['data']) if row else (None, {})
+            record = _Record(state, data, time.monotonic() + self.cache_ttl)
+        self._remember(db_key, record)
+        return record
+
+    def _remember(self, db_key: str, record: _Record) -> None:
+        self._cache[db_key] = record
+        self._cache.move_to_end(db_key)
+        while len(self._cache) > self.cache_size:
+            # Вытесненная грязная запись остается в _pending до сброса
+            self._cache.popitem(last=False)
+
+    def _mark_dirty(self, key: StorageKey, record: _Record) -> None:
+        record.expires_at = time.monotonic() + self.cache_ttl
+        db_key = self.key_builder.build(key)
+        self._remember(db_key, record)
+        self._pending[db_key] = record
+
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+        if len(self._pending) >= self.flush_batch:
+            task = asyncio.create_task(self.flush())
+            self._batch_flushes.add(task)
+            task.add_done_callback(self._batch_flushes.discard)
+
+    # ===== ИНТЕРФЕЙС BaseStorage =====
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get_record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._get_record(key)
+        record.data = data.copy()
+        self._mark_dirty(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get_record(key)).data.copy()
+
+    async def close(self) -> None:
+        # Сброс не отменяем, а дожидаемся: отмена посреди записи потеряла бы снятые с _pending изменения
+        self._stopping.set()
+        tasks = list(self._batch_flushes) + ([self._flusher] if self._flusher is not None else [])
+        if tasks:
+            await asyncio.wait(tasks)
+        await self.flush()
+
+    # ===== ОТЛОЖЕННАЯ ЗАПИСЬ =====
+    async def _flush_loop(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_cleanup > self.ttl / 24:
+                    self._last_cleanup = time.monotonic()
+                    await self.db.execute(
+                        "DELETE FROM fsm_states WHERE updated_at < NOW() - make_interval(secs => %s)", (self.ttl,),
+                        retry=True
+                    )
+            except Exception as e:
+                logger.error("Не удалось сбросить состояния FSM: %s", e)
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+
+        upserts = []
+        deletes = []
+        for db_key, record in pending.items():
+            if record.state is None and not record.data:
+                deletes.append((db_key,))
+            else:
+                upserts.append((db_key, record.state, Jsonb(record.data)))
+
+        try:
+            if upserts:
+                await self.db.executemany(
+                    '''INSERT INTO fsm_states (key, state, data, updated_at) VALUES (%s, %s, %s, NOW())
+                    ON CONFLICT (key) DO UPDATE SET state = EXCLUDED.state, data = EXCLUDED.data, updated_at = NOW()''',
+                    upserts, retry=True
+                )
+            if deletes:
+                await self.db.executemany("DELETE FROM fsm_states WHERE key = %s", deletes, retry=True)
+        except BaseException:
+            # Не теряем изменения (в том числе при отмене): вернем их, если за это время не пришли более новые
+            for db_key, record in pending.items():
+                self._pending.setdefault(db_key, record)
+            raise
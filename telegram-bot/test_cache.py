@@ -0,0 +1,64 @@
+import pytest
+
+import cache
+from cache import MISSING, TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_get_put_and_none_values(clock):
+    store = TTLCache(10, 60)
+    assert store.get('user') is MISSING
+    store.put('user', None)
+    # None - закэшированное "не найден", а не промах
+    assert store.get('user') is None
+    assert store.get('other', 'default') == 'default'
+    assert (store.hits, store.misses) == (1, 2)
+    assert store.hit_ratio == pytest.approx(1 / 3)
+
+
+def test_expiry(clock):
+    store = TTLCache(10, 60)
+    store.put('key', 1)
+    clock[0] += 59
+    assert store.get('key') == 1
+    clock[0] += 2
+    assert store.get('key') is MISSING
+    assert len(store) == 0
+
+
+def test_lru_eviction(clock):
+    store = TTLCache(2, 60)
+    store.put('a', 1)
+    store.put('b', 2)
+    store.get('a')
+    store.put('c', 3)
+    assert store.get('b') is MISSING
+    assert store.get('a') == 1
+    assert store.get('c') == 3
+
+
+def test_add_keeps_fresh_value(clock):
+    store = TTLCache(10, 60)
+    store.put('key', 'new')
+    store.add('key', 'from database')
+    assert store.get('key') == 'new'
+    clock[0] += 61
+    store.add('key', 'from database')
+    assert store.get('key') == 'from database'
+
+
+def test_invalidate_and_clear(clock):
+    store = TTLCache(10, 60)
+    store.put('a', 1)
+    store.put('b', 2)
+    store.invalidate('a')
+    store.invalidate('missing')
+    assert store.get('a') is MISSING
+    store.clear()
+    assert len(store) == 0
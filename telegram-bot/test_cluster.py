@@ -0,0 +1,31 @@
+from collections import Counter
+
+from cluster import HashRing
+
+USERS = range(100000, 120000)
+
+
+def test_ring_is_stable_across_instances():
+    # Приемник после перезапуска должен отправить пользователя в тот же процесс
+    first, second = HashRing(4), HashRing(4)
+    assert all(first.get(user) == second.get(user) for user in USERS)
+
+
+def test_ring_spreads_users():
+    ring = HashRing(4)
+    load = Counter(ring.get(user) for user in USERS)
+    assert set(load) == {0, 1, 2, 3}
+    assert max(load.values()) < 1.5 * len(USERS) / 4
+
+
+def test_adding_node_moves_few_users():
+    before, after = HashRing(4), HashRing(5)
+    moved = [user for user in USERS if before.get(user) != after.get(user)]
+    # Переезжают только пользователи нового процесса, примерно 1/5
+    assert all(after.get(user) == 4 for user in moved)
+    assert len(moved) < 0.3 * len(USERS)
+
+
+def test_single_node():
+    ring = HashRing(1)
+    assert {ring.get(user) for user in range(1000)} == {0}
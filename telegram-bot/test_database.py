@@ -0,0 +1,33 @@
+import asyncio
+
+from database import Database, normalize_search_query
+
+
+def test_normalize_search_query():
+    assert normalize_search_query('  Грузчик\n СКЛАД  ') == 'грузчик склад'
+    assert len(normalize_search_query('слово ' * 100)) == 200
+
+
+def test_is_order_active_caches_only_closed_orders():
+    db = Database(replica_dsns=[])
+    statuses = {1: True, 2: False}
+    queries = []
+
+    async def fetchone(query, params=None, replica=False, retry=False):
+        queries.append(params[0])
+        active = statuses.get(params[0])
+        return None if active is None else {'active': active}
+
+    db.fetchone = fetchone
+
+    async def scenario():
+        assert await db.is_order_active(1)
+        # Заявку закрыли в другом процессе: следующий отклик это увидит
+        statuses[1] = False
+        assert not await db.is_order_active(1)
+        assert not await db.is_order_active(1)
+        assert not await db.is_order_active(2)
+        assert not await db.is_order_active(3)
+
+    asyncio.run(scenario())
+    assert queries == [1, 1, 2, 3]
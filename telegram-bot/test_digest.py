@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+
+import digest
+from digest import AdminDigest
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self.edited = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append(chat_id)
+        return SimpleNamespace(message_id=100 + len(self.sent))
+
+    async def edit_message_text(self, text, chat_id, message_id):
+        self.edited.append(message_id)
+
+
+class FakeDatabase:
+    """order_digests одной заявки; finish_digests падает failures раз подряд"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.message_id = None
+        self.shown = 0
+        self.total = 1
+
+    async def ensure_digests(self, order_ids):
+        return order_ids
+
+    async def claim_digests(self, order_ids, lease, names):
+        return [{
+            'order_id': 7, 'admin_id': 1, 'message_id': self.message_id, 'shown': self.shown,
+            'total': self.total, 'capacity': None, 'description': 'Переезд', 'latest': [],
+        }]
+
+    async def finish_digests(self, results):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('connection lost')
+        for message_id, shown, order_id in results:
+            self.message_id, self.shown = message_id, shown
+
+
+def test_message_id_saved_after_transient_failure():
+    async def scenario():
+        bot, db = FakeBot(), FakeDatabase(failures=1)
+        admin_digest = AdminDigest(bot, db)
+        admin_digest.add(7)
+        await admin_digest.flush()
+        return bot, db
+
+    bot, db = asyncio.run(scenario())
+    assert bot.sent == [1]
+    assert db.message_id == 101
+
+
+def test_unsaved_message_id_is_written_before_next_window(monkeypatch):
+    monkeypatch.setattr(digest, 'FINISH_RETRY_WINDOW', 0)
+
+    async def scenario():
+        bot, db = FakeBot(), FakeDatabase(failures=1)
+        admin_digest = AdminDigest(bot, db)
+        admin_digest.add(7)
+        try:
+            await admin_digest.flush()
+        except ConnectionError:
+            pass
+        assert db.message_id is None
+
+        db.total = 2
+        admin_digest.add(7)
+        await admin_digest.flush()
+        return bot, db
+
+    bot, db = asyncio.run(scenario())
+    # Вторая сводка правит первое сообщение, а не шлет новое
+    assert bot.sent == [1]
+    assert bot.edited == [101]
+    assert (db.message_id, db.shown) == (101, 2)
@@ -0,0 +1,75 @@
+import asyncio
+import csv
+import io
+from datetime import datetime
+
+import pytest
+
+import export
+from export import EXPORT_COLUMNS, export_users_csv, parse_export_filters
+
+
+def test_parse_export_filters():
+    assert parse_export_filters(None) == {}
+    assert parse_export_filters('stage=9 work=Грузчик active=0') == {
+        'stage': 9, 'work_type': 'Грузчик', 'active': False,
+    }
+
+
+@pytest.mark.parametrize('args', ['stage=x', 'work=', 'active=yes', 'city=Москва', 'stage'])
+def test_parse_export_filters_rejects(args):
+    with pytest.raises(ValueError):
+        parse_export_filters(args)
+
+
+class FakeDatabase:
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.calls = []
+
+    async def stream_users(self, columns, stage=None, work_type=None, active=None, chunk_size=1000):
+        self.calls.append((columns, stage, work_type, active, chunk_size))
+        for chunk in self.chunks:
+            yield chunk
+        if self.error is not None:
+            raise self.error
+
+
+def user_row(telegram_id, work_type):
+    return (telegram_id, 'user', 'Иванов Иван Иванович', '+79991234567', '01.02.1990', '1' * 12, '2' * 20,
+            '3' * 10, work_type, 9, True, datetime(2024, 1, 2, 3, 4, 5))
+
+
+def test_export_users_csv():
+    db = FakeDatabase([[user_row(1, ['Грузчик', 'Хелпер'])], [user_row(2, None)]])
+    file, count = asyncio.run(export_users_csv(db, stage=9, chunk_size=1))
+    try:
+        file.seek(0)
+        raw = file.read()
+    finally:
+        file.close()
+
+    assert count == 2
+    assert db.calls == [(EXPORT_COLUMNS, 9, None, None, 1)]
+    # BOM - чтобы Excel открыл UTF-8 без вопросов
+    assert raw.startswith('﻿'.encode())
+    rows = list(csv.reader(io.StringIO(raw.decode('utf-8-sig'))))
+    assert rows[0] == list(EXPORT_COLUMNS)
+    assert rows[1][EXPORT_COLUMNS.index('work_type')] == 'Грузчик, Хелпер'
+    assert rows[2][EXPORT_COLUMNS.index('work_type')] == ''
+
+
+def test_export_closes_file_when_stream_fails(monkeypatch):
+    files = []
+    spooled = export.tempfile.SpooledTemporaryFile
+
+    def track(*args, **kwargs):
+        files.append(spooled(*args, **kwargs))
+        return files[-1]
+
+    monkeypatch.setattr(export.tempfile, 'SpooledTemporaryFile', track)
+    db = FakeDatabase([[user_row(1, [])]], error=ConnectionError('lost'))
+    with pytest.raises(ConnectionError):
+        asyncio.run(export_users_csv(db))
+    assert files[0].closed
@@ -0,0 +1,15 @@
+import health
+from health import Deadline
+
+
+def test_deadline_shares_one_budget(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(health.time, 'monotonic', lambda: now[0])
+    deadline = Deadline(10)
+    assert deadline.remaining() == 10
+    now[0] += 7
+    assert deadline.remaining() == 3
+    now[0] += 5
+    # Срок вышел: шагу все равно достается минимум, а не 0 или отрицательное время
+    assert deadline.remaining() == 0.1
+    assert deadline.remaining(minimum=0) == 0
@@ -0,0 +1,100 @@
+import csv
+import io
+
+import pytest
+
+from importer import DESCRIPTION_MAX, ERROR_VALUE_MAX, REPORT_MAX, format_import_report, parse_orders_csv
+
+
+def parse(text, encoding='utf-8', **kwargs):
+    return parse_orders_csv(io.BytesIO(text.encode(encoding)), **kwargs)
+
+
+def test_comma_delimiter():
+    rows, errors = parse("description,work_types,capacity,ttl_hours\nРазгрузка фуры,Грузчик,3,12\n")
+    assert errors == []
+    assert rows == [(2, 'Разгрузка фуры', ['Грузчик'], 3, 12.0)]
+
+
+def test_semicolon_delimiter_and_bom():
+    # Excel сохраняет CSV с BOM и точкой с запятой
+    rows, errors = parse("﻿Description;Work_Types\nСборка мебели, 2 этаж;Монтажник|хелпер\n")
+    assert errors == []
+    assert rows[0][1:3] == ('Сборка мебели, 2 этаж', ['Монтажник', 'Хелпер'])
+
+
+def test_defaults_for_empty_capacity_and_ttl():
+    rows, _ = parse("description,work_types,capacity,ttl_hours\nПереезд,Грузчик,,\n", default_ttl=24)
+    assert rows[0][3:] == (None, 24)
+
+
+def test_not_utf8():
+    with pytest.raises(ValueError, match='UTF-8'):
+        parse("description,work_types\nПереезд,Грузчик\n", encoding='cp1251')
+
+
+def test_malformed_csv():
+    # Незакрытая кавычка: все до конца файла - одно поле, длиннее предела модуля csv
+    with pytest.raises(ValueError, match='CSV'):
+        parse('description,work_types\n"' + 'x' * (csv.field_size_limit() + 1) + '\n')
+
+
+@pytest.mark.parametrize('header, message', [
+    ("work_types\n", 'description'),
+    ("description\n", 'work_types'),
+    ("description,work_types,price\n", 'price'),
+])
+def test_bad_header(header, message):
+    with pytest.raises(ValueError, match=message):
+        parse(header + "Переезд,Грузчик\n")
+
+
+def test_row_errors_keep_line_numbers_and_skip_blank_lines():
+    rows, errors = parse(
+        "description,work_types,capacity,ttl_hours\n"
+        "Переезд,Грузчик,,\n"
+        "\n"
+        ",Грузчик,,\n"
+        "Уборка,Дворник,,\n"
+        "Склад,Хелпер,9999,\n"
+        "Склад,Хелпер,,-1\n"
+        f"{'о' * (DESCRIPTION_MAX + 1)},Хелпер,,\n"
+        "Монтаж,Монтажник,1,2\n"
+    )
+    assert [row[0] for row in rows] == [2, 9]
+    assert [line for line, _ in errors] == [4, 5, 6, 7, 8]
+    assert 'описание' in errors[0][1]
+    assert errors[1][1] == 'неизвестный вид работ: Дворник'
+
+
+def test_long_cell_is_truncated_in_error():
+    _, errors = parse("description,work_types\nПереезд," + 'Ж' * 1000 + "\n")
+    message = errors[0][1]
+    assert message.endswith('…')
+    assert len(message) < ERROR_VALUE_MAX + 40
+
+
+def test_row_limit():
+    lines = ''.join(f"Заявка {number},Грузчик\n" for number in range(10))
+    rows, errors = parse("description,work_types\n" + lines, max_rows=3)
+    assert len(rows) == 3
+    assert errors == [(5, 'больше 3 строк, остаток файла пропущен')]
+
+
+def test_report_without_errors():
+    assert format_import_report(5, [], 20) == "✅ Импортировано заявок: 5"
+
+
+def test_report_shows_limited_number_of_errors():
+    errors = [(line, 'пустое описание') for line in range(2, 32)]
+    text = format_import_report(0, errors, 20)
+    assert text.count('Строка ') == 20
+    assert text.endswith('... и еще 10')
+
+
+def test_report_fits_one_message():
+    errors = [(line, 'x' * 500) for line in range(2, 102)]
+    text = format_import_report(0, errors, 100)
+    assert len(text) <= REPORT_MAX
+    listed = text.count('Строка ')
+    assert text.endswith(f'... и еще {len(errors) - listed}')
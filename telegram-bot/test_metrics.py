@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+import metrics
+from metrics import Counter, Gauge, Histogram, query_label
+
+
+@pytest.mark.parametrize('query, label', [
+    ("SELECT * FROM users WHERE telegram_id = %s", 'SELECT users'),
+    ("INSERT INTO order_responses (order_id, user_id) VALUES (%s, %s)", 'INSERT order_responses'),
+    ("DELETE FROM processed_updates WHERE processed_at < NOW()", 'DELETE processed_updates'),
+    ("UPDATE users SET inn = %s WHERE telegram_id = %s", 'UPDATE users'),
+    ('UPDATE "order_digests" SET message_id = %s WHERE order_id = %s', 'UPDATE order_digests'),
+    # Таблица после FROM у UPDATE - не та, что меняется
+    ("UPDATE broadcast_queue q SET status = 'closing' FROM orders o WHERE o.id = q.order_id", 'UPDATE broadcast_queue'),
+    # FOR UPDATE у SELECT не делает запрос записью
+    ("SELECT id FROM orders WHERE status = 'active' FOR UPDATE SKIP LOCKED", 'SELECT orders'),
+    ("INSERT INTO users (telegram_id) VALUES (%s) ON CONFLICT (telegram_id) DO UPDATE SET username = %s", 'INSERT users'),
+    ("WITH closed AS (\n    UPDATE orders SET status = 'closed'\n    RETURNING id\n)\nSELECT id FROM closed", 'UPDATE orders'),
+    ("SELECT 1", 'SELECT'),
+    ("VACUUM ANALYZE users", 'VACUUM'),
+    ("   ", 'EMPTY'),
+])
+def test_query_label(query, label):
+    assert query_label(query) == label
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    errors = Counter('bot_errors_total', 'Ошибки', ('handler',))
+    duration = Histogram('bot_duration_seconds', 'Время', ('handler',), buckets=(0.1, 1))
+    queue = Gauge('bot_queue', 'Очередь', collect=lambda: 3)
+    monkeypatch.setattr(metrics, 'REGISTRY', [errors, duration, queue])
+    monkeypatch.setattr(metrics, 'SOURCES', {})
+    return errors, duration
+
+
+def test_render(registry):
+    errors, duration = registry
+    errors.inc('start')
+    errors.inc('start', amount=2)
+    duration.observe(0.05, 'start')
+    duration.observe(0.5, 'start')
+    duration.observe(5, 'start')
+
+    assert metrics.render().splitlines() == [
+        '# HELP bot_errors_total Ошибки',
+        '# TYPE bot_errors_total counter',
+        'bot_errors_total{handler="start"} 3',
+        '# HELP bot_duration_seconds Время',
+        '# TYPE bot_duration_seconds histogram',
+        'bot_duration_seconds_bucket{handler="start",le="0.1"} 1',
+        'bot_duration_seconds_bucket{handler="start",le="1"} 2',
+        'bot_duration_seconds_bucket{handler="start",le="+Inf"} 3',
+        'bot_duration_seconds_sum{handler="start"} 5.55',
+        'bot_duration_seconds_count{handler="start"} 3',
+        '# HELP bot_queue Очередь',
+        '# TYPE bot_queue gauge',
+        'bot_queue 3',
+    ]
+
+
+def test_render_merges_worker_snapshots(registry):
+    errors, duration = registry
+    errors.inc('start')
+    duration.observe(0.5, 'start')
+    # Снимок обработчика приходит с пульсом в JSON
+    snapshot = json.loads(json.dumps(metrics.snapshot()))
+    metrics.register_source('worker', lambda: {0: snapshot, 1: []})
+    lines = metrics.render().splitlines()
+
+    # Одно семейство - один TYPE, иначе Prometheus отвергнет весь ответ
+    assert lines.count('# TYPE bot_errors_total counter') == 1
+    assert lines.count('# TYPE bot_duration_seconds histogram') == 1
+    assert 'bot_errors_total{handler="start"} 1' in lines
+    assert 'bot_errors_total{worker="0",handler="start"} 1' in lines
+    assert 'bot_duration_seconds_bucket{worker="0",handler="start",le="1"} 1' in lines
+    assert 'bot_queue{worker="0"} 3' in lines
+    assert not any('worker="1"' in line for line in lines)
@@ -0,0 +1,44 @@
+import asyncio
+from types import SimpleNamespace
+
+import middlewares
+from middlewares import ThrottlingMiddleware
+
+
+def test_token_bucket(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(middlewares.time, 'monotonic', lambda: now[0])
+    throttling = ThrottlingMiddleware(rate=2, burst=3, idle_ttl=600)
+    assert [throttling.allow(1) for _ in range(4)] == [True, True, True, False]
+    # У другого пользователя свой бакет
+    assert throttling.allow(2)
+    now[0] += 0.5
+    assert throttling.allow(1)
+    assert not throttling.allow(1)
+
+
+def test_dropped_callback_is_answered_and_toggles_pass():
+    class FakeCallback(middlewares.CallbackQuery):
+        async def answer(self, *args, **kwargs):
+            answered.append(self.data)
+
+    answered, handled = [], []
+
+    async def handler(event, data):
+        handled.append(event.data)
+
+    def callback(data):
+        return FakeCallback.model_construct(id='1', data=data, chat_instance='1')
+
+    async def scenario():
+        throttling = ThrottlingMiddleware(rate=0.001, burst=1)
+        data = {'event_from_user': SimpleNamespace(id=1)}
+        await throttling(handler, callback('profile'), data)
+        await throttling(handler, callback('profile'), data)
+        await throttling(handler, callback('toggle_Грузчик'), data)
+        return throttling
+
+    throttling = asyncio.run(scenario())
+    assert handled == ['profile', 'toggle_Грузчик']
+    assert answered == ['profile']
+    assert throttling.dropped == 1
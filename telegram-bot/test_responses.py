@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import pytest
+
+from responses import ResponseBuffer
+
+
+class SlowDatabase:
+    def __init__(self, delay):
+        self.delay = delay
+        self.rows = []
+
+    async def insert_responses(self, pairs):
+        await asyncio.sleep(self.delay)
+        self.rows.extend(pairs)
+        return [{'order_id': order_id, 'user_id': user_id} for order_id, user_id in pairs]
+
+
+class FakeDigest:
+    def __init__(self):
+        self.orders = []
+
+    def add(self, order_id):
+        self.orders.append(order_id)
+
+
+def test_stop_writes_responses_added_during_flush():
+    async def scenario():
+        db, digest = SlowDatabase(0.2), FakeDigest()
+        buffer = ResponseBuffer(db, flush_interval=0.05, batch_size=1000, digest=digest)
+        buffer.start()
+        buffer.add(1, 10)
+        buffer.add(1, 10)
+        await asyncio.sleep(0.1)
+        buffer.add(2, 20)
+        await buffer.stop(timeout=2)
+        return db, digest
+
+    db, digest = asyncio.run(scenario())
+    assert sorted(db.rows) == [(1, 10), (2, 20)]
+    assert sorted(digest.orders) == [1, 2]
+
+
+def test_stop_keeps_one_deadline():
+    async def scenario():
+        buffer = ResponseBuffer(SlowDatabase(10), flush_interval=0.05, batch_size=1000)
+        buffer.start()
+        buffer.add(1, 10)
+        await asyncio.sleep(0.1)
+        started = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await buffer.stop(timeout=0.5)
+        return buffer, time.monotonic() - started
+
+    buffer, elapsed = asyncio.run(scenario())
+    assert elapsed < 0.8
+    # Незаписанное не теряется, а остается в буфере
+    assert buffer._pending == {(1, 10)}
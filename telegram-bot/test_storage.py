@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+
+from storage import PostgresStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+class FakeDatabase:
+    """fsm_states в словаре: key -> (state, data)"""
+
+    def __init__(self):
+        self.rows = {}
+
+    async def fetchone(self, query, params=None, retry=False):
+        row = self.rows.get(params[0])
+        return {'state': row[0], 'data': row[1]} if row else None
+
+    async def executemany(self, query, params_seq, retry=False):
+        for params in params_seq:
+            if query.startswith('DELETE'):
+                self.rows.pop(params[0], None)
+            else:
+                self.rows[params[0]] = (params[1], params[2].obj)
+
+    async def execute(self, query, params=None, retry=False):
+        return 0
+
+
+def test_state_survives_restart():
+    async def scenario():
+        db = FakeDatabase()
+        storage = PostgresStorage(db)
+        await storage.set_state(KEY, 'Registration:phone')
+        await storage.set_data(KEY, {'fio': 'Иванов Иван'})
+        await storage.close()
+
+        restarted = PostgresStorage(db)
+        assert await restarted.get_state(KEY) == 'Registration:phone'
+        assert await restarted.get_data(KEY) == {'fio': 'Иванов Иван'}
+
+    asyncio.run(scenario())
+
+
+def test_clean_cache_entry_is_reread_after_cache_ttl():
+    async def scenario():
+        db = FakeDatabase()
+        first = PostgresStorage(db, cache_ttl=0.05)
+        second = PostgresStorage(db, cache_ttl=0.05)
+        await first.set_state(KEY, 'Registration:phone')
+        await first.flush()
+        assert await second.get_state(KEY) == 'Registration:phone'
+
+        # Пользователь переехал на другой процесс и прошел шаг там
+        await first.set_state(KEY, 'Registration:terms')
+        await first.flush()
+        assert await second.get_state(KEY) == 'Registration:phone'
+        time.sleep(0.06)
+        assert await second.get_state(KEY) == 'Registration:terms'
+
+    asyncio.run(scenario())
+
+
+def test_unflushed_change_is_not_replaced_by_database():
+    async def scenario():
+        db = FakeDatabase()
+        storage = PostgresStorage(db, cache_ttl=0)
+        await storage.set_state(KEY, 'Registration:rules')
+        db.rows[storage.key_builder.build(KEY)] = ('Registration:fio', {})
+        assert await storage.get_state(KEY) == 'Registration:rules'
+        await storage.close()
+        assert db.rows[storage.key_builder.build(KEY)][0] == 'Registration:rules'
+
+    asyncio.run(scenario())
@@ -0,0 +1,46 @@
+import pytest
+
+import bench_ui
+import ui
+
+PHONES = [
+    '+79991234567', '89991234567', '8 (999) 123-45-67', '+7 999 123 45 67', '9991234567',
+    '+7999123456', '+799912345678', '8-800-555-35-35', '', 'телефон', '+8 999 123 45 67', '77991234567',
+]
+DATES = [
+    '01.02.1990', '1.2.1990', ' 31.12.2000 ', '29.02.2000', '29.02.2001', '31.04.2020', '00.01.2000',
+    '01.13.2000', '2000-01-01', '01.02.90', '01.02.19900', '', '01/02/1990',
+]
+
+
+@pytest.mark.parametrize('phone', PHONES)
+def test_normalize_phone_matches_legacy(phone):
+    expected = bench_ui.legacy_format_phone(phone) if bench_ui.legacy_validate_phone(phone) else None
+    assert ui.normalize_phone(phone) == expected
+
+
+@pytest.mark.parametrize('value', DATES)
+def test_validate_date_matches_legacy(value):
+    assert ui.validate_date(value) == bench_ui.legacy_validate_date(value)
+
+
+@pytest.mark.parametrize('selected', bench_ui.SELECTIONS)
+def test_work_type_keyboard_matches_legacy(selected):
+    assert ui.get_work_type_keyboard(selected) == bench_ui.legacy_work_type_keyboard(selected)
+
+
+@pytest.mark.parametrize('show_back, show_cancel', [(True, True), (True, False), (False, True), (False, False)])
+def test_navigation_keyboard_matches_legacy(show_back, show_cancel):
+    assert ui.get_navigation_keyboard(show_back, show_cancel) == bench_ui.legacy_navigation_keyboard(show_back, show_cancel)
+
+
+@pytest.mark.parametrize('text, expected', [('0', 0), (' 12 ', 12), ('500', 500), ('501', None), ('-1', None), ('', None)])
+def test_parse_capacity(text, expected):
+    assert ui.parse_capacity(text) == expected
+
+
+def test_fixed_length_fields():
+    assert ui.validate_inn('123456789012') and not ui.validate_inn('12345678901')
+    assert ui.validate_account('1' * 20) and not ui.validate_account('1' * 19 + 'a')
+    assert ui.validate_passport(' 1234567890 ') and not ui.validate_passport('1234 567890')
+    assert ui.validate_fio('Иванов Иван Иванович') and not ui.validate_fio('Иванов Иван')
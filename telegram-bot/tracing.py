@@ -0,0 +1,306 @@
+"""
+Трассировка апдейтов и JSON-логи.
+
+Каждый апдейт получает trace_id; обработчик, запросы к базе и вызовы
+Bot API внутри него записываются как вложенные спаны. Апдейт дольше
+TRACE_SLOW_THRESHOLD или с ошибкой пишется в лог целиком, остальные -
+с вероятностью TRACE_SAMPLE_RATE. Тексты сообщений в трассу не попадают
+(там паспорт и ИНН), только шаг регистрации, обработчик и данные кнопки.
+
+Логи уходят в очередь и пишутся в stdout отдельным потоком, так что
+медленный вывод не тормозит event loop; при переполнении очереди запись
+пропускается и считается в dropped.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject, Update
+
+from config import (
+    LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE,
+    TRACE_SLOW_THRESHOLD, TRACE_SAMPLE_RATE, TRACE_MAX_SPANS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Трасса и спан текущего апдейта; задачи, созданные обработчиком, наследуют их
+current_trace: ContextVar[Optional['Trace']] = ContextVar('current_trace', default=None)
+current_span: ContextVar[Optional[str]] = ContextVar('current_span', default=None)
+
+
+def _new_id(bits: int = 64) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+# ===== ТРАССИРОВКА =====
+class Span:
+    __slots__ = ('id', 'parent', 'name', 'start', 'end', 'attrs', 'error')
+
+    def __init__(self, name: str, parent: Optional[str], attrs: dict):
+        self.id = _new_id(32)
+        self.parent = parent
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.attrs = attrs
+        self.error = None
+
+
+class Trace:
+    def __init__(self, update: Update, max_spans=TRACE_MAX_SPANS):
+        self.id = _new_id()
+        self.root = _new_id(32)
+        self.update_id = update.update_id
+        try:
+            self.type = update.event_type
+        except LookupError:
+            self.type = 'unknown'
+        self.max_spans = max_spans
+        self.start = time.perf_counter()
+        self.end = None
+        self.user_id = None
+        self.state = None
+        self.handler = None
+        self.data = None
+        self.error = None
+        self.spans = []
+        self.dropped_spans = 0
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def add_span(self, name: str, attrs: dict) -> Optional[Span]:
+        # Закрытая трасса не растет: ее могла унаследовать фоновая задача обработчика
+        if self.end is not None:
+            return None
+        if len(self.spans) >= self.max_spans:
+            self.dropped_spans += 1
+            return None
+        record = Span(name, current_span.get() or self.root, attrs)
+        self.spans.append(record)
+        return record
+
+    def to_dict(self) -> dict:
+        def ms(seconds):
+            return round(seconds * 1000, 2)
+
+        spans = []
+        for record in self.spans:
+            item = {
+                'span_id': record.id, 'parent_id': record.parent, 'name': record.name,
+                'start_ms': ms(record.start - self.start),
+                'duration_ms': ms(record.end - record.start) if record.end is not None else None,
+            }
+            item.update(record.attrs)
+            if record.error:
+                item['error'] = record.error
+            spans.append(item)
+        result = {
+            'trace_id': self.id, 'span_id': self.root, 'update_id': self.update_id, 'type': self.type,
+            'user_id': self.user_id, 'state': self.state, 'handler': self.handler, 'data': self.data,
+            'duration_ms': ms(self.duration), 'error': self.error, 'spans': spans,
+        }
+        if self.dropped_spans:
+            result['dropped_spans'] = self.dropped_spans
+        return result
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Спан внутри текущего апдейта; вне апдейта (фоновые службы) ничего не пишет"""
+    trace = current_trace.get()
+    record = trace.add_span(name, attrs) if trace is not None else None
+    if record is None:
+        yield None
+        return
+    token = current_span.set(record.id)
+    try:
+        yield record
+    except BaseException as e:
+        record.error = type(e).__name__
+        raise
+    finally:
+        current_span.reset(token)
+        record.end = time.perf_counter()
+
+
+class TracingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware на dp.update: открывает трассу апдейта и решает,
+    писать ли ее в лог. Регистрируется первым, чтобы в трассу попали и
+    отсечение повторов, и антиспам.
+    """
+
+    def __init__(self, slow_threshold=TRACE_SLOW_THRESHOLD, sample_rate=TRACE_SAMPLE_RATE):
+        self.slow_threshold = slow_threshold
+        self.sample_rate = sample_rate
+        self.slow = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        trace = Trace(event)
+        user = data.get('event_from_user')
+        trace.user_id = user.id if user else None
+        token = current_trace.set(trace)
+        try:
+            return await handler(event, data)
+        except BaseException as e:
+            trace.error = type(e).__name__
+            raise
+        finally:
+            current_trace.reset(token)
+            trace.end = time.perf_counter()
+            self._emit(trace)
+
+    def _emit(self, trace: Trace):
+        duration = trace.duration
+        if duration >= self.slow_threshold:
+            self.slow += 1
+            logger.warning("Медленный апдейт %s: %.0f мс", trace.update_id, duration * 1000,
+                           extra={'trace': trace.to_dict()})
+        elif trace.error:
+            logger.warning("Апдейт %s с ошибкой %s", trace.update_id, trace.error, extra={'trace': trace.to_dict()})
+        elif random.random() < self.sample_rate:
+            logger.info("Апдейт %s: %.0f мс", trace.update_id, duration * 1000, extra={'trace': trace.to_dict()})
+
+
+class HandlerSpanMiddleware(BaseMiddleware):
+    """Внутренний middleware: спан выбранного обработчика и шаг FSM, на котором он вызван"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        trace = current_trace.get()
+        if trace is None:
+            return await handler(event, data)
+        handler_object = data.get('handler')
+        trace.handler = handler_object.callback.__name__ if handler_object else 'unknown'
+        trace.state = data.get('raw_state')
+        # Данные кнопки и команда безопасны для лога, произвольный текст - нет
+        callback_data = getattr(event, 'data', None)
+        text = getattr(event, 'text', None)
+        if isinstance(callback_data, str):
+            trace.data = callback_data
+        elif text and text.startswith('/'):
+            trace.data = text.split(None, 1)[0]
+        with span('handler', handler=trace.handler):
+            return await handler(event, data)
+
+
+class ApiTracingMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: спан вызова Bot API. Регистрируется раньше
+    OutboundDispatcher, поэтому включает ожидание в очереди исходящих.
+    """
+
+    async def __call__(self, make_request, bot, method):
+        with span('api', method=type(method).__name__):
+            return await make_request(bot, method)
+
+
+# ===== ЛОГИ =====
+# Поля LogRecord, которые не относятся к extra
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON; поля из extra добавляются как есть"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Формат для локального запуска (LOG_FORMAT=text): трасса дописывается к строке"""
+
+    def __init__(self):
+        super().__init__('%(levelname)s:%(name)s:%(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        trace = getattr(record, 'trace', None)
+        return f"{line} {json.dumps(trace, ensure_ascii=False)}" if trace else line
+
+
+class TraceContextFilter(logging.Filter):
+    """Записи из обработчика апдейта получают его trace_id"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = current_trace.get()
+        if trace is not None and not hasattr(record, 'trace_id'):
+            record.trace_id = trace.id
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который при полной очереди пропускает запись, а не ждет"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение и трейсбек собираются здесь: аргументы и exc_info в другой поток не передаем
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, queue_size=LOG_QUEUE_SIZE) -> NonBlockingQueueHandler:
+    """Корневой логгер пишет через очередь; поток записи останавливается при выходе с дозаписью очереди"""
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+    handler.addFilter(TraceContextFilter())
+    listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    return handler
@@ -0,0 +1,203 @@
+"""
+Каталог интерфейса: тексты, клавиатуры и валидаторы.
+
+Все неизменяемые клавиатуры собираются один раз при импорте, варианты
+выбора видов работ (2^n наборов) кэшируются, регулярные выражения
+скомпилированы заранее. Обработчики берут готовые объекты и ничего не
+создают на каждом апдейте. Замер выигрыша: python bench_ui.py
+"""
+import re
+from datetime import date
+from functools import lru_cache
+from typing import Optional
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+WORK_TYPES = ("Хелпер", "Грузчик", "Монтажник")
+
+# ===== ТЕКСТЫ =====
+TERMS_TEXT = 'Я согласен с <a href="https://example.com/terms">условиями обработки данных</a>'
+TERMS_REQUIRED_TEXT = 'Для продолжения необходимо согласие. ' + TERMS_TEXT
+RULES_TEXT = 'Я согласен с <a href="https://example.com/rules">правилами использования сервиса</a>'
+RULES_REQUIRED_TEXT = 'Для продолжения необходимо принять правила. ' + RULES_TEXT
+
+# ===== КНОПКИ =====
+BACK_BUTTON = InlineKeyboardButton(text="Назад", callback_data="back")
+CANCEL_BUTTON = InlineKeyboardButton(text="Отмена", callback_data="cancel")
+MAIN_MENU_BUTTON = InlineKeyboardButton(text="Главное меню", callback_data="main_menu")
+
+# ===== СТАТИЧЕСКИЕ КЛАВИАТУРЫ =====
+MAIN_MENU_KEYBOARD = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="Мой профиль", callback_data="profile")],
+        [InlineKeyboardButton(text="Завершить регистрацию", callback_data="complete_reg")],
+        [InlineKeyboardButton(text="Активные заявки", callback_data="active_orders")]
+    ]
+)
+
+COMPLETE_REGISTRATION_KEYBOARD = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="Дата рождения", callback_data="set_birth_date")],
+        [InlineKeyboardButton(text="ИНН", callback_data="set_inn")],
+        [InlineKeyboardButton(text="Расчетный счет", callback_data="set_account")],
+        [InlineKeyboardButton(text="Паспорт", callback_data="set_passport")],
+        [MAIN_MENU_BUTTON]
+    ]
+)
+
+IMPORT_NOTIFY_KEYBOARD = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="📢 Разослать", callback_data="import_notify")],
+        [InlineKeyboardButton(text="Без рассылки", callback_data="import_skip")]
+    ]
+)
+
+_AGREEMENT_BUTTONS = [
+    InlineKeyboardButton(text="Согласен", callback_data="agree"),
+    InlineKeyboardButton(text="Не согласен", callback_data="disagree")
+]
+_AGREEMENT_KEYBOARDS = {
+    True: InlineKeyboardMarkup(inline_keyboard=[[BACK_BUTTON, *_AGREEMENT_BUTTONS]]),
+    False: InlineKeyboardMarkup(inline_keyboard=[_AGREEMENT_BUTTONS]),
+}
+
+_NAVIGATION_KEYBOARDS = {
+    (True, True): InlineKeyboardMarkup(inline_keyboard=[[BACK_BUTTON, CANCEL_BUTTON]]),
+    (True, False): InlineKeyboardMarkup(inline_keyboard=[[BACK_BUTTON]]),
+    (False, True): InlineKeyboardMarkup(inline_keyboard=[[CANCEL_BUTTON]]),
+    (False, False): None,
+}
+
+
+def get_agreement_keyboard(show_back=True):
+    return _AGREEMENT_KEYBOARDS[bool(show_back)]
+
+
+def get_navigation_keyboard(show_back=True, show_cancel=True):
+    return _NAVIGATION_KEYBOARDS[bool(show_back), bool(show_cancel)]
+
+
+# ===== ВЫБОР ВИДОВ РАБОТ =====
+@lru_cache(maxsize=None)
+def _work_type_keyboard(selected: frozenset, prefix: str, footer: tuple) -> InlineKeyboardMarkup:
+    keyboard = [
+        [InlineKeyboardButton(
+            text=f"{'✅' if work in selected else '❌'} {work}",
+            callback_data=f"{prefix}{work}"
+        )]
+        for work in WORK_TYPES
+    ]
+    keyboard.extend(list(row) for row in footer)
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+_WORK_TYPE_FOOTER = (
+    (InlineKeyboardButton(text="Подтвердить выбор", callback_data="confirm_works"),),
+    (BACK_BUTTON, CANCEL_BUTTON),
+)
+_ORDER_WORK_TYPE_FOOTER = (
+    (InlineKeyboardButton(text="Создать заявку", callback_data="order_confirm"),),
+    (InlineKeyboardButton(text="Отмена", callback_data="order_cancel"),),
+)
+
+
+def get_work_type_keyboard(selected_works=None):
+    return _work_type_keyboard(frozenset(selected_works or ()), "toggle_", _WORK_TYPE_FOOTER)
+
+
+def get_order_work_type_keyboard(selected_works=None):
+    return _work_type_keyboard(frozenset(selected_works or ()), "order_toggle_", _ORDER_WORK_TYPE_FOOTER)
+
+
+# ===== ЗАЯВКИ =====
+@lru_cache(maxsize=4096)
+def get_respond_keyboard(order_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="Откликнуться", callback_data=f"respond:{order_id}")]]
+    )
+
+
+def get_orders_page_keyboard(orders, has_prev, has_next):
+    # В callback_data лежит ключ крайней заявки страницы: orders:<направление>:<created_at>:<id>
+    nav = []
+    if has_prev:
+        first = orders[0]
+        nav.append(InlineKeyboardButton(
+            text="◀️ Новее",
+            callback_data=f"orders:p:{first['created_at'].isoformat()}:{first['id']}"
+        ))
+    if has_next:
+        last = orders[-1]
+        nav.append(InlineKeyboardButton(
+            text="Старше ▶️",
+            callback_data=f"orders:n:{last['created_at'].isoformat()}:{last['id']}"
+        ))
+    keyboard = [
+        [InlineKeyboardButton(text=f"Откликнуться на #{order['id']}", callback_data=f"respond:{order['id']}")]
+        for order in orders
+    ]
+    if nav:
+        keyboard.append(nav)
+    keyboard.append([MAIN_MENU_BUTTON])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+# ===== ВАЛИДАТОРЫ =====
+_PHONE_JUNK_RE = re.compile(r'[^\d+]')
+_PHONE_RE = re.compile(r'\+7\d{10}')
+_DATE_RE = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})')
+
+
+def validate_fio(fio):
+    parts = fio.split()
+    if len(parts) != 3:
+        return False
+    return all(len(part) >= 2 and part.isalpha() for part in parts)
+
+
+def normalize_phone(phone) -> Optional[str]:
+    """Номер в формате +7XXXXXXXXXX или None, если он неверный (проверка и форматирование за один проход)"""
+    phone_clean = _PHONE_JUNK_RE.sub('', phone)
+    if phone_clean.startswith('8'):
+        phone_clean = '+7' + phone_clean[1:]
+    return phone_clean if _PHONE_RE.fullmatch(phone_clean) else None
+
+
+def validate_date(date_str):
+    match = _DATE_RE.fullmatch(date_str.strip())
+    if not match:
+        return False
+    day, month, year = map(int, match.groups())
+    try:
+        date(year, month, day)
+    except ValueError:
+        return False
+    return True
+
+
+ORDER_CAPACITY_MAX = 500
+
+
+def parse_capacity(text) -> Optional[int]:
+    """Число исполнителей на заявку: 0 - без ограничения, None - неверный ввод"""
+    text = text.strip()
+    if not text.isdigit() or int(text) > ORDER_CAPACITY_MAX:
+        return None
+    return int(text)
+
+
+def _digits(value, length):
+    value = value.strip()
+    return len(value) == length and value.isdigit()
+
+
+def validate_inn(inn):
+    return _digits(inn, 12)
+
+
+def validate_account(account):
+    return _digits(account, 20)
+
+
+def validate_passport(passport):
+    return _digits(passport, 10)
@@ -0,0 +1,133 @@
+import asyncio
+import hmac
+import logging
+from typing import List, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+
+from config import (
+    WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+    UPDATE_WORKERS, UPDATE_QUEUE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_POLL_DELAY = 30
+
+
+def get_routing_id(update: Update) -> int:
+    """Чат (или пользователь) обновления: все его апдейты обрабатываются по порядку"""
+    context = UserContextMiddleware.resolve_event_context(update)
+    return context.chat_id or context.user_id or 0
+
+
+class UpdateProcessor:
+    """
+    Ограниченный пул воркеров для обработки обновлений.
+
+    У каждого воркера своя очередь, чат закрепляется за воркером по
+    chat_id % workers: сообщения одного пользователя идут строго по порядку,
+    разные пользователи обрабатываются параллельно. Очереди ограничены,
+    поэтому при перегрузке put() притормаживает прием, а не копит память.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, workers=UPDATE_WORKERS, queue_size=UPDATE_QUEUE_SIZE):
+        self.dp = dp
+        self.bot = bot
+        self.queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.tasks: List[asyncio.Task] = []
+        # Принимает ли новые апдейты: до start() и после начала stop() вебхук отвечает 503
+        self.accepting = False
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._worker(queue)) for queue in self.queues]
+        self.accepting = True
+
+    async def put(self, update: Update):
+        queue = self.queues[get_routing_id(update) % len(self.queues)]
+        await queue.put(update)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.exception("Ошибка обработки обновления %s: %s", update.update_id, e)
+            finally:
+                queue.task_done()
+
+    async def stop(self, timeout: Optional[float] = None):
+        # Дожидаемся уже принятых обновлений, затем гасим воркеров
+        self.accepting = False
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self.queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Не все обновления обработаны до остановки")
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+
+def setup_webhook_routes(app: web.Application, bot: Bot, processor: UpdateProcessor):
+    async def handle_update(request: web.Request) -> web.Response:
+        # Telegram присылает секрет, заданный в set_webhook
+        token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if WEBHOOK_SECRET and not hmac.compare_digest(token, WEBHOOK_SECRET):
+            return web.Response(status=401)
+        # Прогрев или остановка: Telegram повторит апдейт позже, уже новому экземпляру
+        if not processor.accepting:
+            return web.Response(status=503)
+
+        update = Update.model_validate(await request.json(), context={"bot": bot})
+        await processor.put(update)
+        # Отвечаем сразу: обработка идет в воркерах
+        return web.Response()
+
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+
+
+async def start_http_server(app: web.Application) -> web.AppRunner:
+    """HTTP-сервер бота на WEBAPP_HOST:WEBAPP_PORT (вебхук, /metrics)"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+    return runner
+
+
+async def poll_updates(bot: Bot, processor, allowed_updates: Optional[List[str]] = None):
+    """
+    Long polling в processor.put(). При отмене подтверждает Telegram
+    последний принятый апдейт, чтобы после рестарта он не пришел снова.
+    """
+    await bot.delete_webhook()
+    offset = None
+    delay = 1
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=30, allowed_updates=allowed_updates, request_timeout=40
+                )
+            except Exception as e:
+                logger.warning("Ошибка получения апдейтов: %s, повтор через %s с", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_POLL_DELAY)
+                continue
+            delay = 1
+            for update in updates:
+                await processor.put(update)
+                offset = update.update_id + 1
+    finally:
+        if offset is not None:
+            try:
+                await bot.get_updates(offset=offset, timeout=0, limit=1, request_timeout=5)
+            except Exception as e:
+                logger.warning("Не удалось подтвердить апдейты перед остановкой: %s", e)